@@ -12,6 +12,7 @@ LOG_TYPE_CHOICES = [
 SOURCE_CHOICES = [
     ("self", "کارمند"),
     ("manager", "مدیر"),
+    ("import", "درون‌ریزی"),
 ]
 
 # ثبت هر ورود و خروج
@@ -20,6 +21,15 @@ class AttendanceLog(models.Model):
     timestamp = models.DateTimeField(default=timezone.now)
     log_type = models.CharField(max_length=4, choices=LOG_TYPE_CHOICES, default="in")
     source = models.CharField(max_length=7, choices=SOURCE_CHOICES, default="self")
+    device = models.ForeignKey(
+        "core.Device",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="logs",
+    )
+    # شناسه ضبط آفلاین کیوسک تا ارسال دوباره صف، تردد تکراری نسازد
+    capture_id = models.CharField(max_length=64, unique=True, null=True, blank=True)
 
     def __str__(self):
         return f"{self.user.username} - {self.timestamp:%Y-%m-%d %H:%M:%S}"
@@ -176,3 +186,40 @@ class LeaveType(models.Model):
 
     def __str__(self):
         return self.name
+
+# خلاصه حضور هر کاربر در هر روز؛ با ثبت تردد، مرخصی و تغییر شیفت به‌روز می‌شود
+class DailyAttendance(models.Model):
+
+    STATUS_CHOICES = [
+        ("present", "حاضر"),
+        ("absent", "غایب"),
+        ("leave", "مرخصی"),
+        ("holiday", "تعطیل"),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="daily_attendance"
+    )
+    date = models.DateField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    # ترددهای روز تقویمی
+    punches = models.PositiveSmallIntegerField(default=0)
+    first_punch = models.DateTimeField(null=True, blank=True)
+    first_in = models.DateTimeField(null=True, blank=True)
+    last_out = models.DateTimeField(null=True, blank=True)
+    # کارکرد در بازه شیفت (دقیقه)
+    present_minutes = models.PositiveIntegerField(default=0)
+    mandatory_minutes = models.PositiveIntegerField(default=0)
+    tardy_minutes = models.PositiveIntegerField(default=0)
+    overtime_minutes = models.PositiveIntegerField(default=0)
+    incomplete = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "date"], name="unique_user_day")
+        ]
+        indexes = [models.Index(fields=["date", "status"])]
+
+    def __str__(self):
+        return f"{self.user_id} {self.date} {self.status}"
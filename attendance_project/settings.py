@@ -84,3 +84,116 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_URL = '/management/login/'
 LOGIN_REDIRECT_URL = '/management/face-check/'
 LOGOUT_REDIRECT_URL = '/'
+
+# هر چند ثانیه ایندکس چهره از پایگاه داده بازسازی شود
+FACE_INDEX_REFRESH_SECONDS = 60
+
+# موتور جستجوی چهره: "exact"، "int8" (پیمایش اول کوانتیزه و رتبه‌بندی دوباره float32) یا "ivf" برای گالری‌های بسیار بزرگ
+FACE_INDEX_ENGINE = "exact"
+# حداقل تعداد چهره برای فعال شدن IVF
+FACE_IVF_MIN_SIZE = 20000
+# تعداد خوشه‌ها (None یعنی جذر تعداد چهره‌ها)
+FACE_IVF_NLIST = None
+# تعداد خوشه‌های بررسی‌شده در هر جستجو؛ عدد بزرگ‌تر یعنی دقت بیشتر و تأخیر بیشتر
+FACE_IVF_NPROBE = 8
+# بررسی خوشه‌های باقی‌مانده با نامساوی مثلث تا تصمیم با جستجوی کامل یکسان بماند
+FACE_IVF_GUARD = True
+# تعداد کاندیدهایی که با فاصله دقیق دوباره مقایسه می‌شوند
+FACE_INDEX_RERANK = 16
+
+# تعداد رشته‌های مشترک برای استخراج هم‌زمان بردار فریم‌ها
+FACE_ENCODE_WORKERS = 4
+
+# مسیر سوکت سرویس استنتاج چهره (manage.py face_inference_server)؛ None یعنی استنتاج درون همین فرایند
+FACE_INFERENCE_SOCKET = None
+# مهلت پاسخ سرویس استنتاج به ثانیه
+FACE_INFERENCE_TIMEOUT = 10
+# تعداد فرایندهای کارگر سرویس استنتاج
+FACE_INFERENCE_WORKERS = 2
+
+# حالت آبشاری: ابتدا استخراج سریع و فقط در نتایج مرزی استخراج کامل
+FACE_CASCADE_ENABLED = False
+# فاصله از آستانه‌ها که نتیجه سطح سریع مرزی حساب می‌شود
+FACE_CASCADE_MARGIN = 0.06
+
+# مسیر سریع: رمزگشایی با وضوح کمتر، تشخیص روی نسخه کوچک و استخراج فقط روی کادر چهره
+FACE_FAST_FRONTEND = False
+# بیشینه ضلع تصویر پس از رمزگشایی سریع JPEG
+FACE_DECODE_MAX_SIDE = 640
+# بیشینه ضلع نسخه کوچک‌شده برای تشخیص چهره
+FACE_DETECT_MAX_SIDE = 320
+# آشکارساز چهره: "hog" یا "cascade" (OpenCV)
+FACE_DETECTOR = "hog"
+# تعداد دفعات بزرگ‌نمایی تصویر در آشکارساز HOG
+FACE_DETECT_UPSAMPLE = 0
+
+# فریم‌های چهره در multipart مستقیم در حافظه دریافت می‌شوند
+FILE_UPLOAD_HANDLERS = [
+    'core.uploads.FaceFrameUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+# بیشینه حجم هر فریم چهره آپلودشده
+FACE_UPLOAD_MAX_BYTES = 2 * 1024 * 1024
+
+# استفاده از کادر چهره ارسالی کیوسک به جای تشخیص دوباره روی سرور
+FACE_TRUST_CLIENT_BOX = False
+
+# حافظه نهان بردار چهره بر اساس هش تصویر (۰ یعنی غیرفعال)
+FACE_ENCODING_CACHE_SIZE = 256
+# مدت اعتبار هر بردار در حافظه نهان به ثانیه
+FACE_ENCODING_CACHE_TTL = 30
+
+# دسته‌بندی درخواست‌های هم‌زمان چهره برای استخراج و جستجوی یکجا
+FACE_BATCH_ENABLED = False
+# بیشینه تعداد درخواست در هر دسته
+FACE_BATCH_MAX_SIZE = 16
+# بیشینه انتظار برای تکمیل دسته به میلی‌ثانیه
+FACE_BATCH_MAX_WAIT_MS = 5
+
+# بیشینه تعداد کارهای پس‌زمینه (ذخیره تصویر مشکوک، آموزش دوباره) در صف
+FACE_BACKGROUND_QUEUE_SIZE = 100
+
+# استفاده از نسخه async اندپوینت‌های کیوسک و وضعیت (برای اجرا با سرور ASGI)
+FACE_ASYNC_VIEWS = False
+# تعداد رشته‌های اجرای پردازش چهره در نسخه async
+FACE_ASYNC_WORKERS = 8
+
+# بیشینه تعداد الگوی چهره برای هر کاربر
+FACE_GALLERY_SIZE = 5
+# بیشینه فریم اضافه پذیرفته‌شده در هر نوبت ثبت چهره
+FACE_ENROLL_MAX_FRAMES = 8
+
+# برچسب مدل بردارهای فعال و تنظیمات استخراج هر نسخه؛ بردار لحظه‌ای کیوسک و reencode_faces
+# هر دو از همین ثبت می‌خوانند. نسخه تازه: افزودن به FACE_EMBEDDING_MODELS، اجرای
+# reencode_faces --model و سپس تغییر FACE_EMBEDDING_MODEL و reencode_faces --cutover
+FACE_EMBEDDING_MODEL = "dlib-large-j5"
+FACE_EMBEDDING_MODELS = {
+    "dlib-large-j5": {"num_jitters": 5, "model": "large"},
+}
+
+# هدر Server-Timing روی اندپوینت‌های چهره و اندازه پنجره زمان‌های نگه‌داشته‌شده برای هر مرحله
+FACE_SERVER_TIMING = True
+FACE_TIMING_WINDOW = 500
+
+# بازه نوشتن ضربان دستگاه در پایگاه داده و اعتبار مقدار نهان فعال بودن دستگاه (ثانیه)؛
+# مقدار نهان در هر فرایند جداست، پس غیرفعال‌سازی، حذف دستگاه یا توکن تازه در فرایندهای دیگر
+# حداکثر تا DEVICE_ACTIVE_CACHE_SECONDS دیرتر اعمال می‌شود (کوتاه نگه دارید)
+DEVICE_HEARTBEAT_FLUSH_SECONDS = 20
+DEVICE_ACTIVE_CACHE_SECONDS = 30
+
+# زنده‌سنجی جریانی کیوسک (فریم‌های پیاپی به جای دو فریم با مکث ثابت)؛ وضعیت جریان‌ها در
+# حافظه نهان FACE_STREAM_CACHE است و باید بین فرایندها مشترک باشد (Redis، Memcached یا پایگاه داده).
+# با LocMemCache (پیش‌فرض جنگو) جریانی فعال نمی‌شود مگر FACE_STREAM_SINGLE_PROCESS برای اجرای تک‌فرایندی
+FACE_STREAM_ENABLED = False
+FACE_STREAM_CACHE = "default"
+FACE_STREAM_SINGLE_PROCESS = False
+FACE_STREAM_TTL_SECONDS = 8
+FACE_STREAM_MAX_FRAMES = 20
+
+# صف آفلاین کیوسک: بیشترین ضبط در هر ارسال دسته‌ای و بیشترین عمر ضبط (ساعت) برای پذیرش
+FACE_BATCH_MAX_CAPTURES = 20
+FACE_OFFLINE_MAX_AGE_HOURS = 72
+
+# درون‌ریزی تردد: تعداد ردیف در هر تراکنش درج دسته‌ای
+LOG_IMPORT_CHUNK_SIZE = 5000
@@ -0,0 +1,220 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user, get_user_model
+from django.contrib.auth.views import redirect_to_login
+from django.http import HttpResponseNotAllowed, JsonResponse
+from django.urls import reverse
+
+from attendance.models import AttendanceLog, WeeklyHoliday
+
+from . import daily_attendance
+from .face_timing import face_timed, timed
+from .heartbeat import DEFAULT_DEVICE_ID, heartbeat
+from .views import (
+    DEVICE_FACE_ERRORS,
+    DUPLICATE_TAP_WINDOW,
+    INVALID_DEVICE_TOKEN,
+    STREAM_DISABLED,
+    UNKNOWN_DEVICE,
+    _day_status_ids,
+    _now,
+    _save_suspicious_log,
+    _status_entry,
+    _status_target_date,
+    _stream_enabled,
+    _to_naive,
+    _verified_payload,
+    _weekday_index,
+    face,
+    face_registry,
+    face_stream,
+)
+
+User = get_user_model()
+
+# اجرای کارهای پردازنده‌محور (خواندن فریم، استخراج بردار) بیرون از حلقه رویداد
+_cpu_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "FACE_ASYNC_WORKERS", 8),
+    thread_name_prefix="face-async",
+)
+
+async def _run_cpu(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_cpu_executor, partial(fn, *args))
+
+# معادل async دکوراتورهای require_POST، login_required، staff_required و device_required
+# (دکوراتورهای جنگو ۴.۲ view غیرهمزمان را پشتیبانی نمی‌کنند)
+def _async_auth(staff=False, post_only=False, device=False):
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if post_only and request.method != "POST":
+                return HttpResponseNotAllowed(["POST"])
+            token = request.headers.get("X-Device-Token") if device else None
+            if token:
+                request.device_id = await heartbeat.adevice_for_token(token)
+                if request.device_id is None:
+                    return JsonResponse({"ok": False, "msg": INVALID_DEVICE_TOKEN}, status=401)
+                if not await heartbeat.aknown(request.device_id):
+                    return JsonResponse({"ok": False, "msg": UNKNOWN_DEVICE}, status=401)
+                return await view(request, *args, **kwargs)
+            user = await sync_to_async(get_user)(request)
+            request.user = user
+            if not user.is_authenticated or (staff and not user.is_staff):
+                return redirect_to_login(request.get_full_path())
+            if device:
+                request.device_id = await sync_to_async(request.session.get)(
+                    "device_id", DEFAULT_DEVICE_ID
+                )
+                if not await heartbeat.aknown(request.device_id):
+                    await sync_to_async(request.session.pop)("device_id", None)
+                    return JsonResponse({"ok": False, "msg": UNKNOWN_DEVICE}, status=401)
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+# API بررسی چهره در دستگاه (نسخه async)
+@_async_auth(staff=True, post_only=True)
+@face_timed("device_verify")
+async def api_device_verify_face(request):
+
+    timer = request.face_timer
+    try:
+        with timed(timer, "upload"):
+            img1, img2, boxes = await _run_cpu(face.read_frame_sources, request)
+        if not img1 or not img2:
+            return JsonResponse({"success": False, "error": "ارسال ناقص تصاویر."})
+        enc, error = await _run_cpu(face.pair_encoding, img1, img2, boxes, timer)
+        if error:
+            return JsonResponse({"success": False, "error": DEVICE_FACE_ERRORS[error]})
+
+        if request.user.face_encoding is None:
+            return JsonResponse({"success": False, "error": "چهره مدیر ثبت نشده."})
+
+        with timed(timer, "match"):
+            distance = face.user_distance(request.user, enc)
+        if distance < face.FACE_DISTANCE_THRESHOLD:
+            return JsonResponse({"success": True, "redirect": reverse("device_page")})
+        else:
+            return JsonResponse({"success": False, "error": "تشخیص ناموفق."})
+
+    except Exception as e:
+        print("Device verify error:", e)
+        return JsonResponse({"success": False, "error": "خطا در پردازش تصویر."})
+
+# تصمیم نهایی پس از زنده‌سنجی (نسخه async)
+async def _arecord_verification(request, now, tier, frame1, candidates):
+    timer = request.face_timer
+    best_user = None
+    best_dist = float("inf")
+
+    if candidates:
+        best_id, best_dist = candidates[0]
+        with timed(timer, "db"):
+            best_user = await User.objects.filter(pk=best_id).afirst()
+        if best_user is None:
+            await _run_cpu(face_registry.update_face_index, best_id, None)
+    if best_user and best_dist < face.FACE_DISTANCE_THRESHOLD:
+        u = best_user
+        if u.is_staff:
+            return JsonResponse({"ok": False, "tier": tier, "manager_detected": True})
+        with timed(timer, "db"):
+            last_log = await AttendanceLog.objects.filter(user=u).order_by('-timestamp').afirst()
+            last_ts = _to_naive(last_log.timestamp) if last_log else None
+            if last_log and now - last_ts < DUPLICATE_TAP_WINDOW:
+                return JsonResponse({"ok": False, "tier": tier, "msg": "تردد تکراری"})
+            log_type = 'out' if last_log and last_log.log_type == 'in' else 'in'
+            await AttendanceLog.objects.acreate(
+                user=u, timestamp=now, log_type=log_type, source='self', device_id=request.device_id
+            )
+            await sync_to_async(daily_attendance.logs_changed)([(u.id, now)])
+        return JsonResponse(_verified_payload(u, now, log_type, tier))
+
+    if best_user and best_dist < face.MATCH_SAVE_DISTANCE:
+        await sync_to_async(_save_suspicious_log)(best_user.pk, best_dist, now, frame1)
+        return JsonResponse({"ok": False, "tier": tier, "suspicious": True})
+
+    return JsonResponse({"ok": False, "tier": tier, "msg": "چهره شما در سیستم ثبت نشده است."})
+
+# API ثبت تردد با تشخیص چهره (نسخه async)
+@_async_auth(post_only=True, device=True)
+@face_timed("verify")
+async def api_verify_face(request):
+    timer = request.face_timer
+    now = _now()
+    with timed(timer, "db"):
+        await heartbeat.abeat(request.device_id)
+        active, groups = await heartbeat.astate(request.device_id)
+    if not active:
+        return JsonResponse({"ok": False, "msg": "دستگاه غیرفعال است."})
+    try:
+        with timed(timer, "upload"):
+            img1, img2, boxes = await _run_cpu(face.read_frame_sources, request)
+        if not img1 or not img2:
+            return JsonResponse({"ok": False, "msg": "ارسال ناقص تصاویر."})
+        tier, frame1, candidates, error = await _run_cpu(face.verify_frames, img1, img2, boxes, timer, groups)
+        if error:
+            return JsonResponse({"ok": False, "tier": tier, "msg": error})
+        return await _arecord_verification(request, now, tier, frame1, candidates)
+    except Exception as e:
+        print("Verify face error:", e)
+        return JsonResponse({"ok": False, "msg": "خطا در پردازش تصویر. لطفاً دوباره تلاش کنید."})
+
+api_verify_face.csrf_exempt = True
+
+# API زنده‌سنجی جریانی (نسخه async)
+@_async_auth(post_only=True, device=True)
+@face_timed("verify_stream")
+async def api_verify_stream(request):
+    if not _stream_enabled():
+        return JsonResponse({"ok": False, "msg": STREAM_DISABLED}, status=404)
+    timer = request.face_timer
+    now = _now()
+    with timed(timer, "db"):
+        await heartbeat.abeat(request.device_id)
+        active, groups = await heartbeat.astate(request.device_id)
+    if not active:
+        return JsonResponse({"ok": False, "msg": "دستگاه غیرفعال است."})
+    try:
+        with timed(timer, "upload"):
+            stream_id, img, box = await _run_cpu(face.read_stream_frame, request)
+        if not stream_id or not img:
+            return JsonResponse({"ok": False, "msg": "ارسال ناقص تصاویر."})
+        status, tier, frame1, candidates, msg = await _run_cpu(
+            face_stream.stream_sessions.push, stream_id, request.device_id, img, box, groups, timer
+        )
+        if status == "pending":
+            return JsonResponse({"ok": False, "pending": True, "hint": msg})
+        if status == "failed":
+            return JsonResponse({"ok": False, "tier": tier, "msg": msg})
+        return await _arecord_verification(request, now, tier, frame1, candidates)
+    except Exception as e:
+        print("Verify stream error:", e)
+        return JsonResponse({"ok": False, "msg": "خطا در پردازش تصویر. لطفاً دوباره تلاش کنید."})
+
+api_verify_stream.csrf_exempt = True
+
+# API وضعیت حضور و غیاب (نسخه async)
+@_async_auth(staff=True)
+async def api_attendance_status(request):
+
+    target_date = _status_target_date(request)
+
+    holiday = await WeeklyHoliday.objects.filter(weekday=_weekday_index(target_date)).aexists()
+    if holiday:
+        return JsonResponse({'present': [], 'absent': [], 'leave': []})
+
+    present_ids, leave_ids = await sync_to_async(_day_status_ids)(User.objects.all(), target_date)
+    data = {
+        'present': [_status_entry(u) async for u in User.objects.filter(id__in=present_ids)],
+        'absent': [
+            _status_entry(u) async for u in
+            User.objects.filter(is_active=True).exclude(id__in=present_ids).exclude(id__in=leave_ids)
+        ],
+        'leave': [_status_entry(u) async for u in User.objects.filter(id__in=leave_ids)],
+    }
+    return JsonResponse(data)
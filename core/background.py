@@ -0,0 +1,63 @@
+import queue
+import threading
+
+from django.conf import settings
+from django.db import connection
+
+# صف محدود کارهای کند (ذخیره فایل، آموزش دوباره) خارج از مسیر درخواست
+class BackgroundQueue:
+
+    def __init__(self, max_size=None, name="background"):
+        self._max_size = max_size
+        self._name = name
+        self._queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                size = self._max_size
+                if size is None:
+                    size = getattr(settings, "FACE_BACKGROUND_QUEUE_SIZE", 100)
+                self._queue = queue.Queue(maxsize=size)
+                self._thread = threading.Thread(
+                    target=self._work, name=f"{self._name}-worker", daemon=True
+                )
+                self._thread.start()
+
+    # افزودن کار به صف؛ اگر صف پر باشد همان‌جا اجرا می‌شود تا داده‌ای از دست نرود
+    def submit(self, fn, *args, **kwargs):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((fn, args, kwargs))
+        except queue.Full:
+            print("Background queue full, running inline:", fn.__name__)
+            self._run(fn, args, kwargs)
+
+    def _run(self, fn, args, kwargs):
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            print("Background task error:", fn.__name__, e)
+
+    def _work(self):
+        while True:
+            fn, args, kwargs = self._queue.get()
+            try:
+                self._run(fn, args, kwargs)
+            finally:
+                connection.close()
+                self._queue.task_done()
+
+    # انتظار تا خالی شدن صف (برای فرمان‌های مدیریتی و بستن برنامه)
+    def join(self):
+        if self._queue is not None:
+            self._queue.join()
+
+    def pending(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+background = BackgroundQueue()
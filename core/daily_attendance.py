@@ -0,0 +1,286 @@
+import math
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from attendance.models import AttendanceLog, DailyAttendance, LeaveRequest, WeeklyHoliday
+
+from .background import background
+
+User = get_user_model()
+
+# شیفت پیش‌فرض کاربران بدون شیفت و بازه مجاز ورود زودتر/خروج دیرتر
+DEFAULT_SHIFT = (time(9, 0), time(17, 0))
+EARLY_TOL = timedelta(minutes=30)
+LATE_TOL = timedelta(minutes=30)
+# بیشترین شرط «کاربران از روز» در یک پرس‌وجوی حذف
+EXPIRE_TERMS = 100
+
+# اندیس روز هفته شمسی (شنبه=۰)
+def weekday_index(date):
+    return (date.weekday() + 2) % 7
+
+# تعیین شیفت کاربر در صورت وجود
+def get_user_shift(user):
+
+    if getattr(user, "shift", None):
+        return user.shift
+    if getattr(user, "group", None) and user.group and user.group.shift:
+        return user.group.shift
+    return None
+
+def _to_naive(dt):
+    return dt.replace(tzinfo=None) if dt and dt.tzinfo is not None else dt
+
+def _today():
+    return timezone.now().replace(tzinfo=None).date()
+
+# بازه رسمی شیفت در یک روز (شیفت شبانه تا روز بعد ادامه دارد)
+def _shift_bounds(day, shift_start, shift_end):
+
+    start_dt = datetime.combine(day, shift_start)
+    end_dt = datetime.combine(day, shift_end)
+    if shift_end <= shift_start:
+        end_dt += timedelta(days=1)
+    return start_dt, end_dt
+
+# خلاصه یک روز کاری از ترددهای پنجره شیفت و آخرین تردد پیش از آن
+def _work_day(row, start_dt, end_dt, prev_log, day_logs):
+
+    window_end = end_dt + LATE_TOL
+    carried_in = prev_log is not None and prev_log[1] == "in"
+    session_pairs = []
+    incomplete = False
+    current_in = prev_log[0] if carried_in else None
+    for ts, log_type in day_logs:
+        if log_type == "in":
+            if current_in is not None:
+                session_pairs.append((current_in, ts))
+                incomplete = True
+            current_in = ts
+        else:
+            if current_in is not None:
+                session_pairs.append((current_in, ts))
+                current_in = None
+            else:
+                incomplete = True
+    if current_in is not None:
+        session_pairs.append((current_in, window_end))
+        incomplete = True
+
+    if not session_pairs and not day_logs and not carried_in:
+        row.status = "absent"
+        return
+    row.status = "present"
+    row.incomplete = incomplete
+
+    if carried_in:
+        first_in_ts = start_dt
+    else:
+        first_in_ts = next((ts for ts, log_type in day_logs if log_type == "in"), None)
+    if first_in_ts and first_in_ts > start_dt:
+        row.tardy_minutes = int(math.ceil((first_in_ts - start_dt).total_seconds() / 60))
+
+    for in_ts, out_ts in session_pairs:
+        overlap_start = max(in_ts, start_dt)
+        overlap_end = min(out_ts, end_dt)
+        if overlap_start < overlap_end:
+            row.present_minutes += int((overlap_end - overlap_start).total_seconds() // 60)
+        if in_ts < start_dt:
+            row.overtime_minutes += int((min(out_ts, start_dt) - in_ts).total_seconds() // 60)
+        if out_ts > end_dt:
+            row.overtime_minutes += int((out_ts - max(in_ts, end_dt)).total_seconds() // 60)
+
+# محاسبه خلاصه روزهای بازه برای چند کاربر با تعداد ثابت پرس‌وجو (بدون ذخیره)
+def compute_days(user_ids, start, end):
+
+    range_start = datetime.combine(start - timedelta(days=1), time.min)
+    range_end = datetime.combine(end + timedelta(days=2), time.min)
+    prev_logs = AttendanceLog.objects.filter(
+        user=OuterRef("pk"), timestamp__lt=range_start
+    ).order_by("-timestamp")
+    users = list(
+        User.objects.filter(id__in=user_ids)
+        .select_related("shift", "group__shift")
+        .annotate(
+            prev_ts=Subquery(prev_logs.values("timestamp")[:1]),
+            prev_type=Subquery(prev_logs.values("log_type")[:1]),
+        )
+    )
+    holidays = set(WeeklyHoliday.objects.values_list("weekday", flat=True))
+    leave_days = defaultdict(set)
+    for user_id, leave_start, leave_end in LeaveRequest.objects.filter(
+        user_id__in=user_ids, status="approved", start_date__lte=end, end_date__gte=start
+    ).values_list("user_id", "start_date", "end_date"):
+        cur = max(leave_start, start)
+        while cur <= min(leave_end, end):
+            leave_days[user_id].add(cur)
+            cur += timedelta(days=1)
+    logs = defaultdict(list)
+    for user_id, ts, log_type in (
+        AttendanceLog.objects.filter(
+            user_id__in=user_ids, timestamp__gte=range_start, timestamp__lt=range_end
+        )
+        .order_by("timestamp")
+        .values_list("user_id", "timestamp", "log_type")
+    ):
+        logs[user_id].append((_to_naive(ts), log_type))
+
+    rows = []
+    for user in users:
+        shift = get_user_shift(user)
+        shift_start, shift_end = (shift.start_time, shift.end_time) if shift else DEFAULT_SHIFT
+        start_dt, end_dt = _shift_bounds(start, shift_start, shift_end)
+        shift_minutes = (end_dt - start_dt).seconds // 60
+        user_logs = logs[user.id]
+        stamps = [ts for ts, _ in user_logs]
+        before = (_to_naive(user.prev_ts), user.prev_type) if user.prev_ts else None
+
+        day = start
+        while day <= end:
+            row = DailyAttendance(user_id=user.id, date=day)
+            # ترددهای روز تقویمی برای نمایش و فهرست حاضران
+            lo = bisect_left(stamps, datetime.combine(day, time.min))
+            hi = bisect_left(stamps, datetime.combine(day + timedelta(days=1), time.min))
+            calendar = user_logs[lo:hi]
+            row.punches = len(calendar)
+            row.first_punch = calendar[0][0] if calendar else None
+            row.first_in = next((ts for ts, t in calendar if t == "in"), None)
+            row.last_out = next((ts for ts, t in reversed(calendar) if t == "out"), None)
+
+            if weekday_index(day) in holidays:
+                row.status = "holiday"
+            elif day in leave_days[user.id]:
+                row.status = "leave"
+            else:
+                row.mandatory_minutes = shift_minutes
+                start_dt, end_dt = _shift_bounds(day, shift_start, shift_end)
+                lo = bisect_left(stamps, start_dt - EARLY_TOL)
+                hi = bisect_left(stamps, end_dt + LATE_TOL)
+                prev_log = user_logs[lo - 1] if lo else before
+                _work_day(row, start_dt, end_dt, prev_log, user_logs[lo:hi])
+            rows.append(row)
+            day += timedelta(days=1)
+    return rows
+
+def _versions(user_ids):
+    return dict(User.objects.filter(id__in=user_ids).values_list("id", "daily_version"))
+
+# ذخیره روزهای محاسبه‌شده با نسخه‌ای که کاربران پیش از خواندن ترددها داشتند؛ اگر نسخه کاربری در
+# این فاصله بالا رفته (تردد یا تغییری هم‌زمان رسیده)، روزهای او در بازه کنار می‌روند تا کهنه نمانند.
+# قفل ردیف کاربر ترتیب این بررسی را با _expire (بالا بردن نسخه پیش از حذف) مشخص می‌کند
+def _store(rows, versions, start, end, replace=False):
+
+    with transaction.atomic():
+        days = DailyAttendance.objects.filter(date__range=(start, end))
+        if replace:
+            days.filter(user_id__in=list(versions)).delete()
+        DailyAttendance.objects.bulk_create(rows, batch_size=500, ignore_conflicts=True)
+        current = dict(
+            User.objects.select_for_update()
+            .filter(id__in=list(versions))
+            .order_by("id")
+            .values_list("id", "daily_version")
+        )
+        changed = [user_id for user_id, version in versions.items() if current.get(user_id) != version]
+        if changed:
+            days.filter(user_id__in=changed).delete()
+
+# ساخت روزهای ساخته‌نشده بازه؛ روزهای موجود دست نمی‌خورند
+def ensure_days(user_ids, start, end):
+
+    user_ids = list(user_ids)
+    if not user_ids or end < start:
+        return
+    have = defaultdict(set)
+    for user_id, day in DailyAttendance.objects.filter(
+        user_id__in=user_ids, date__range=(start, end)
+    ).values_list("user_id", "date"):
+        have[user_id].add(day)
+    span = (end - start).days + 1
+    missing = [user_id for user_id in user_ids if len(have[user_id]) < span]
+    if not missing:
+        return
+    versions = _versions(missing)
+    rows = [row for row in compute_days(missing, start, end) if row.date not in have[row.user_id]]
+    _store(rows, versions, start, end)
+
+# بازسازی کامل روزهای بازه برای کاربران (فرمان rebuild_daily_attendance)؛ تعداد روزهای ساخته‌شده
+def rebuild_days(user_ids, start, end):
+
+    user_ids = list(user_ids)
+    versions = _versions(user_ids)
+    rows = compute_days(user_ids, start, end)
+    _store(rows, versions, start, end, replace=True)
+    return len(rows)
+
+# خلاصه روزانه بازه برای کاربران (روزهای ساخته‌نشده همین‌جا محاسبه می‌شوند)
+def daily_rows(user_ids, start, end):
+
+    user_ids = list(user_ids)
+    ensure_days(user_ids, start, end)
+    return DailyAttendance.objects.filter(user_id__in=user_ids, date__range=(start, end))
+
+# کنار گذاشتن روزهای کهنه؛ نسخه کاربران پیش از حذف بالا می‌رود تا خواندنی که هم‌زمان ترددهای
+# قبلی را خوانده، روزهای ذخیره‌کرده‌اش را در _store خودش دور بریزد
+def _expire(users, *days):
+    with transaction.atomic():
+        users.update(daily_version=F("daily_version") + 1)
+        for rows in days:
+            rows.delete()
+
+# ثبت یا تأیید تردد: روزهای کاربر از روز پیش از تردد به بعد کنار می‌روند (تردد «ورود» باز
+# روزهای بعد را هم تغییر می‌دهد) و پس از ثبت تراکنش در پس‌زمینه تا امروز دوباره ساخته می‌شوند
+def logs_changed(changes, recompute=True):
+
+    since = {}
+    for user_id, ts in changes:
+        day = _to_naive(ts).date() - timedelta(days=1)
+        since[user_id] = min(since.get(user_id, day), day)
+    if not since:
+        return
+    # یک شرط برای هر روز (نه هر کاربر) و چند روز در هر حذف تا عمق عبارت SQLite از حد نگذرد
+    by_day = defaultdict(list)
+    for user_id, day in since.items():
+        by_day[day].append(user_id)
+    terms = [Q(user_id__in=user_ids, date__gte=day) for day, user_ids in sorted(by_day.items())]
+    days = []
+    for i in range(0, len(terms), EXPIRE_TERMS):
+        query = Q()
+        for term in terms[i:i + EXPIRE_TERMS]:
+            query |= term
+        days.append(DailyAttendance.objects.filter(query))
+    _expire(User.objects.filter(id__in=list(since)), *days)
+    if recompute:
+        transaction.on_commit(lambda: background.submit(_refill, since))
+
+def _refill(since):
+    today = _today()
+    for user_id, day in since.items():
+        ensure_days([user_id], day, today)
+
+# تغییر مرخصی، شیفت، گروه یا تعطیلی: روزهای مربوط حذف و هنگام خواندن دوباره ساخته می‌شوند
+def invalidate(user_ids=None, start=None, end=None):
+
+    users = User.objects.all()
+    rows = DailyAttendance.objects.all()
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        users = users.filter(id__in=user_ids)
+        rows = rows.filter(user_id__in=user_ids)
+    if start is not None:
+        rows = rows.filter(date__gte=start)
+    if end is not None:
+        rows = rows.filter(date__lte=end)
+    _expire(users, rows)
+
+# کاربرانی که شیفتشان (مستقیم یا از گروه) همین شیفت است
+def shift_users(shift):
+    return User.objects.filter(
+        Q(shift=shift) | Q(shift__isnull=True, group__shift=shift)
+    ).values_list("id", flat=True)
@@ -0,0 +1,61 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# جمع‌آوری درخواست‌های هم‌زمان در دسته‌های کوچک و پردازش یکجای آن‌ها
+class MicroBatcher:
+
+    def __init__(self, handler, max_size=16, max_wait=0.005, workers=1, name="batch"):
+        self._handler = handler
+        self._max_size = max_size
+        self._max_wait = max_wait
+        self._queue = queue.SimpleQueue()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._name = name
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._collect, name=f"{self._name}-collector", daemon=True
+                )
+                self._thread.start()
+
+    # افزودن یک مورد به صف و برگرداندن Future نتیجه آن
+    def submit(self, item):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self._max_wait
+            while len(batch) < self._max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._process, batch)
+
+    def _process(self, batch):
+        try:
+            results = self._handler([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,84 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+# نشانگر نبودن کلید؛ None خودش یک نتیجه معتبر (چهره یافت نشد) است
+MISSING = object()
+
+# حافظه نهان LRU بردارهای چهره بر اساس هش محتوای تصویر
+class EncodingCache:
+
+    def __init__(self, max_size=None, ttl=None):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._max_size = max_size
+        self._ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def max_size(self):
+        if self._max_size is not None:
+            return self._max_size
+        return getattr(settings, "FACE_ENCODING_CACHE_SIZE", 256)
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, "FACE_ENCODING_CACHE_TTL", 30)
+
+    # کلید شامل هش تصویر و همه تنظیماتی است که روی بردار اثر دارند
+    @staticmethod
+    def key(img_bytes, *params):
+        digest = hashlib.blake2b(img_bytes, digest_size=16)
+        digest.update(repr(params).encode())
+        return digest.digest()
+
+    def get(self, key):
+        if self.max_size <= 0:
+            return MISSING
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                    self.evictions += 1
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, encoding):
+        if self.max_size <= 0:
+            return
+        if encoding is not None:
+            encoding = encoding.copy()
+            encoding.setflags(write=False)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), encoding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+encoding_cache = EncodingCache()
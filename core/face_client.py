@@ -0,0 +1,100 @@
+import json
+import socket
+import struct
+
+import numpy as np
+from django.conf import settings
+
+# سرآیند هر پیام: طول JSON و طول داده باینری
+_FRAME = struct.Struct("!II")
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+class InferenceError(Exception):
+    pass
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+# ارسال یک پیام روی سوکت
+def send_message(sock, header, payload=b""):
+    head = json.dumps(header).encode()
+    sock.sendall(_FRAME.pack(len(head), len(payload)) + head)
+    if payload:
+        sock.sendall(payload)
+
+# دریافت یک پیام از سوکت
+def recv_message(sock):
+    head_len, payload_len = _FRAME.unpack(_recv_exact(sock, _FRAME.size))
+    if head_len + payload_len > MAX_MESSAGE_SIZE:
+        raise ValueError("message too large")
+    header = json.loads(_recv_exact(sock, head_len))
+    payload = _recv_exact(sock, payload_len) if payload_len else b""
+    return header, payload
+
+# کلاینت سرویس استنتاج چهره روی سوکت یونیکس
+class InferenceClient:
+
+    def __init__(self, path, timeout=10):
+        self.path = path
+        self.timeout = timeout
+
+    def _call(self, header, payload=b""):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(self.path)
+                send_message(sock, header, payload)
+                reply, data = recv_message(sock)
+        except (OSError, ValueError) as e:
+            raise InferenceError(str(e)) from e
+        if not reply.get("ok"):
+            raise InferenceError(reply.get("error", "inference failed"))
+        return reply, data
+
+    # استخراج بردار چند تصویر در فرایندهای سرویس
+    def encode(self, images, quality="full", boxes=None):
+        reply, data = self._call(
+            {
+                "op": "encode",
+                "quality": quality,
+                "sizes": [len(img) for img in images],
+                "boxes": list(boxes) if boxes else [None] * len(images),
+            },
+            b"".join(images),
+        )
+        vectors = iter(np.frombuffer(data, dtype=np.float64).reshape(-1, 128))
+        return [next(vectors).copy() if found else None for found in reply["found"]]
+
+    # جستجوی نزدیک‌ترین کاربران در ایندکس سرویس (groups: محدوده گالری دستگاه)
+    def match(self, encoding, k=2, radius=None, groups=None):
+        reply, _ = self._call(
+            {
+                "op": "match",
+                "k": k,
+                "radius": radius,
+                "groups": sorted(groups) if groups is not None else None,
+            },
+            np.asarray(encoding, dtype=np.float64).tobytes(),
+        )
+        return [(int(uid), float(dist)) for uid, dist in reply["candidates"]]
+
+    # اطلاع تغییر بردار یک کاربر به سرویس
+    def update(self, user_id, encoding):
+        payload = b""
+        if encoding is not None:
+            payload = np.asarray(encoding, dtype=np.float64).tobytes()
+        self._call({"op": "update", "user_id": user_id}, payload)
+
+# ساخت کلاینت در صورت تنظیم بودن مسیر سوکت
+def get_client():
+    path = getattr(settings, "FACE_INFERENCE_SOCKET", None)
+    if not path:
+        return None
+    return InferenceClient(path, getattr(settings, "FACE_INFERENCE_TIMEOUT", 10))
@@ -0,0 +1,107 @@
+import numpy as np
+from django.conf import settings
+
+# ابعاد بردار چهره در face_recognition
+EMBEDDING_SIZE = 128
+
+# نشانه نسخه قالب ذخیره: FEv1 و پس از آن بردارهای float32 پشت سر هم
+EMBEDDING_MAGIC = b"FEv1"
+STORAGE_DTYPE = np.dtype("<f4")
+
+# تنظیمات استخراج (num_jitters و مدل نقاط چهره) هر نسخه مدل
+DEFAULT_EMBEDDING_MODELS = {"dlib-large-j5": {"num_jitters": 5, "model": "large"}}
+
+# برچسب مدل و تنظیمات استخراج بردارهای فعال
+def embedding_model():
+    return getattr(settings, "FACE_EMBEDDING_MODEL", "dlib-large-j5")
+
+# تنظیمات استخراج یک نسخه مدل (پیش‌فرض نسخه فعال)؛ None برای نسخه ثبت‌نشده
+def embedding_profile(model=None):
+    models = getattr(settings, "FACE_EMBEDDING_MODELS", DEFAULT_EMBEDDING_MODELS)
+    profile = models.get(model or embedding_model())
+    return dict(profile) if profile is not None else None
+
+def gallery_size():
+    return max(1, getattr(settings, "FACE_GALLERY_SIZE", 5))
+
+# قالب قدیمی: بایت‌های خام float64 بدون نشانه نسخه
+def is_legacy(raw):
+    return bool(raw) and not bytes(raw).startswith(EMBEDDING_MAGIC)
+
+# تبدیل یک یا چند بردار به بایت‌های نسخه‌دار float32
+def pack_vectors(vectors):
+
+    vectors = np.asarray(vectors, dtype=STORAGE_DTYPE).reshape(-1, EMBEDDING_SIZE)
+    return EMBEDDING_MAGIC + vectors.tobytes()
+
+# خواندن بایت‌های ذخیره‌شده (نسخه‌دار یا قدیمی) به ماتریس float32
+def unpack_vectors(raw):
+
+    if not raw:
+        return np.empty((0, EMBEDDING_SIZE), dtype=np.float32)
+    raw = bytes(raw)
+    if raw.startswith(EMBEDDING_MAGIC):
+        vectors = np.frombuffer(raw, dtype=STORAGE_DTYPE, offset=len(EMBEDDING_MAGIC))
+    elif len(raw) % (EMBEDDING_SIZE * 8) == 0:
+        vectors = np.frombuffer(raw, dtype=np.float64)
+    else:
+        return np.empty((0, EMBEDDING_SIZE), dtype=np.float32)
+    if not vectors.size or vectors.size % EMBEDDING_SIZE:
+        return np.empty((0, EMBEDDING_SIZE), dtype=np.float32)
+    return vectors.astype(np.float32).reshape(-1, EMBEDDING_SIZE)
+
+# خواندن الگوهای ذخیره‌شده به شکل ماتریس پیوسته؛ کاربران قدیمی فقط face_encoding دارند
+def load_templates(templates_raw, encoding_raw=None):
+
+    templates = unpack_vectors(templates_raw)
+    if len(templates):
+        return templates
+    return unpack_vectors(encoding_raw)[:1]
+
+def user_templates(user):
+    return load_templates(user.face_templates, user.face_encoding)
+
+# افزودن الگوی جدید به گالری محدود کاربر
+# در گالری پر، تکراری‌ترین الگو (کمترین فاصله تا نزدیک‌ترین همسایه) کنار می‌رود؛
+# الگوی اول (ثبت‌نام روبه‌رو) همیشه حفظ می‌شود تا آموزش‌های بعدی گالری را منحرف نکنند
+def add_template(templates, encoding, max_size=None):
+
+    max_size = max_size or gallery_size()
+    vec = np.asarray(encoding, dtype=np.float64).reshape(1, EMBEDDING_SIZE)
+    merged = np.vstack([templates, vec])
+    if len(merged) <= max_size:
+        return merged
+    sq = np.einsum("ij,ij->i", merged, merged)
+    d2 = sq[:, None] - 2 * merged @ merged.T + sq[None, :]
+    np.fill_diagonal(d2, np.inf)
+    redundancy = d2.min(axis=1)
+    redundancy[0] = np.inf
+    return np.delete(merged, int(redundancy.argmin()), axis=0)
+
+# ساخت گالری از فریم‌های یک نوبت ثبت‌نام
+def build_templates(encodings, max_size=None):
+
+    templates = np.empty((0, EMBEDDING_SIZE), dtype=np.float64)
+    for enc in encodings:
+        templates = add_template(templates, enc, max_size)
+    return templates
+
+# ذخیره گالری روی کاربر با قالب نسخه‌دار؛ face_encoding میانگین الگوها می‌ماند (بدون save)
+def apply_templates(user, templates):
+
+    if templates is None or not len(templates):
+        user.face_templates = None
+        user.face_encoding = None
+        user.face_model = ""
+        return
+    templates = np.asarray(templates, dtype=np.float64)
+    user.face_templates = pack_vectors(templates)
+    user.face_encoding = pack_vectors(templates.mean(axis=0))
+    user.face_model = embedding_model()
+
+# کمترین فاصله بردار تا الگوهای کاربر (None اگر چهره‌ای ثبت نشده باشد)
+def min_distance(templates, encoding):
+
+    if not len(templates):
+        return None
+    return float(np.linalg.norm(templates - encoding, axis=1).min())
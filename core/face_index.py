@@ -0,0 +1,424 @@
+import math
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from .face_gallery import EMBEDDING_SIZE, load_templates
+
+# شناسه گروه سطرهای کاربران بدون گروه
+NO_GROUP = -1
+
+# محاسبه فاصله اقلیدسی هر سطر تا همه مراکز به صورت تکه‌تکه
+def _nearest_centroids(vectors, centroids, chunk=4096):
+
+    c_sq = np.einsum("ij,ij->i", centroids, centroids)
+    labels = np.empty(len(vectors), dtype=np.int32)
+    spread = np.empty(len(vectors), dtype=np.float64)
+    for start in range(0, len(vectors), chunk):
+        part = vectors[start:start + chunk]
+        p_sq = np.einsum("ij,ij->i", part, part)
+        d2 = p_sq[:, None] - 2 * part @ centroids.T + c_sq[None, :]
+        idx = d2.argmin(axis=1)
+        labels[start:start + chunk] = idx
+        spread[start:start + chunk] = np.sqrt(
+            np.maximum(d2[np.arange(len(part)), idx], 0)
+        )
+    return labels, spread
+
+# مربع فاصله با بسط ||x||² - 2x·p + ||p||² برای پیمایش سریع
+def _sq_distances(matrix, sq_norms, probe):
+    return np.maximum(sq_norms - 2 * (matrix @ probe) + probe @ probe, 0)
+
+# رتبه‌بندی دوباره کاندیدهای برتر با فاصله دقیق؛ برای هر کاربر کمترین فاصله بین الگوهایش
+def _rerank(matrix, user_ids, probe, rows, d2, k, per_user=1):
+
+    if not len(rows):
+        return []
+    top = max(k, getattr(settings, "FACE_INDEX_RERANK", 16)) * per_user
+    if top < len(d2):
+        rows = rows[np.argpartition(d2, top - 1)[:top]]
+    distances = np.linalg.norm(matrix[rows] - probe, axis=1)
+    order = np.argsort(distances)
+    _, first = np.unique(user_ids[rows[order]], return_index=True)
+    order = order[np.sort(first)][:k]
+    return [(int(user_ids[rows[i]]), float(distances[i])) for i in order]
+
+# بیشترین تعداد الگوی یک کاربر در ایندکس
+def _templates_per_user(user_ids):
+
+    if not len(user_ids):
+        return 1
+    return int(np.unique(user_ids, return_counts=True)[1].max())
+
+# کوانتایزر درشت IVF برای جستجوی تقریبی در گالری‌های بزرگ
+class IVFQuantizer:
+
+    def __init__(self, centroids, cells, spread):
+        self.centroids = centroids
+        self.cells = cells
+        self.spread = spread
+        nlist = len(centroids)
+        self._order = np.argsort(cells, kind="stable")
+        counts = np.bincount(cells, minlength=nlist)
+        self._offsets = np.concatenate([[0], np.cumsum(counts)])
+        radii = np.zeros(nlist, dtype=np.float64)
+        if len(cells):
+            np.maximum.at(radii, cells, spread)
+        self._radii = radii
+        self._counts = counts
+
+    # آموزش مراکز با k-means روی نمونه‌ای از گالری
+    @classmethod
+    def train(cls, matrix, nlist, iterations=10, seed=0):
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(matrix), nlist * 64)
+        sample = matrix[rng.choice(len(matrix), size=sample_size, replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels, _ = _nearest_centroids(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+        cells, spread = _nearest_centroids(matrix, centroids)
+        return cls(centroids, cells, spread)
+
+    def assign(self, vectors):
+        return _nearest_centroids(vectors, self.centroids)
+
+    def with_rows(self, cells, spread):
+        return IVFQuantizer(self.centroids, cells, spread)
+
+    def _rows_in(self, cell_ids):
+        counts = self._counts[cell_ids]
+        total = int(counts.sum())
+        if not total:
+            return np.empty(0, dtype=np.int64)
+        starts = self._offsets[cell_ids]
+        shift = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        return self._order[shift + np.arange(total)]
+
+    # انتخاب سطرهای کاندید و فاصله تقریبی آن‌ها
+    def search(self, matrix, sq_norms, probe, nprobe, radius=None, guard=True):
+        centroid_dist = np.linalg.norm(self.centroids - probe, axis=1)
+        ranked = np.argsort(centroid_dist)
+        rows = self._rows_in(ranked[:nprobe])
+        d2 = _sq_distances(matrix[rows], sq_norms[rows], probe)
+        if not guard:
+            return rows, d2
+
+        # هر خوشه‌ای که طبق نامساوی مثلث ممکن است بردار نزدیک‌تری داشته باشد هم بررسی می‌شود
+        bound = math.sqrt(d2.min()) + 1e-6 if len(d2) else math.inf
+        if radius is not None:
+            bound = min(bound, radius)
+        rest = ranked[nprobe:]
+        lower = centroid_dist[rest] - self._radii[rest]
+        extra = rest[(lower <= bound) & (self._counts[rest] > 0)]
+        if len(extra):
+            more = self._rows_in(extra)
+            rows = np.concatenate([rows, more])
+            d2 = np.concatenate(
+                [d2, _sq_distances(matrix[more], sq_norms[more], probe)]
+            )
+        return rows, d2
+
+# نسخه کوانتیزه int8 گالری برای پیمایش اول؛ یک‌چهارم پهنای باند float32
+class Int8Codes:
+
+    def __init__(self, matrix):
+        scale = np.abs(matrix).max(axis=0) / 127 if len(matrix) else np.ones(EMBEDDING_SIZE)
+        scale[scale == 0] = 1
+        self.scale = scale.astype(np.float32)
+        self.codes, self.sq_norms = self._encode(matrix)
+
+    def _encode(self, vectors):
+        codes = np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+        restored = codes * self.scale
+        return codes, np.einsum("ij,ij->i", restored, restored)
+
+    # نگه داشتن سطرهای keep و افزودن بردارهای تازه با همان مقیاس؛ فقط اگر بردار تازه
+    # از بازه مقیاس بیرون بزند کل ماتریس دوباره کوانتیزه می‌شود
+    def with_rows(self, keep, vectors, matrix):
+        if len(vectors) and (np.abs(vectors) > self.scale * 127).any():
+            return Int8Codes(matrix)
+        codes, sq_norms = self._encode(vectors)
+        updated = Int8Codes.__new__(Int8Codes)
+        updated.scale = self.scale
+        updated.codes = np.vstack([self.codes[keep], codes])
+        updated.sq_norms = np.concatenate([self.sq_norms[keep], sq_norms])
+        return updated
+
+    # مربع فاصله تقریبی چند بردار تا همه سطرها؛ کدها تکه‌تکه به float32 برمی‌گردند
+    def sq_distances(self, probes, chunk=8192):
+        scaled = probes * self.scale
+        out = np.empty((len(probes), len(self.codes)), dtype=np.float32)
+        for start in range(0, len(self.codes), chunk):
+            part = self.codes[start:start + chunk].astype(np.float32)
+            out[:, start:start + chunk] = self.sq_norms[None, start:start + chunk] - 2 * (scaled @ part.T)
+        out += np.einsum("ij,ij->i", probes, probes)[:, None]
+        return np.maximum(out, 0, out=out)
+
+# ایندکس درون‌حافظه‌ای بردارهای چهره
+class FaceIndex:
+
+    def __init__(self, refresh_seconds=None):
+        self._lock = threading.Lock()
+        # فقط یک ساخت دوباره از پایگاه داده در هر لحظه
+        self._build_lock = threading.Lock()
+        self._matrix = np.empty((0, EMBEDDING_SIZE), dtype=np.float32)
+        self._sq_norms = np.empty(0, dtype=np.float32)
+        self._user_ids = np.empty(0, dtype=np.int64)
+        self._group_ids = np.empty(0, dtype=np.int64)
+        self._scopes = {}
+        self._ivf = None
+        self._codes = None
+        self._per_user = 1
+        self._built_at = None
+        self._refresh_seconds = refresh_seconds
+
+    @property
+    def refresh_seconds(self):
+        if self._refresh_seconds is not None:
+            return self._refresh_seconds
+        return getattr(settings, "FACE_INDEX_REFRESH_SECONDS", 60)
+
+    def __len__(self):
+        return len(self._user_ids)
+
+    def _use_ivf(self, size):
+        engine = getattr(settings, "FACE_INDEX_ENGINE", "exact")
+        return engine == "ivf" and size >= getattr(settings, "FACE_IVF_MIN_SIZE", 20000)
+
+    def _train_ivf(self, matrix):
+        if not self._use_ivf(len(matrix)):
+            return None
+        nlist = getattr(settings, "FACE_IVF_NLIST", None) or int(math.sqrt(len(matrix)))
+        return IVFQuantizer.train(matrix, max(1, min(nlist, len(matrix))))
+
+    # کپی int8 فقط در موتور int8 ساخته می‌شود
+    def _quantize(self, matrix):
+        if getattr(settings, "FACE_INDEX_ENGINE", "exact") != "int8":
+            return None
+        return Int8Codes(matrix)
+
+    # ساخت دوباره ماتریس از پایگاه داده؛ هر الگوی کاربر یک سطر است
+    def build(self):
+        User = get_user_model()
+        rows = User.objects.exclude(face_encoding__isnull=True).values_list(
+            "id", "face_encoding", "face_templates", "group_id"
+        )
+        ids = []
+        groups = []
+        blocks = []
+        for user_id, raw, raw_templates, group_id in rows:
+            templates = load_templates(raw_templates, raw)
+            if not len(templates):
+                continue
+            ids.extend([user_id] * len(templates))
+            groups.extend([NO_GROUP if group_id is None else group_id] * len(templates))
+            blocks.append(templates)
+        matrix = (
+            np.vstack(blocks)
+            if blocks
+            else np.empty((0, EMBEDDING_SIZE), dtype=np.float32)
+        )
+        self.load(np.array(ids, dtype=np.int64), matrix, np.array(groups, dtype=np.int64))
+
+    # جایگزینی کل محتوای ایندکس با سطرهای داده‌شده (ساخت از پایگاه داده یا گالری مصنوعی سنجش)
+    def load(self, user_ids, matrix, group_ids=None):
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        if group_ids is None:
+            group_ids = np.full(len(user_ids), NO_GROUP, dtype=np.int64)
+        ivf = self._train_ivf(matrix)
+        codes = self._quantize(matrix)
+        with self._lock:
+            self._matrix = matrix
+            self._sq_norms = np.einsum("ij,ij->i", matrix, matrix)
+            self._user_ids = user_ids
+            self._group_ids = group_ids
+            self._scopes = {}
+            self._ivf = ivf
+            self._codes = codes
+            self._per_user = _templates_per_user(user_ids)
+            self._built_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def _stale(self):
+        built_at = self._built_at
+        return built_at is None or time.monotonic() - built_at > self.refresh_seconds
+
+    # ساخت اول همه درخواست‌ها را تا آماده شدن ایندکس نگه می‌دارد؛ در تازه‌سازی دوره‌ای فقط
+    # یک درخواست می‌سازد و بقیه تا جایگزینی با ایندکس قبلی جستجو می‌کنند
+    def _ensure_built(self):
+        if not self._stale():
+            return
+        if self._built_at is None:
+            with self._build_lock:
+                if self._stale():
+                    self.build()
+            return
+        if self._build_lock.acquire(blocking=False):
+            try:
+                if self._stale():
+                    self.build()
+            finally:
+                self._build_lock.release()
+
+    # جایگزینی الگوهای یک کاربر (یک بردار یا ماتریس K×128)
+    def update(self, user_id, encoding):
+        if encoding is None:
+            self.remove(user_id)
+            return
+        if self._built_at is None:
+            return
+        vectors = np.asarray(encoding, dtype=np.float32).reshape(-1, EMBEDDING_SIZE)
+        group_id = (
+            get_user_model().objects.filter(pk=user_id).values_list("group_id", flat=True).first()
+        )
+        with self._lock:
+            if self._built_at is None:
+                return
+            keep = self._user_ids != user_id
+            ivf = self._ivf
+            self._matrix = np.vstack([self._matrix[keep], vectors])
+            self._sq_norms = np.concatenate(
+                [self._sq_norms[keep], np.einsum("ij,ij->i", vectors, vectors)]
+            )
+            self._user_ids = np.concatenate(
+                [self._user_ids[keep], np.full(len(vectors), user_id, dtype=np.int64)]
+            )
+            self._group_ids = np.concatenate(
+                [
+                    self._group_ids[keep],
+                    np.full(len(vectors), NO_GROUP if group_id is None else group_id, dtype=np.int64),
+                ]
+            )
+            self._scopes = {}
+            self._per_user = max(self._per_user, len(vectors))
+            if self._codes is not None:
+                self._codes = self._codes.with_rows(keep, vectors, self._matrix)
+            if ivf is not None:
+                cells, spread = ivf.assign(vectors)
+                self._ivf = ivf.with_rows(
+                    np.concatenate([ivf.cells[keep], cells]),
+                    np.concatenate([ivf.spread[keep], spread]),
+                )
+
+    # حذف همه الگوهای کاربر از ایندکس
+    def remove(self, user_id):
+        with self._lock:
+            keep = self._user_ids != user_id
+            if keep.all():
+                return
+            self._matrix = self._matrix[keep]
+            self._sq_norms = self._sq_norms[keep]
+            self._user_ids = self._user_ids[keep]
+            self._group_ids = self._group_ids[keep]
+            self._scopes = {}
+            if self._codes is not None:
+                self._codes = self._codes.with_rows(keep, self._matrix[:0], self._matrix)
+            if self._ivf is not None:
+                self._ivf = self._ivf.with_rows(
+                    self._ivf.cells[keep], self._ivf.spread[keep]
+                )
+
+    # سطرهای گروه‌های یک دستگاه؛ یک بار جدا و تا تغییر بعدی ایندکس نگه داشته می‌شوند
+    def _scope(self, groups):
+        key = frozenset(groups)
+        with self._lock:
+            scope = self._scopes.get(key)
+            if scope is not None:
+                return scope
+            matrix = self._matrix
+            sq_norms = self._sq_norms
+            user_ids = self._user_ids
+            group_ids = self._group_ids
+        rows = np.flatnonzero(np.isin(group_ids, list(key)))
+        scope = (np.ascontiguousarray(matrix[rows]), sq_norms[rows], user_ids[rows])
+        with self._lock:
+            if self._matrix is matrix:
+                self._scopes[key] = scope
+        return scope
+
+    # جستجوی دقیق فقط در گالری گروه‌های دستگاه؛ زیرمجموعه کوچک است و IVF لازم ندارد
+    def _match_scoped(self, probes, groups, k):
+        matrix, sq_norms, user_ids = self._scope(groups)
+        if not len(user_ids):
+            return [[] for _ in probes]
+        rows = np.arange(len(user_ids))
+        return [
+            _rerank(matrix, user_ids, probe, rows, _sq_distances(matrix, sq_norms, probe), k, self._per_user)
+            for probe in probes
+        ]
+
+    # یافتن نزدیک‌ترین کاربران به بردار ورودی؛ groups جستجو را به کاربران آن گروه‌ها محدود می‌کند
+    def match(self, encoding, k=2, radius=None, groups=None):
+        self._ensure_built()
+        if groups is not None:
+            return self._match_scoped([np.asarray(encoding, dtype=np.float32)], groups, k)[0]
+        with self._lock:
+            matrix = self._matrix
+            sq_norms = self._sq_norms
+            user_ids = self._user_ids
+            ivf = self._ivf
+            codes = self._codes
+            per_user = self._per_user
+        if not len(user_ids):
+            return []
+        probe = np.asarray(encoding, dtype=np.float32)
+        if ivf is not None:
+            rows, d2 = ivf.search(
+                matrix,
+                sq_norms,
+                probe,
+                nprobe=getattr(settings, "FACE_IVF_NPROBE", 8),
+                radius=radius,
+                guard=getattr(settings, "FACE_IVF_GUARD", True),
+            )
+        elif codes is not None:
+            rows = np.arange(len(user_ids))
+            d2 = codes.sq_distances(probe[None, :])[0]
+        else:
+            rows = np.arange(len(user_ids))
+            d2 = _sq_distances(matrix, sq_norms, probe)
+        return _rerank(matrix, user_ids, probe, rows, d2, k, per_user)
+
+    # جستجوی هم‌زمان چند بردار با یک ضرب ماتریسی روی کل گالری
+    def match_many(self, encodings, k=2, radius=None, groups=None):
+        self._ensure_built()
+        if groups is not None:
+            probes = np.asarray(encodings, dtype=np.float32).reshape(-1, EMBEDDING_SIZE)
+            return self._match_scoped(probes, groups, k)
+        with self._lock:
+            matrix = self._matrix
+            sq_norms = self._sq_norms
+            user_ids = self._user_ids
+            ivf = self._ivf
+            codes = self._codes
+            per_user = self._per_user
+        if ivf is not None:
+            return [self.match(enc, k=k, radius=radius) for enc in encodings]
+        if not len(user_ids):
+            return [[] for _ in encodings]
+        probes = np.asarray(encodings, dtype=np.float32).reshape(-1, EMBEDDING_SIZE)
+        if codes is not None:
+            d2 = codes.sq_distances(probes)
+        else:
+            probe_sq = np.einsum("ij,ij->i", probes, probes)
+            d2 = np.maximum(
+                sq_norms[None, :] - 2 * (probes @ matrix.T) + probe_sq[:, None], 0
+            )
+        rows = np.arange(len(user_ids))
+        return [
+            _rerank(matrix, user_ids, probe, rows, row_d2, k, per_user)
+            for probe, row_d2 in zip(probes, d2)
+        ]
+
+face_index = FaceIndex()
@@ -0,0 +1,531 @@
+import base64
+import io
+import json
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import face_recognition
+import numpy as np
+from PIL import Image
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import UploadedFile
+
+from attendance.models import SuspiciousLog
+
+from .face_batch import MicroBatcher
+from .face_cache import MISSING, encoding_cache
+from .face_client import InferenceError
+from .face_gallery import (
+    add_template,
+    apply_templates,
+    build_templates,
+    embedding_model,
+    embedding_profile,
+    min_distance,
+    user_templates,
+)
+from .face_index import face_index
+from .face_registry import inference as _inference, update_face_index
+from .face_timing import timed
+
+FACE_DISTANCE_THRESHOLD = 0.5
+LIVENESS_MOVEMENT_THRESHOLD = 0.08
+MATCH_SAVE_DISTANCE = 0.6
+
+# تنظیمات استخراج بردار سطح سریع؛ سطح کامل همان تنظیمات نسخه مدل فعال گالری است
+# (FACE_EMBEDDING_MODELS) تا بردار لحظه‌ای و گالری همیشه یکسان استخراج شوند
+FACE_ENCODE_PROFILES = {
+    "fast": {"num_jitters": 1, "model": "small"},
+}
+
+def _encode_profile(quality):
+    if quality != "full":
+        return FACE_ENCODE_PROFILES[quality]
+    profile = embedding_profile()
+    if profile is None:
+        raise ImproperlyConfigured(
+            f"FACE_EMBEDDING_MODELS has no encode profile for {embedding_model()!r}"
+        )
+    return profile
+
+_face_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "FACE_ENCODE_WORKERS", 4),
+    thread_name_prefix="face-encode",
+)
+
+# جدا کردن داده و قالب تصویر از data URL
+def _decode_data_url(data_url: str):
+
+    if "," in data_url:
+        header, b64data = data_url.split(",", 1)
+        fmt = header.split(";")[0].split("/")[1]
+    else:
+        b64data = data_url
+        fmt = "png"
+    return base64.b64decode(b64data), fmt
+
+# رمزگشایی سریع تصویر؛ JPEG در مرحله DCT با وضوح کمتر باز می‌شود
+def _decode_image_fast(img_bytes: bytes):
+
+    img = Image.open(io.BytesIO(img_bytes))
+    max_side = getattr(settings, "FACE_DECODE_MAX_SIDE", 640)
+    if img.format == "JPEG" and max(img.size) > max_side:
+        scale = max_side / max(img.size)
+        img.draft("RGB", (int(img.size[0] * scale), int(img.size[1] * scale)))
+    return np.asarray(img.convert("RGB"))
+
+# آشکارساز آبشاری OpenCV برای هر رشته
+_cascade_local = threading.local()
+
+def _cascade_face_locations(rgb):
+
+    import cv2
+
+    classifier = getattr(_cascade_local, "classifier", None)
+    if classifier is None:
+        classifier = cv2.CascadeClassifier(
+            cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+        )
+        _cascade_local.classifier = classifier
+    gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+    faces = classifier.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5)
+    return [(int(y), int(x + w), int(y + h), int(x)) for (x, y, w, h) in faces]
+
+# یافتن بزرگ‌ترین چهره روی نسخه کوچک‌شده و برگرداندن کادر در مقیاس اصلی
+def _detect_face_box(rgb):
+
+    height, width = rgb.shape[:2]
+    max_side = getattr(settings, "FACE_DETECT_MAX_SIDE", 320)
+    factor = max(1, math.ceil(max(height, width) / max_side))
+    small = np.ascontiguousarray(rgb[::factor, ::factor])
+    if getattr(settings, "FACE_DETECTOR", "hog") == "cascade":
+        boxes = _cascade_face_locations(small)
+    else:
+        boxes = face_recognition.face_locations(
+            small,
+            number_of_times_to_upsample=getattr(settings, "FACE_DETECT_UPSAMPLE", 0),
+            model="hog",
+        )
+    if not boxes:
+        return None
+    top, right, bottom, left = max(boxes, key=lambda b: (b[2] - b[0]) * (b[1] - b[3]))
+    return (
+        max(top * factor, 0),
+        min(right * factor, width),
+        min(bottom * factor, height),
+        max(left * factor, 0),
+    )
+
+# محدود کردن کادر چهره به ابعاد تصویر
+def _clamp_box(box, shape):
+
+    height, width = shape[:2]
+    top, right, bottom, left = box
+    top, bottom = max(0, min(top, height)), max(0, min(bottom, height))
+    left, right = max(0, min(left, width)), max(0, min(right, width))
+    if bottom - top < 20 or right - left < 20:
+        return None
+    return top, right, bottom, left
+
+# استخراج بردار چهره از بایت‌های تصویر؛ با کادر معلوم، مرحله تشخیص حذف می‌شود
+def get_face_encoding_from_bytes(img_bytes: bytes, quality: str = "full", box=None, profile=None):
+
+    params = profile or _encode_profile(quality)
+    try:
+        if box is not None:
+            rgb = np.asarray(Image.open(io.BytesIO(img_bytes)).convert("RGB"))
+            box = _clamp_box(box, rgb.shape)
+            if box is None:
+                return None
+            encs = face_recognition.face_encodings(
+                rgb, known_face_locations=[box], **params
+            )
+        elif getattr(settings, "FACE_FAST_FRONTEND", False):
+            rgb = _decode_image_fast(img_bytes)
+            box = _detect_face_box(rgb)
+            if box is None:
+                return None
+            encs = face_recognition.face_encodings(
+                rgb, known_face_locations=[box], **params
+            )
+        else:
+            img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
+            encs = face_recognition.face_encodings(
+                np.array(img), **params
+            )
+        return encs[0] if encs else None
+    except Exception as e:
+        print("Face encode error:", e)
+        return None
+
+# تبدیل کادر ارسالی کیوسک به (top, right, bottom, left)
+def _parse_face_box(value):
+
+    if not value:
+        return None
+    try:
+        if isinstance(value, str):
+            value = value.split(",")
+        box = tuple(int(float(v)) for v in value)
+    except (TypeError, ValueError):
+        return None
+    if len(box) != 4 or box[2] <= box[0] or box[1] <= box[3]:
+        return None
+    return box
+
+# خواندن دو فریم و کادر چهره آن‌ها از بدنه JSON، فرم یا فایل‌های multipart
+def read_frame_sources(request):
+
+    if request.content_type == "application/json":
+        data = json.loads(request.body)
+        images = data.get("image1"), data.get("image2")
+        raw_boxes = data.get("box1"), data.get("box2")
+    else:
+        images = tuple(
+            request.FILES.get(name) or request.POST.get(name)
+            for name in ("image1", "image2")
+        )
+        raw_boxes = request.POST.get("box1"), request.POST.get("box2")
+    boxes = (None, None)
+    if getattr(settings, "FACE_TRUST_CLIENT_BOX", False):
+        boxes = tuple(_parse_face_box(b) for b in raw_boxes)
+    return images[0], images[1], boxes
+
+# یک فریم جریان زنده‌سنجی: شناسه جریان، فریم و کادر چهره
+def read_stream_frame(request):
+
+    if request.content_type == "application/json":
+        data = json.loads(request.body)
+        stream_id, image, raw_box = data.get("stream"), data.get("frame"), data.get("box")
+    else:
+        stream_id = request.POST.get("stream")
+        image = request.FILES.get("frame") or request.POST.get("frame")
+        raw_box = request.POST.get("box")
+    box = None
+    if getattr(settings, "FACE_TRUST_CLIENT_BOX", False):
+        box = _parse_face_box(raw_box)
+    return stream_id, image, box
+
+# ضبط‌های صف آفلاین کیوسک: (شناسه، زمان کلاینت، فریم اول، فریم دوم، کادرها) به ترتیب ارسال؛
+# در multipart فرادادهٔ captures به ترتیب فایل‌های image1 و image2 است
+def read_capture_batch(request):
+
+    limit = getattr(settings, "FACE_BATCH_MAX_CAPTURES", 20)
+    if request.content_type == "application/json":
+        captures = json.loads(request.body).get("captures") or []
+        images1 = [c.get("image1") for c in captures]
+        images2 = [c.get("image2") for c in captures]
+    else:
+        captures = json.loads(request.POST.get("captures") or "[]")
+        images1 = request.FILES.getlist("image1")
+        images2 = request.FILES.getlist("image2")
+    if not isinstance(captures, list) or not len(captures) == len(images1) == len(images2):
+        return None
+    trust_box = getattr(settings, "FACE_TRUST_CLIENT_BOX", False)
+    batch = []
+    for meta, img1, img2 in zip(captures[:limit], images1, images2):
+        boxes = (None, None)
+        if trust_box:
+            boxes = (_parse_face_box(meta.get("box1")), _parse_face_box(meta.get("box2")))
+        batch.append((str(meta.get("id") or "")[:64], meta.get("ts"), img1, img2, boxes))
+    return batch
+
+# فریم‌های اضافه یک نوبت ثبت چهره (frames) برای ساخت گالری الگوها
+def read_burst_frames(request):
+
+    limit = getattr(settings, "FACE_ENROLL_MAX_FRAMES", 8)
+    if request.content_type == "application/json":
+        frames = json.loads(request.body).get("frames") or []
+    else:
+        frames = request.FILES.getlist("frames") or request.POST.getlist("frames")
+    return list(frames)[:limit]
+
+# رمزگشایی یک فریم از data URL یا فایل آپلودشده
+def decode_frame(data_url):
+
+    if isinstance(data_url, UploadedFile):
+        content_type = data_url.content_type or "image/jpeg"
+        return data_url.read(), content_type.split("/")[-1]
+    if not data_url or ',' not in data_url:
+        return None
+    try:
+        return _decode_data_url(data_url)
+    except Exception as e:
+        print("Face decode error:", e)
+        return None
+
+# کلید حافظه نهان بردار برای یک تصویر و تنظیمات استخراج
+def _encoding_cache_key(img_bytes: bytes, quality: str, box=None):
+
+    return encoding_cache.key(
+        img_bytes,
+        quality,
+        box,
+        embedding_model(),
+        getattr(settings, "FACE_FAST_FRONTEND", False),
+        getattr(settings, "FACE_DECODE_MAX_SIDE", 640),
+        getattr(settings, "FACE_DETECT_MAX_SIDE", 320),
+        getattr(settings, "FACE_DETECTOR", "hog"),
+        getattr(settings, "FACE_DETECT_UPSAMPLE", 0),
+    )
+
+# استخراج هم‌زمان بردار چند تصویر در سرویس استنتاج یا رشته‌های مشترک
+def _encode_images(images, quality: str, boxes):
+
+    if _inference is not None:
+        try:
+            return _inference.encode(images, quality, boxes)
+        except InferenceError as e:
+            print("Inference service error:", e)
+    futures = [
+        _face_executor.submit(get_face_encoding_from_bytes, img, quality, box)
+        for img, box in zip(images[1:], boxes[1:])
+    ]
+    first = get_face_encoding_from_bytes(images[0], quality, boxes[0])
+    return [first] + [f.result() for f in futures]
+
+# استخراج بردار تصاویر با عبور از حافظه نهان؛ تصاویر تکراری فقط یک بار پردازش می‌شوند
+def _encode_images_cached(images, quality: str, boxes):
+
+    keys = [_encoding_cache_key(img, quality, box) for img, box in zip(images, boxes)]
+    results = {}
+    pending = {}
+    for key, img, box in zip(keys, images, boxes):
+        if key in results or key in pending:
+            continue
+        cached = encoding_cache.get(key)
+        if cached is MISSING:
+            pending[key] = (img, box)
+        else:
+            results[key] = cached
+    if pending:
+        todo = list(pending.items())
+        if _encode_batcher is not None:
+            futures = [
+                _encode_batcher.submit((img, quality, box)) for _, (img, box) in todo
+            ]
+            encoded = [f.result() for f in futures]
+        else:
+            encoded = _encode_images(
+                [img for _, (img, _) in todo], quality, [box for _, (_, box) in todo]
+            )
+        for (key, _), enc in zip(todo, encoded):
+            encoding_cache.put(key, enc)
+            results[key] = enc
+    return [results[key] for key in keys]
+
+# رمزگشایی یک فریم و استخراج بردار آن
+def _process_frame(data_url, quality: str = "full"):
+
+    frame = decode_frame(data_url)
+    if frame is None:
+        return None, None
+    return frame, _encode_images_cached([frame[0]], quality, [None])[0]
+
+# استخراج بردار چهره از رشته base64
+def _get_face_encoding_from_base64(data_url: str):
+    return _process_frame(data_url)[1]
+
+# استخراج هم‌زمان بردار دو فریم رمزگشایی‌شده؛ dlib در حین محاسبه GIL را آزاد می‌کند
+def _encode_frame_pair(frame1, frame2, quality: str = "full", boxes=(None, None)):
+
+    if frame1 is None or frame2 is None:
+        return None, None
+    enc1, enc2 = _encode_images_cached([frame1[0], frame2[0]], quality, list(boxes))
+    return enc1, enc2
+
+# پردازش هم‌زمان دو فریم زنده‌سنجی
+def process_frame_pair(img1, img2, quality: str = "full", boxes=(None, None)):
+
+    frame1, frame2 = decode_frame(img1), decode_frame(img2)
+    enc1, enc2 = _encode_frame_pair(frame1, frame2, quality, boxes)
+    return (frame1, enc1), (frame2, enc2)
+
+# یافتن نزدیک‌ترین کاربران برای چند بردار چهره (groups: محدوده گالری دستگاه)
+def _match_faces(encs, groups=None):
+
+    if _inference is not None:
+        try:
+            return [
+                _inference.match(enc, radius=MATCH_SAVE_DISTANCE, groups=groups) for enc in encs
+            ]
+        except InferenceError as e:
+            print("Inference service error:", e)
+    return face_index.match_many(encs, radius=MATCH_SAVE_DISTANCE, groups=groups)
+
+# یافتن نزدیک‌ترین کاربران به بردار چهره؛ جستجوی محدود به گروه‌ها از دسته‌بندی عبور نمی‌کند
+def _match_face(enc, groups=None):
+
+    if _match_batcher is not None and groups is None:
+        return _match_batcher(enc)
+    return _match_faces([enc], groups)[0]
+
+# استخراج یک دسته تصویر از درخواست‌های هم‌زمان به تفکیک سطح کیفیت
+def _encode_batch(items):
+
+    results = [None] * len(items)
+    by_quality = {}
+    for i, (_, quality, _) in enumerate(items):
+        by_quality.setdefault(quality, []).append(i)
+    for quality, indexes in by_quality.items():
+        encoded = _encode_images(
+            [items[i][0] for i in indexes], quality, [items[i][2] for i in indexes]
+        )
+        for i, enc in zip(indexes, encoded):
+            results[i] = enc
+    return results
+
+_encode_batcher = _match_batcher = None
+if getattr(settings, "FACE_BATCH_ENABLED", False):
+    _encode_batcher = MicroBatcher(
+        _encode_batch,
+        max_size=getattr(settings, "FACE_BATCH_MAX_SIZE", 16),
+        max_wait=getattr(settings, "FACE_BATCH_MAX_WAIT_MS", 5) / 1000,
+        workers=getattr(settings, "FACE_ENCODE_WORKERS", 4),
+        name="face-encode-batch",
+    )
+    _match_batcher = MicroBatcher(
+        _match_faces,
+        max_size=getattr(settings, "FACE_BATCH_MAX_SIZE", 16),
+        max_wait=getattr(settings, "FACE_BATCH_MAX_WAIT_MS", 5) / 1000,
+        name="face-match-batch",
+    )
+
+# آموزش دوباره بردار کاربر با تصویر لاگ مشکوک تأییدشده در پس‌زمینه
+def train_from_suspicious_log(log_id):
+
+    log = SuspiciousLog.objects.select_related("matched_user").filter(pk=log_id).first()
+    if not log or not log.matched_user or not log.image:
+        return
+    u = log.matched_user
+    try:
+        # همان پروفایل استخراج ثبت چهره تا الگو با نسخه مدل برچسبش (face_model) ساخته شده باشد
+        with log.image.open('rb') as f:
+            image_bytes = f.read()
+        enc = get_face_encoding_from_bytes(image_bytes, "full")
+        if enc is not None:
+            templates = add_template(user_templates(u), enc)
+            apply_templates(u, templates)
+            if not u.face_image:
+                u.face_image.save(os.path.basename(log.image.name), ContentFile(image_bytes), save=False)
+            u.save(update_fields=["face_encoding", "face_templates", "face_model", "face_image"])
+            update_face_index(u.pk, templates)
+    except Exception as e:
+        print("Suspicious training error:", e)
+
+# استخراج بردار دو فریم و جستجوی کاربر با یک سطح کیفیت
+def _encode_and_match(frame1, frame2, quality: str, boxes=(None, None), timer=None, groups=None):
+
+    with timed(timer, "encode"):
+        enc1, enc2 = _encode_frame_pair(frame1, frame2, quality, boxes)
+    if enc1 is None or enc2 is None:
+        return enc1, enc2, []
+    with timed(timer, "match"):
+        return enc1, enc2, _match_face((enc1 + enc2) / 2, groups)
+
+# نزدیک بودن نتیجه سطح سریع به یکی از آستانه‌های تصمیم
+def _is_borderline(enc1, enc2, candidates):
+
+    margin = getattr(settings, "FACE_CASCADE_MARGIN", 0.06)
+    movement = np.linalg.norm(enc1 - enc2)
+    if abs(movement - LIVENESS_MOVEMENT_THRESHOLD) < margin:
+        return True
+    if not candidates:
+        return False
+    best_dist = candidates[0][1]
+    return any(
+        abs(best_dist - limit) < margin
+        for limit in (FACE_DISTANCE_THRESHOLD, MATCH_SAVE_DISTANCE)
+    )
+
+# استخراج بردار، سطح آبشاری و بررسی زنده‌بودن فریم‌های کیوسک (groups: گروه‌های مجاز دستگاه)
+def verify_frames(img1, img2, boxes, timer=None, groups=None):
+
+    with timed(timer, "decode"):
+        frame1, frame2 = decode_frame(img1), decode_frame(img2)
+    tier = "fast" if getattr(settings, "FACE_CASCADE_ENABLED", False) else "full"
+    enc1, enc2, candidates = _encode_and_match(frame1, frame2, tier, boxes, timer, groups)
+    if tier == "fast" and enc1 is not None and enc2 is not None:
+        if _is_borderline(enc1, enc2, candidates):
+            tier = "full"
+            enc1, enc2, candidates = _encode_and_match(frame1, frame2, tier, boxes, timer, groups)
+    if enc1 is None or enc2 is None:
+        return tier, frame1, None, "چهره به‌وضوح دیده نشد. لطفاً روبه‌رو و در نور کافی قرار بگیرید."
+    movement = np.linalg.norm(enc1 - enc2)
+    if movement < LIVENESS_MOVEMENT_THRESHOLD:
+        return tier, frame1, None, "حرکت تشخیص داده نشد. لطفاً دستور روی صفحه را اجرا کنید."
+    return tier, frame1, candidates, None
+
+# بررسی یک دسته جفت‌فریم (صف آفلاین) با یک نوبت استخراج و یک جستجوی گالری برای همه؛
+# خروجی هر جفت: (فریم اول، کاندیدها، خطا) با خطای "no_face" یا "no_movement"
+def verify_frame_batch(pairs, timer=None, groups=None):
+
+    with timed(timer, "decode"):
+        frames = [(decode_frame(img1), decode_frame(img2)) for img1, img2, _ in pairs]
+    images, boxes, slots = [], [], []
+    for (frame1, frame2), (_, _, pair_boxes) in zip(frames, pairs):
+        if frame1 is None or frame2 is None:
+            slots.append(None)
+            continue
+        slots.append(len(images))
+        images += [frame1[0], frame2[0]]
+        boxes += list(pair_boxes)
+    with timed(timer, "encode"):
+        encodings = _encode_images_cached(images, "full", boxes) if images else []
+
+    verdicts, probes = [], []
+    for (frame1, _), slot in zip(frames, slots):
+        enc1, enc2 = (encodings[slot], encodings[slot + 1]) if slot is not None else (None, None)
+        if enc1 is None or enc2 is None:
+            verdicts.append((frame1, None, "no_face"))
+        elif np.linalg.norm(enc1 - enc2) < LIVENESS_MOVEMENT_THRESHOLD:
+            verdicts.append((frame1, None, "no_movement"))
+        else:
+            verdicts.append((frame1, len(probes), None))
+            probes.append((enc1 + enc2) / 2)
+    with timed(timer, "match"):
+        matches = _match_faces(probes, groups) if probes else []
+    return [
+        (frame1, matches[probe] if error is None else None, error)
+        for frame1, probe, error in verdicts
+    ]
+
+# بردار میانگین دو فریم زنده‌سنجی؛ خطا: "no_face" یا "no_movement"
+def pair_encoding(img1, img2, boxes=(None, None), timer=None):
+
+    with timed(timer, "decode"):
+        frame1, frame2 = decode_frame(img1), decode_frame(img2)
+    with timed(timer, "encode"):
+        enc1, enc2 = _encode_frame_pair(frame1, frame2, "full", boxes)
+    if enc1 is None or enc2 is None:
+        return None, "no_face"
+    movement = np.linalg.norm(enc1 - enc2)
+    if movement < LIVENESS_MOVEMENT_THRESHOLD:
+        return None, "no_movement"
+    return (enc1 + enc2) / 2, None
+
+# فاصله بردار تا نزدیک‌ترین الگوی ثبت‌شده کاربر (تأیید چهره مدیر)
+def user_distance(user, encoding):
+    return min_distance(user_templates(user), encoding)
+
+# ساخت گالری الگوهای چهره از دو فریم زنده‌سنجی و فریم‌های اضافه ثبت‌نام
+def enroll_templates(request):
+
+    img1, img2, boxes = read_frame_sources(request)
+    if not img1 or not img2:
+        return None, None, "ارسال ناقص تصاویر."
+    (frame1, enc1), (_, enc2) = process_frame_pair(img1, img2, boxes=boxes)
+    if enc1 is None or enc2 is None:
+        return None, None, "چهره واضح نیست."
+    if np.linalg.norm(enc1 - enc2) < LIVENESS_MOVEMENT_THRESHOLD:
+        return None, None, "حرکت تشخیص داده نشد."
+    encodings = [enc1, enc2]
+    burst = [f for f in map(decode_frame, read_burst_frames(request)) if f is not None]
+    if burst:
+        encoded = _encode_images_cached([f[0] for f in burst], "full", [None] * len(burst))
+        encodings.extend(enc for enc in encoded if enc is not None)
+    return frame1, build_templates(encodings), None
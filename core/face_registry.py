@@ -0,0 +1,29 @@
+from django.contrib.auth import get_user_model
+
+from .face_client import InferenceError, get_client
+from .face_gallery import load_templates
+from .face_index import face_index
+
+# کلاینت سرویس استنتاج در صورت تنظیم FACE_INFERENCE_SOCKET
+inference = get_client()
+
+# به‌روزرسانی ایندکس محلی و سرویس استنتاج پس از تغییر الگوهای کاربر
+def update_face_index(user_id, encoding):
+
+    face_index.update(user_id, encoding)
+    if inference is not None:
+        try:
+            inference.update(user_id, encoding)
+        except InferenceError as e:
+            print("Inference service error:", e)
+
+# بارگذاری دوباره سطرهای چند کاربر پس از تغییر گروه تا جستجوی محدود به گروه دستگاه به‌روز بماند
+def refresh_face_index(user_ids):
+
+    rows = (
+        get_user_model().objects.filter(id__in=list(user_ids))
+        .exclude(face_encoding__isnull=True)
+        .values_list("id", "face_templates", "face_encoding")
+    )
+    for user_id, raw_templates, raw in rows:
+        update_face_index(user_id, load_templates(raw_templates, raw))
@@ -0,0 +1,103 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+from .face_pipeline import (
+    LIVENESS_MOVEMENT_THRESHOLD,
+    MATCH_SAVE_DISTANCE,
+    _encode_and_match,
+    _encode_images_cached,
+    _is_borderline,
+    _match_face,
+    decode_frame,
+)
+from .face_timing import timed
+
+NO_FACE_MSG = "چهره به‌وضوح دیده نشد. لطفاً روبه‌رو و در نور کافی قرار بگیرید."
+NO_MOVEMENT_MSG = "حرکت تشخیص داده نشد. لطفاً دستور روی صفحه را اجرا کنید."
+TIMEOUT_MSG = "زمان بررسی به پایان رسید. لطفاً دوباره تلاش کنید."
+
+# جریان‌های زنده‌سنجی کیوسک‌ها در حافظه نهان مشترک (FACE_STREAM_CACHE) تا فریم‌های یک کیوسک
+# در هر فرایندی که برسند به همان جریان بخورند؛ هر فریم همان لحظه بررسی می‌شود و پاسخ نهایی
+# به محض ثبت حرکت کافی نسبت به فریم مرجع (اولین فریم چهره‌دار) داده می‌شود.
+# کانال جریانی جدا (WebSocket) در این پروژه نیست؛ هر فریم یک POST است
+class StreamSessions:
+
+    @property
+    def ttl(self):
+        return getattr(settings, "FACE_STREAM_TTL_SECONDS", 8)
+
+    @property
+    def max_frames(self):
+        return getattr(settings, "FACE_STREAM_MAX_FRAMES", 20)
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, "FACE_STREAM_CACHE", "default")]
+
+    def _key(self, stream_id, device_id):
+        return f"face-stream:{device_id}:{stream_id}"
+
+    # وضعیت جریان موجود یا جریان تازه با یک فریم بیشتر
+    def _get(self, key):
+        state = self.cache.get(key)
+        if state is None:
+            state = {"started": time.time(), "frames": 0, "anchor": None, "anchor_enc": None, "anchor_box": None}
+        state["frames"] += 1
+        return state
+
+    def _save(self, key, state):
+        remaining = self.ttl - (time.time() - state["started"])
+        if remaining > 0:
+            self.cache.set(key, state, timeout=remaining)
+
+    # پردازش یک فریم؛ خروجی (وضعیت، سطح، فریم مرجع، کاندیدها، پیام)
+    # وضعیت: "pending" (پیام: no_face یا move)، "done" یا "failed"
+    def push(self, stream_id, device_id, img, box=None, groups=None, timer=None):
+        with timed(timer, "decode"):
+            frame = decode_frame(img)
+        if frame is None:
+            return "failed", None, None, None, "ارسال ناقص تصاویر."
+        tier = "fast" if getattr(settings, "FACE_CASCADE_ENABLED", False) else "full"
+        with timed(timer, "encode"):
+            enc = _encode_images_cached([frame[0]], tier, [box])[0]
+
+        key = self._key(stream_id, device_id)
+        stream = self._get(key)
+        if stream["frames"] > self.max_frames or time.time() - stream["started"] > self.ttl:
+            self.cache.delete(key)
+            return "failed", tier, None, None, TIMEOUT_MSG
+        if enc is None:
+            self._save(key, stream)
+            return "pending", tier, None, None, "no_face"
+
+        # فاصله زیاد با مرجع یعنی فرد دیگری جلوی دوربین آمده است
+        movement = None
+        if stream["anchor_enc"] is not None:
+            movement = float(np.linalg.norm(enc - stream["anchor_enc"]))
+        if movement is None or movement >= MATCH_SAVE_DISTANCE:
+            stream.update(anchor=frame, anchor_enc=enc, anchor_box=box)
+            self._save(key, stream)
+            return "pending", tier, None, None, "move"
+        if movement < LIVENESS_MOVEMENT_THRESHOLD:
+            self._save(key, stream)
+            return "pending", tier, None, None, "move"
+
+        self.cache.delete(key)
+        anchor, anchor_enc = stream["anchor"], stream["anchor_enc"]
+        with timed(timer, "match"):
+            candidates = _match_face((anchor_enc + enc) / 2, groups)
+        if tier == "fast" and _is_borderline(anchor_enc, enc, candidates):
+            tier = "full"
+            enc1, enc2, candidates = _encode_and_match(
+                anchor, frame, tier, (stream["anchor_box"], box), timer, groups
+            )
+            if enc1 is None or enc2 is None:
+                return "failed", tier, anchor, None, NO_FACE_MSG
+            if np.linalg.norm(enc1 - enc2) < LIVENESS_MOVEMENT_THRESHOLD:
+                return "failed", tier, anchor, None, NO_MOVEMENT_MSG
+        return "done", tier, anchor, candidates, None
+
+stream_sessions = StreamSessions()
@@ -0,0 +1,120 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+from django.conf import settings
+
+# زمان‌سنج مراحل یک درخواست چهره؛ مرحله‌های هم‌نام جمع می‌شوند (مثلاً استخراج دوباره در سطح کامل)
+class StageTimer:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    # مقدار هدر Server-Timing بر حسب میلی‌ثانیه
+    def header(self, total):
+        items = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        items.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(items)
+
+# زمان‌گیری اختیاری؛ بدون زمان‌سنج هیچ کاری انجام نمی‌شود
+def timed(timer, name):
+    return timer.stage(name) if timer is not None else nullcontext()
+
+# پنجره غلتان آخرین زمان‌ها برای هر اندپوینت و مرحله
+class LatencyHistogram:
+
+    def __init__(self, window=None):
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._window = window
+
+    @property
+    def window(self):
+        if self._window is not None:
+            return self._window
+        return getattr(settings, "FACE_TIMING_WINDOW", 500)
+
+    def record(self, endpoint, stages, total):
+        with self._lock:
+            by_stage = self._samples.setdefault(endpoint, {})
+            for name, seconds in list(stages.items()) + [("total", total)]:
+                if name not in by_stage:
+                    by_stage[name] = deque(maxlen=self.window)
+                by_stage[name].append(seconds * 1000)
+
+    # صدک‌ها بر حسب میلی‌ثانیه
+    def snapshot(self):
+        with self._lock:
+            copied = {
+                endpoint: {name: sorted(samples) for name, samples in by_stage.items()}
+                for endpoint, by_stage in self._samples.items()
+            }
+        return {
+            endpoint: {
+                name: {
+                    "count": len(values),
+                    "p50_ms": round(_percentile(values, 50), 1),
+                    "p95_ms": round(_percentile(values, 95), 1),
+                    "p99_ms": round(_percentile(values, 99), 1),
+                    "max_ms": round(values[-1], 1),
+                }
+                for name, values in by_stage.items()
+            }
+            for endpoint, by_stage in copied.items()
+        }
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+# صدک به روش نزدیک‌ترین رتبه روی فهرست مرتب
+def _percentile(values, pct):
+    return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+latency_histogram = LatencyHistogram()
+
+def _finish(request, endpoint, response):
+    timer = request.face_timer
+    total = timer.total()
+    latency_histogram.record(endpoint, timer.stages, total)
+    if getattr(settings, "FACE_SERVER_TIMING", True):
+        response["Server-Timing"] = timer.header(total)
+    return response
+
+# دکوراتور زمان‌گیری اندپوینت‌های چهره؛ زمان‌سنج در request.face_timer در دسترس view است
+def face_timed(endpoint):
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                request.face_timer = StageTimer()
+                response = await view(request, *args, **kwargs)
+                return _finish(request, endpoint, response)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            request.face_timer = StageTimer()
+            response = view(request, *args, **kwargs)
+            return _finish(request, endpoint, response)
+        return wrapper
+    return decorator
@@ -11,6 +11,7 @@ from attendance.models import (
     Group,
     Shift,
 )
+from core.models import Device
 
 User = get_user_model()
 
@@ -207,6 +208,25 @@ class ManualLogForm(forms.Form):
             source="manager",
         )
 
+# درون‌ریزی فایل ترددهای سامانه قبلی
+class LogImportForm(forms.Form):
+
+    file = forms.FileField(label="فایل CSV یا NDJSON")
+    format = forms.ChoiceField(
+        choices=[("", "تشخیص از پسوند"), ("csv", "CSV"), ("ndjson", "NDJSON")],
+        required=False,
+        label="قالب",
+    )
+    dry_run = forms.BooleanField(required=False, label="فقط بررسی (بدون ثبت)")
+
+    def clean(self):
+        cleaned = super().clean()
+        upload = cleaned.get("file")
+        if upload and not cleaned.get("format"):
+            name = upload.name.lower()
+            cleaned["format"] = "ndjson" if name.endswith((".ndjson", ".jsonl")) else "csv"
+        return cleaned
+
 # ثبت مرخصی دستی
 class ManualLeaveForm(forms.ModelForm):
 
@@ -319,6 +339,17 @@ class GroupForm(forms.ModelForm):
             "shift": "شیفت",
         }
 
+# فرم دستگاه ثبت تردد
+class DeviceForm(forms.ModelForm):
+    class Meta:
+        model = Device
+        fields = ["name", "groups"]
+        labels = {
+            "name": "نام",
+            "groups": "گروه‌های مجاز",
+        }
+        widgets = {"groups": forms.CheckboxSelectMultiple}
+
 # فرم نوع مرخصی
 class LeaveTypeForm(forms.ModelForm):
     class Meta:
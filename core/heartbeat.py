@@ -0,0 +1,182 @@
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Device
+
+# شناسه و نام دستگاه پیش‌فرض کیوسک
+DEFAULT_DEVICE_ID = 1
+DEFAULT_DEVICE_NAME = "Main device"
+# وضعیت دستگاهی که در پایگاه داده نیست (حذف‌شده)
+UNKNOWN_DEVICE = (None, None)
+
+# ضربان دستگاه در حافظه؛ last_seen حداکثر یک بار در هر بازه در پایگاه داده نوشته می‌شود
+# و وضعیت دستگاه (فعال بودن، گروه‌ها، توکن) از مقدار نهان خوانده می‌شود تا مسیر ثبت تردد قفل نوشتن SQLite نگیرد.
+# فقط دستگاه پیش‌فرض خودکار ساخته می‌شود تا ضربان یا نشست قدیمی، دستگاه حذف‌شده را برنگرداند.
+# مقدار نهان هر فرایند جداست: تغییر یا حذف دستگاه در فرایندهای دیگر حداکثر تا active_ttl دیده نمی‌شود
+class DeviceHeartbeat:
+
+    def __init__(self, flush_seconds=None, active_ttl=None):
+        self._lock = threading.Lock()
+        self._seen = {}
+        self._flushed = {}
+        self._states = {}
+        self._tokens = {}
+        self._flush_seconds = flush_seconds
+        self._active_ttl = active_ttl
+
+    @property
+    def flush_seconds(self):
+        if self._flush_seconds is not None:
+            return self._flush_seconds
+        return getattr(settings, "DEVICE_HEARTBEAT_FLUSH_SECONDS", 20)
+
+    @property
+    def active_ttl(self):
+        if self._active_ttl is not None:
+            return self._active_ttl
+        return getattr(settings, "DEVICE_ACTIVE_CACHE_SECONDS", 30)
+
+    # ثبت دیده‌شدن در حافظه؛ True یعنی آخرین ذخیره قدیمی‌تر از بازه است و باید نوشته شود
+    def _mark(self, device_id):
+        now = timezone.now()
+        tick = time.monotonic()
+        with self._lock:
+            self._seen[device_id] = now
+            due = tick - self._flushed.get(device_id, float("-inf")) >= self.flush_seconds
+            if due:
+                self._flushed[device_id] = tick
+        return due, now
+
+    def _write_failed(self, device_id, e):
+        with self._lock:
+            self._flushed.pop(device_id, None)
+        print("Device heartbeat error:", e)
+
+    def beat(self, device_id=DEFAULT_DEVICE_ID):
+        due, now = self._mark(device_id)
+        if due:
+            self._write(device_id, now)
+
+    async def abeat(self, device_id=DEFAULT_DEVICE_ID):
+        due, now = self._mark(device_id)
+        if not due:
+            return
+        try:
+            updated = await Device.objects.filter(id=device_id).aupdate(last_seen=now)
+            if not updated and device_id == DEFAULT_DEVICE_ID:
+                await Device.objects.aget_or_create(
+                    id=device_id, defaults={"name": DEFAULT_DEVICE_NAME, "last_seen": now}
+                )
+        except Exception as e:
+            self._write_failed(device_id, e)
+
+    def _write(self, device_id, seen):
+        try:
+            updated = Device.objects.filter(id=device_id).update(last_seen=seen)
+            if not updated and device_id == DEFAULT_DEVICE_ID:
+                Device.objects.get_or_create(
+                    id=device_id, defaults={"name": DEFAULT_DEVICE_NAME, "last_seen": seen}
+                )
+        except Exception as e:
+            self._write_failed(device_id, e)
+
+    # نوشتن آخرین ضربان همه دستگاه‌ها بدون انتظار برای بازه
+    def flush(self):
+        with self._lock:
+            pending = dict(self._seen)
+            tick = time.monotonic()
+            for device_id in pending:
+                self._flushed[device_id] = tick
+        for device_id, seen in pending.items():
+            self._write(device_id, seen)
+
+    # آخرین زمان دیده‌شدن در همین فرایند (None اگر ضربانی نرسیده)
+    def last_seen(self, device_id=DEFAULT_DEVICE_ID):
+        with self._lock:
+            return self._seen.get(device_id)
+
+    def _cached(self, cache, key):
+        with self._lock:
+            cached = cache.get(key)
+        if cached is not None and time.monotonic() - cached[1] < self.active_ttl:
+            return cached[0]
+        return None
+
+    def _store(self, cache, key, value):
+        with self._lock:
+            cache[key] = (value, time.monotonic())
+        return value
+
+    # وضعیت نهان دستگاه: (فعال بودن، شناسه گروه‌های مجاز یا None برای همه)؛ UNKNOWN_DEVICE برای دستگاه حذف‌شده
+    def state(self, device_id=DEFAULT_DEVICE_ID):
+        state = self._cached(self._states, device_id)
+        if state is not None:
+            return state
+        if device_id == DEFAULT_DEVICE_ID:
+            device, _ = Device.objects.get_or_create(
+                id=device_id, defaults={"name": DEFAULT_DEVICE_NAME}
+            )
+        else:
+            device = Device.objects.filter(id=device_id).first()
+            if device is None:
+                return self._store(self._states, device_id, UNKNOWN_DEVICE)
+        groups = frozenset(device.groups.values_list("id", flat=True)) or None
+        return self._store(self._states, device_id, (device.is_active, groups))
+
+    async def astate(self, device_id=DEFAULT_DEVICE_ID):
+        state = self._cached(self._states, device_id)
+        if state is not None:
+            return state
+        if device_id == DEFAULT_DEVICE_ID:
+            device, _ = await Device.objects.aget_or_create(
+                id=device_id, defaults={"name": DEFAULT_DEVICE_NAME}
+            )
+        else:
+            device = await Device.objects.filter(id=device_id).afirst()
+            if device is None:
+                return self._store(self._states, device_id, UNKNOWN_DEVICE)
+        groups = frozenset([g async for g in device.groups.values_list("id", flat=True)]) or None
+        return self._store(self._states, device_id, (device.is_active, groups))
+
+    def is_active(self, device_id=DEFAULT_DEVICE_ID):
+        return bool(self.state(device_id)[0])
+
+    # دستگاه هنوز در پایگاه داده هست (حذف نشده)
+    def known(self, device_id):
+        return self.state(device_id) != UNKNOWN_DEVICE
+
+    async def aknown(self, device_id):
+        return await self.astate(device_id) != UNKNOWN_DEVICE
+
+    # شناسه دستگاه صاحب توکن (None برای توکن نامعتبر)
+    def device_for_token(self, token):
+        token_hash = Device.hash_token(token)
+        device_id = self._cached(self._tokens, token_hash)
+        if device_id is None:
+            device_id = Device.objects.filter(token_hash=token_hash).values_list("id", flat=True).first()
+            if device_id is not None:
+                self._store(self._tokens, token_hash, device_id)
+        return device_id
+
+    async def adevice_for_token(self, token):
+        token_hash = Device.hash_token(token)
+        device_id = self._cached(self._tokens, token_hash)
+        if device_id is None:
+            device_id = await Device.objects.filter(token_hash=token_hash).values_list("id", flat=True).afirst()
+            if device_id is not None:
+                self._store(self._tokens, token_hash, device_id)
+        return device_id
+
+    # پس از تغییر دستگاه در تنظیمات (فعال‌سازی، گروه‌ها، توکن)
+    def invalidate(self, device_id=None):
+        with self._lock:
+            if device_id is None:
+                self._states.clear()
+            else:
+                self._states.pop(device_id, None)
+            self._tokens.clear()
+
+heartbeat = DeviceHeartbeat()
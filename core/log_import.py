@@ -0,0 +1,187 @@
+import csv
+import io
+import json
+import time
+from datetime import datetime
+
+import jdatetime
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from attendance.models import AttendanceLog
+
+from . import daily_attendance
+
+# نام‌های پذیرفته‌شده ستون‌ها در فایل سامانه قبلی
+CODE_FIELDS = ("personnel_code", "code", "کد پرسنلی")
+TIMESTAMP_FIELDS = ("timestamp", "time", "datetime", "زمان")
+TYPE_FIELDS = ("log_type", "type", "نوع")
+LOG_TYPES = {"in": "in", "out": "out", "ورود": "in", "خروج": "out", "0": "in", "1": "out"}
+TIMESTAMP_FORMATS = ("%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M", "%Y/%m/%d")
+
+# خواندن جریانی ردیف‌ها از فایل متنی CSV یا NDJSON بدون بارگذاری کل فایل
+def iter_rows(stream, fmt, delimiter=","):
+
+    if fmt == "ndjson":
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+    else:
+        yield from csv.DictReader(stream, delimiter=delimiter)
+
+# باز کردن فایل آپلودی یا باینری به صورت متنی (BOM فایل‌های اکسل حذف می‌شود)
+def text_stream(binary, encoding="utf-8-sig"):
+    return io.TextIOWrapper(binary, encoding=encoding, newline="")
+
+def _field(row, names):
+    for name in names:
+        value = row.get(name)
+        if value not in (None, ""):
+            return str(value).strip()
+    return None
+
+# تاریخ میلادی یا شمسی (سال کمتر از ۱۷۰۰) به صورت ISO یا با /؛ خروجی بدون منطقه زمانی
+def parse_timestamp(value):
+
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        for fmt in TIMESTAMP_FORMATS:
+            try:
+                parsed = datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            return None
+    if parsed.tzinfo is not None:
+        parsed = timezone.make_naive(parsed)
+    if parsed.year < 1700:
+        try:
+            parsed = jdatetime.datetime(
+                parsed.year, parsed.month, parsed.day, parsed.hour, parsed.minute, parsed.second
+            ).togregorian()
+        except ValueError:
+            return None
+    if settings.USE_TZ:
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+# درون‌ریزی دسته‌ای تردد: نگاشت کد پرسنلی با یک پرس‌وجو برای هر دسته، حذف تکراری‌ها با مجموعه
+# و درج هر دسته در تراکنشی کوتاه تا قفل نوشتن پایگاه داده برای کیوسک‌ها طولانی نشود
+class LogImporter:
+
+    def __init__(self, chunk_size=None, source="import", dry_run=False, pause=0.0, progress=None):
+        self.chunk_size = chunk_size or getattr(settings, "LOG_IMPORT_CHUNK_SIZE", 5000)
+        self.source = source
+        self.dry_run = dry_run
+        self.pause = pause
+        self.progress = progress
+        self._codes = {}
+        # در اجرای آزمایشی دسته‌ها ذخیره نمی‌شوند، پس ترددهای دسته‌های قبلی همین‌جا نگه داشته می‌شوند
+        self._dry_seen = set()
+        self.stats = {"rows": 0, "inserted": 0, "duplicates": 0, "unknown_code": 0, "invalid": 0}
+        self.unknown_codes = set()
+
+    def run(self, rows):
+        started = time.monotonic()
+        chunk = []
+        for row in rows:
+            self.stats["rows"] += 1
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                self._import_chunk(chunk)
+                chunk = []
+                self._report(started)
+        if chunk:
+            self._import_chunk(chunk)
+        self._report(started)
+        return self.stats
+
+    def _report(self, started):
+        elapsed = time.monotonic() - started
+        self.stats["seconds"] = round(elapsed, 2)
+        self.stats["rows_per_s"] = round(self.stats["rows"] / elapsed) if elapsed else 0
+        if self.progress:
+            self.progress(self.stats)
+
+    # شناسه کاربران کدهای تازه این دسته با یک پرس‌وجو؛ کدهای ناشناس هم نگه داشته می‌شوند
+    def _map_codes(self, codes):
+        missing = codes - self._codes.keys()
+        if missing:
+            found = dict(
+                get_user_model().objects.filter(personnel_code__in=missing)
+                .values_list("personnel_code", "id")
+            )
+            for code in missing:
+                self._codes[code] = found.get(code)
+
+    def _parse(self, chunk):
+        parsed = []
+        for row in chunk:
+            if not isinstance(row, dict):
+                self.stats["invalid"] += 1
+                continue
+            code = _field(row, CODE_FIELDS)
+            raw_ts = _field(row, TIMESTAMP_FIELDS)
+            log_type = LOG_TYPES.get((_field(row, TYPE_FIELDS) or "").lower())
+            timestamp = parse_timestamp(raw_ts) if raw_ts else None
+            if not code or timestamp is None or log_type is None:
+                self.stats["invalid"] += 1
+                continue
+            parsed.append((code, timestamp, log_type))
+        return parsed
+
+    def _import_chunk(self, chunk):
+        parsed = self._parse(chunk)
+        if not parsed:
+            return
+        self._map_codes({code for code, _, _ in parsed})
+
+        rows = []
+        for code, timestamp, log_type in parsed:
+            user_id = self._codes[code]
+            if user_id is None:
+                self.stats["unknown_code"] += 1
+                self.unknown_codes.add(code)
+                continue
+            rows.append((user_id, timestamp, log_type))
+        if not rows:
+            return
+
+        # دسته‌های قبلی پیش از این پرس‌وجو ذخیره شده‌اند (در اجرای آزمایشی در _dry_seen هستند)،
+        # پس تکراری بین دسته‌ها هم دیده می‌شود
+        existing = set(
+            AttendanceLog.objects.filter(
+                user_id__in={user_id for user_id, _, _ in rows},
+                timestamp__range=(min(r[1] for r in rows), max(r[1] for r in rows)),
+            ).values_list("user_id", "timestamp")
+        )
+        logs = []
+        for user_id, timestamp, log_type in rows:
+            if (user_id, timestamp) in existing or (user_id, timestamp) in self._dry_seen:
+                self.stats["duplicates"] += 1
+                continue
+            existing.add((user_id, timestamp))
+            logs.append(
+                AttendanceLog(user_id=user_id, timestamp=timestamp, log_type=log_type, source=self.source)
+            )
+        if self.dry_run:
+            self._dry_seen.update((log.user_id, log.timestamp) for log in logs)
+        elif logs:
+            with transaction.atomic():
+                AttendanceLog.objects.bulk_create(logs, batch_size=500)
+                # خلاصه روزانه روزهای درون‌ریخته هنگام خواندن دوباره ساخته می‌شود
+                daily_attendance.logs_changed(
+                    [(log.user_id, log.timestamp) for log in logs], recompute=False
+                )
+            if self.pause:
+                time.sleep(self.pause)
+        self.stats["inserted"] += len(logs)
@@ -0,0 +1,59 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.face_gallery import is_legacy, pack_vectors, unpack_vectors
+from core.face_index import face_index
+
+class Command(BaseCommand):
+    help = "تبدیل بردارهای چهره قدیمی (float64 خام) به قالب نسخه‌دار float32"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=500, help="تعداد کاربر در هر تراکنش"
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="فقط شمارش بدون ذخیره"
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        batch_size = options["batch_size"]
+        rows = (
+            User.objects.exclude(face_encoding__isnull=True)
+            .values_list("id", "face_encoding", "face_templates")
+            .order_by("id")
+        )
+        pending = []
+        converted = skipped = 0
+        for user_id, raw, raw_templates in rows.iterator(chunk_size=batch_size):
+            if not is_legacy(raw) and not is_legacy(raw_templates):
+                skipped += 1
+                continue
+            encoding = unpack_vectors(raw)
+            templates = unpack_vectors(raw_templates)
+            pending.append(
+                User(
+                    id=user_id,
+                    face_encoding=pack_vectors(encoding[0]) if len(encoding) else None,
+                    face_templates=pack_vectors(templates) if len(templates) else None,
+                )
+            )
+            if len(pending) >= batch_size:
+                converted += self._flush(User, pending, options["dry_run"])
+        converted += self._flush(User, pending, options["dry_run"])
+
+        if converted and not options["dry_run"]:
+            face_index.invalidate()
+        verb = "to convert" if options["dry_run"] else "converted"
+        self.stdout.write(
+            f"{converted} users {verb}, {skipped} already in the current format"
+        )
+
+    def _flush(self, User, pending, dry_run):
+        count = len(pending)
+        if count and not dry_run:
+            with transaction.atomic():
+                User.objects.bulk_update(pending, ["face_encoding", "face_templates"])
+        pending.clear()
+        return count
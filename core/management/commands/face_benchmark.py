@@ -0,0 +1,250 @@
+import base64
+import io
+import json
+import os
+import platform
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from attendance.models import AttendanceLog
+from core.face_gallery import EMBEDDING_SIZE
+from core.face_index import FaceIndex
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+
+# ساخت data URL با وضوح مشخص (بلندترین ضلع) مانند فریم ارسالی کیوسک
+def _data_url(image, side):
+    image = image.convert("RGB")
+    scale = side / max(image.size)
+    size = (max(1, round(image.size[0] * scale)), max(1, round(image.size[1] * scale)))
+    buf = io.BytesIO()
+    image.resize(size, Image.BILINEAR).save(buf, format="JPEG", quality=90)
+    return "data:image/jpeg;base64," + base64.b64encode(buf.getvalue()).decode()
+
+# رمزگشایی base64 بدون پشته چهره (حالت --skip-encode)
+def _split_data_url(data_url):
+    return base64.b64decode(data_url.split(",", 1)[1]), "jpeg"
+
+def _pil_decode(img_bytes):
+    image = Image.open(io.BytesIO(img_bytes))
+    image.load()
+    return image
+
+# گالری مصنوعی از بردارهای یکه تصادفی
+def _synthetic_gallery(size, templates, rng):
+    rows = size * templates
+    matrix = rng.standard_normal((rows, EMBEDDING_SIZE)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    user_ids = np.repeat(np.arange(1, size + 1, dtype=np.int64), templates)
+    return user_ids, matrix
+
+# آمار یک مرحله بر حسب میلی‌ثانیه
+def _summary(samples):
+    values = np.asarray(samples, dtype=np.float64) * 1000
+    total = values.sum() / 1000
+    return {
+        "n": int(len(values)),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+        "throughput_per_s": round(len(values) / total, 1) if total else None,
+    }
+
+class Command(BaseCommand):
+    help = "سنجش زمان هر مرحله خط پردازش چهره (رمزگشایی، تشخیص، استخراج، تطبیق، ذخیره) با خروجی JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--images", default=None, help="پوشه تصاویر JPEG (پیش‌فرض media/faces)")
+        parser.add_argument("--resolutions", default="320,640,1280", help="بلندترین ضلع فریم‌ها")
+        parser.add_argument("--gallery-sizes", default="1000,10000,100000", help="اندازه گالری‌های مصنوعی")
+        parser.add_argument("--templates", type=int, default=1, help="تعداد الگو برای هر کاربر مصنوعی")
+        parser.add_argument("--repeat", type=int, default=3, help="تکرار هر تصویر در هر وضوح")
+        parser.add_argument("--match-iterations", type=int, default=200, help="تعداد جستجو در هر گالری")
+        parser.add_argument("--db-writes", type=int, default=50, help="تعداد ثبت تردد آزمایشی (برگشت داده می‌شود)")
+        parser.add_argument("--skip-encode", action="store_true", help="فقط رمزگشایی، تطبیق و ذخیره")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default=None, help="مسیر فایل JSON نتیجه")
+        parser.add_argument("--baseline", default=None, help="فایل JSON اجرای قبلی برای مقایسه p50")
+
+    def handle(self, *args, **options):
+        resolutions = [int(v) for v in options["resolutions"].split(",") if v.strip()]
+        gallery_sizes = [int(v) for v in options["gallery_sizes"].split(",") if v.strip()]
+        face_pipeline = None
+        if not options["skip_encode"]:
+            try:
+                from core import face_pipeline
+            except ImportError as e:
+                raise CommandError(f"face stack unavailable ({e}); use --skip-encode")
+
+        corpus = self._corpus(options["images"])
+        stages = {}
+        for side in resolutions:
+            frames = [_data_url(image, side) for image in corpus]
+            self._image_stages(stages, side, frames, options["repeat"], face_pipeline)
+        rng = np.random.default_rng(options["seed"])
+        for size in gallery_sizes:
+            self._match_stages(stages, size, options, rng)
+        if options["db_writes"]:
+            stages["db_write"] = _summary(self._db_writes(options["db_writes"]))
+
+        report = {
+            "meta": self._meta(len(corpus), resolutions, gallery_sizes, options),
+            "stages": stages,
+        }
+        self._print(report, options["baseline"])
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(report, indent=2))
+            self.stdout.write(f"results written to {options['output']}")
+
+    def _corpus(self, path):
+        folder = Path(path) if path else Path(settings.MEDIA_ROOT) / "faces"
+        files = sorted(p for p in folder.glob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+        if not files:
+            raise CommandError(f"no images found in {folder}")
+        corpus = []
+        skipped = []
+        for p in files:
+            try:
+                with Image.open(p) as image:
+                    image.load()
+                    corpus.append(image.copy())
+            except (OSError, UnidentifiedImageError):
+                skipped.append(p.name)
+        if skipped:
+            self.stderr.write(f"skipped {len(skipped)} unreadable images: {', '.join(skipped)}")
+        if not corpus:
+            raise CommandError(f"no readable images in {folder}")
+        return corpus
+
+    # مراحل هر فریم جداگانه زمان‌گیری می‌شوند؛ مرحله کامل از مسیر واقعی کیوسک بدون حافظه نهان می‌گذرد
+    def _image_stages(self, stages, side, frames, repeat, face_pipeline):
+        samples = {}
+
+        def timed(name, fn, *args, **kwargs):
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            samples.setdefault(name, []).append(time.perf_counter() - start)
+            return result
+
+        if face_pipeline is not None:
+            import face_recognition
+            from core.face_cache import encoding_cache
+
+            profile = face_pipeline._encode_profile("full")
+        decode = face_pipeline._decode_data_url if face_pipeline else _split_data_url
+        for _ in range(repeat):
+            for frame in frames:
+                img_bytes, _ = timed("b64_decode", decode, frame)
+                image = timed("pil_decode", _pil_decode, img_bytes)
+                rgb = timed("rgb_convert", lambda: np.asarray(image.convert("RGB")))
+                if face_pipeline is None:
+                    continue
+                box = timed("detect", face_pipeline._detect_face_box, rgb)
+                if box is None:
+                    samples.setdefault("no_face", []).append(0)
+                    continue
+                timed("landmarks", face_recognition.face_landmarks, rgb, [box], model=profile["model"])
+                timed("encode", face_recognition.face_encodings, rgb, [box], num_jitters=1, model=profile["model"])
+                timed("encode_jitters", face_recognition.face_encodings, rgb, [box], **profile)
+                encoding_cache.clear()
+                timed("end_to_end", face_pipeline._get_face_encoding_from_base64, frame)
+
+        no_face = len(samples.pop("no_face", []))
+        if no_face:
+            self.stderr.write(f"{no_face} frames at {side}px had no detected face")
+        for name, values in samples.items():
+            stages[f"{name}@{side}px"] = _summary(values)
+
+    # جستجو در گالری مصنوعی با موتور تنظیم‌شده (FACE_INDEX_ENGINE)
+    def _match_stages(self, stages, size, options, rng):
+        user_ids, matrix = _synthetic_gallery(size, max(1, options["templates"]), rng)
+        index = FaceIndex(refresh_seconds=float("inf"))
+        start = time.perf_counter()
+        index.load(user_ids, matrix)
+        stages[f"index_load@{size}"] = _summary([time.perf_counter() - start])
+
+        picks = rng.integers(0, len(matrix), size=options["match_iterations"])
+        noise = rng.standard_normal((len(picks), EMBEDDING_SIZE)).astype(np.float32) * 0.02
+        probes = matrix[picks] + noise
+        single, pair = [], []
+        misses = 0
+        for i, probe in enumerate(probes):
+            start = time.perf_counter()
+            candidates = index.match(probe, radius=0.6)
+            single.append(time.perf_counter() - start)
+            if not candidates or candidates[0][0] != user_ids[picks[i]]:
+                misses += 1
+            start = time.perf_counter()
+            index.match_many([probe, probes[i - 1]], radius=0.6)
+            pair.append(time.perf_counter() - start)
+        stages[f"match@{size}"] = dict(_summary(single), misses=misses)
+        stages[f"match_pair@{size}"] = _summary(pair)
+
+    # ثبت تردد داخل تراکنشی که برگشت داده می‌شود تا داده‌ای باقی نماند
+    def _db_writes(self, count):
+        samples = []
+        with transaction.atomic():
+            tag = f"b{os.getpid()}"[:10]
+            user = get_user_model().objects.create(
+                username=f"benchmark-{tag}", personnel_code=tag, national_id=tag
+            )
+            now = timezone.now()
+            for i in range(count):
+                start = time.perf_counter()
+                AttendanceLog.objects.create(
+                    user=user, timestamp=now, log_type="in" if i % 2 == 0 else "out", source="self"
+                )
+                samples.append(time.perf_counter() - start)
+            transaction.set_rollback(True)
+        return samples
+
+    def _meta(self, images, resolutions, gallery_sizes, options):
+        return {
+            "created_at": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "images": images,
+            "repeat": options["repeat"],
+            "resolutions": resolutions,
+            "gallery_sizes": gallery_sizes,
+            "templates_per_user": options["templates"],
+            "settings": {
+                name: getattr(settings, name, None)
+                for name in (
+                    "FACE_INDEX_ENGINE",
+                    "FACE_DETECTOR",
+                    "FACE_FAST_FRONTEND",
+                    "FACE_DECODE_MAX_SIDE",
+                    "FACE_DETECT_MAX_SIDE",
+                    "FACE_EMBEDDING_MODEL",
+                )
+            },
+        }
+
+    def _print(self, report, baseline_path):
+        baseline = {}
+        if baseline_path:
+            baseline = json.loads(Path(baseline_path).read_text()).get("stages", {})
+        self.stdout.write(f"{'stage':<28}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'per s':>10}")
+        for name, row in report["stages"].items():
+            line = (
+                f"{name:<28}{row['n']:>6}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+                f"{row['p99_ms']:>10.2f}{row['throughput_per_s'] or 0:>10.1f}"
+            )
+            old = baseline.get(name)
+            if old and old.get("p50_ms"):
+                line += f"  p50 {row['p50_ms'] / old['p50_ms']:.2f}x baseline"
+            if row.get("misses"):
+                line += f"  misses={row['misses']}"
+            self.stdout.write(line)
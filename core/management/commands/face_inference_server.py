@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import socketserver
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.face_client import recv_message, send_message
+from core.face_index import face_index
+
+# بارگذاری مدل‌های dlib در هر فرایند کارگر پیش از دریافت درخواست
+def _warm_worker():
+    from core import face_pipeline
+
+    face_pipeline.face_recognition.face_locations(np.zeros((32, 32, 3), dtype=np.uint8))
+
+def _encode(img_bytes, quality, box):
+    from core import face_pipeline
+
+    enc = face_pipeline.get_face_encoding_from_bytes(img_bytes, quality, box)
+    return None if enc is None else enc.tobytes()
+
+class _Handler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        try:
+            header, payload = recv_message(self.request)
+        except (OSError, ValueError):
+            return
+        try:
+            reply = self.server.dispatch(header, payload)
+        except Exception as e:
+            reply = ({"ok": False, "error": str(e)}, b"")
+        try:
+            send_message(self.request, *reply)
+        except OSError:
+            pass
+
+class InferenceServer(socketserver.ThreadingUnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, path, pool):
+        self.pool = pool
+        super().__init__(path, _Handler)
+
+    def dispatch(self, header, payload):
+        op = header.get("op")
+        if op == "encode":
+            quality = header.get("quality", "full")
+            boxes = header.get("boxes") or [None] * len(header["sizes"])
+            jobs = []
+            offset = 0
+            for size, box in zip(header["sizes"], boxes):
+                jobs.append((payload[offset:offset + size], quality, box and tuple(box)))
+                offset += size
+            results = self.pool.starmap(_encode, jobs)
+            return (
+                {"ok": True, "found": [r is not None for r in results]},
+                b"".join(r for r in results if r is not None),
+            )
+        if op == "match":
+            candidates = face_index.match(
+                np.frombuffer(payload, dtype=np.float64),
+                k=header.get("k", 2),
+                radius=header.get("radius"),
+                groups=header.get("groups"),
+            )
+            return {"ok": True, "candidates": candidates}, b""
+        if op == "update":
+            encoding = np.frombuffer(payload, dtype=np.float64) if payload else None
+            face_index.update(header["user_id"], encoding)
+            return {"ok": True}, b""
+        return {"ok": False, "error": f"unknown op: {op}"}, b""
+
+class Command(BaseCommand):
+    help = "اجرای سرویس استنتاج چهره با فرایندهای کارگر از پیش آماده"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--socket",
+            default=getattr(settings, "FACE_INFERENCE_SOCKET", None),
+            help="مسیر سوکت یونیکس",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=getattr(settings, "FACE_INFERENCE_WORKERS", 2),
+            help="تعداد فرایندهای کارگر",
+        )
+
+    def handle(self, *args, **options):
+        path = options["socket"]
+        if not path:
+            raise CommandError("FACE_INFERENCE_SOCKET تنظیم نشده است.")
+        if os.path.exists(path):
+            os.unlink(path)
+
+        pool = multiprocessing.Pool(options["workers"], initializer=_warm_worker)
+        server = InferenceServer(path, pool)
+        os.chmod(path, 0o660)
+        face_index.build()
+        self.stdout.write(
+            f"Face inference server on {path} with {options['workers']} workers, "
+            f"{len(face_index)} faces indexed"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            pool.terminate()
+            if os.path.exists(path):
+                os.unlink(path)
@@ -0,0 +1,61 @@
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.log_import import LogImporter, iter_rows, text_stream
+
+class Command(BaseCommand):
+    help = "درون‌ریزی جریانی ترددهای سامانه قبلی از CSV یا NDJSON (کد پرسنلی، زمان، نوع) با درج دسته‌ای"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="مسیر فایل یا - برای ورودی استاندارد")
+        parser.add_argument("--format", choices=["csv", "ndjson"], default=None, help="پیش‌فرض از پسوند فایل")
+        parser.add_argument("--delimiter", default=",", help="جداکننده CSV")
+        parser.add_argument("--encoding", default="utf-8-sig")
+        parser.add_argument("--chunk-size", type=int, default=None, help="ردیف در هر تراکنش (پیش‌فرض LOG_IMPORT_CHUNK_SIZE)")
+        parser.add_argument("--pause", type=float, default=0.0, help="مکث بین دسته‌ها (ثانیه) برای کیوسک‌های فعال")
+        parser.add_argument("--dry-run", action="store_true", help="فقط شمارش، بدون درج")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"]
+        if fmt is None:
+            fmt = "ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv"
+        if path == "-":
+            binary = sys.stdin.buffer
+        else:
+            if not Path(path).is_file():
+                raise CommandError(f"file not found: {path}")
+            binary = open(path, "rb")
+
+        importer = LogImporter(
+            chunk_size=options["chunk_size"],
+            dry_run=options["dry_run"],
+            pause=options["pause"],
+            progress=self._progress,
+        )
+        try:
+            stats = importer.run(
+                iter_rows(text_stream(binary, options["encoding"]), fmt, options["delimiter"])
+            )
+        finally:
+            if binary is not sys.stdin.buffer:
+                binary.close()
+
+        if importer.unknown_codes:
+            sample = ", ".join(sorted(importer.unknown_codes)[:20])
+            self.stderr.write(f"{len(importer.unknown_codes)} unknown personnel codes, e.g. {sample}")
+        verb = "would insert" if options["dry_run"] else "inserted"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{stats['rows']} rows in {stats['seconds']}s ({stats['rows_per_s']}/s): "
+                f"{verb} {stats['inserted']}, {stats['duplicates']} duplicates, "
+                f"{stats['unknown_code']} unknown codes, {stats['invalid']} invalid"
+            )
+        )
+
+    def _progress(self, stats):
+        self.stdout.write(
+            f"{stats['rows']} rows, {stats['inserted']} inserted, {stats['rows_per_s']}/s"
+        )
@@ -0,0 +1,64 @@
+import time
+from datetime import date
+
+import jdatetime
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from attendance.models import AttendanceLog
+from core.daily_attendance import rebuild_days
+
+# تاریخ میلادی یا شمسی (سال کمتر از ۱۷۰۰) به صورت YYYY-MM-DD
+def _parse_date(value):
+    try:
+        parsed = date.fromisoformat(value.replace("/", "-"))
+    except ValueError:
+        raise CommandError(f"invalid date: {value}")
+    if parsed.year < 1700:
+        return jdatetime.date(parsed.year, parsed.month, parsed.day).togregorian()
+    return parsed
+
+class Command(BaseCommand):
+    help = "بازسازی خلاصه حضور روزانه از ترددهای ثبت‌شده (برای بار اول یا پس از تغییر دستی پایگاه داده)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", default=None, help="از تاریخ (پیش‌فرض اولین تردد)")
+        parser.add_argument("--until", default=None, help="تا تاریخ (پیش‌فرض امروز)")
+        parser.add_argument("--user", default=None, help="فقط یک کارمند با این کد پرسنلی")
+        parser.add_argument("--chunk-users", type=int, default=50, help="کاربر در هر تراکنش")
+
+    def handle(self, *args, **options):
+        until = _parse_date(options["until"]) if options["until"] else timezone.now().replace(tzinfo=None).date()
+        if options["since"]:
+            since = _parse_date(options["since"])
+        else:
+            first = AttendanceLog.objects.aggregate(first=Min("timestamp"))["first"]
+            since = first.date() if first else until
+        if since > until:
+            raise CommandError("--since is after --until")
+
+        users = get_user_model().objects.order_by("id")
+        if options["user"]:
+            users = users.filter(personnel_code=options["user"])
+            if not users.exists():
+                raise CommandError(f"unknown personnel code: {options['user']}")
+        user_ids = list(users.values_list("id", flat=True))
+
+        started = time.monotonic()
+        chunk = max(options["chunk_users"], 1)
+        written = 0
+        for i in range(0, len(user_ids), chunk):
+            ids = user_ids[i:i + chunk]
+            written += rebuild_days(ids, since, until)
+            self.stdout.write(f"{min(i + chunk, len(user_ids))}/{len(user_ids)} users, {written} days")
+
+        elapsed = time.monotonic() - started
+        rate = round(written / elapsed) if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"rebuilt {written} days for {len(user_ids)} users ({since} .. {until}) "
+                f"in {elapsed:.2f}s ({rate}/s)"
+            )
+        )
@@ -0,0 +1,185 @@
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from attendance.models import SuspiciousLog
+from core.face_gallery import (
+    apply_templates,
+    build_templates,
+    embedding_model,
+    embedding_profile,
+    gallery_size,
+    pack_vectors,
+    unpack_vectors,
+)
+from core.face_index import face_index
+from core.models import FaceEmbedding
+
+# استخراج بردار همه تصاویر یک کاربر در فرایند کارگر
+def _encode_user(job):
+    from core import face_pipeline
+
+    user_id, paths, profile = job
+    encodings = []
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            print("Re-encode read error:", path, e)
+            continue
+        enc = face_pipeline.get_face_encoding_from_bytes(data, "full", None, profile)
+        if enc is not None:
+            encodings.append(enc)
+    return user_id, encodings
+
+class Command(BaseCommand):
+    help = "استخراج دوباره بردار چهره همه کاربران از تصاویر ذخیره‌شده با یک نسخه مدل و جابه‌جایی یکجا"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", default=None, help="برچسب نسخه مدل (پیش‌فرض FACE_EMBEDDING_MODEL)")
+        parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(), help="تعداد فرایندهای کارگر")
+        parser.add_argument("--include-confirmed", action="store_true", help="افزودن تصاویر لاگ‌های مشکوک تأییدشده به گالری")
+        parser.add_argument("--batch-size", type=int, default=100, help="تعداد ردیف در هر ذخیره")
+        parser.add_argument("--force", action="store_true", help="حذف بردارهای قبلی این نسخه و شروع از ابتدا")
+        parser.add_argument("--cutover", action="store_true", help="بدون استخراج، بردارهای این نسخه فعال شوند (بازگشت هم با همین)")
+        parser.add_argument("--allow-partial", action="store_true", help="جابه‌جایی حتی اگر برای برخی کاربران بردار نباشد")
+        parser.add_argument("--skip-model-check", action="store_true", help="جابه‌جایی بدون برابری با FACE_EMBEDDING_MODEL")
+
+    def handle(self, *args, **options):
+        model = options["model"] or embedding_model()
+        if options["cutover"]:
+            self._cutover(model, options)
+            return
+
+        # تنظیمات استخراج از ثبت همین نسخه در FACE_EMBEDDING_MODELS تا پس از جابه‌جایی،
+        # بردارهای لحظه‌ای کیوسک با همان تنظیمات گالری استخراج شوند
+        profile = embedding_profile(model)
+        if profile is None:
+            raise CommandError(
+                f"{model!r} is not in FACE_EMBEDDING_MODELS; add it with its encode profile "
+                "(num_jitters, model) first."
+            )
+
+        if options["force"]:
+            FaceEmbedding.objects.filter(model=model).delete()
+        self._encode_all(model, profile, options)
+
+    # فهرست تصاویر هر کاربر؛ تصویر ثبت‌نام اول می‌آید تا الگوی ثابت گالری باشد
+    def _jobs(self, model, profile, include_confirmed):
+        User = get_user_model()
+        done = set(FaceEmbedding.objects.filter(model=model).values_list("user_id", flat=True))
+        paths = {}
+        for user_id, name in (
+            User.objects.exclude(face_image="").exclude(face_image__isnull=True)
+            .values_list("id", "face_image").order_by("id")
+        ):
+            if user_id not in done:
+                paths[user_id] = [default_storage.path(name)]
+        if include_confirmed and paths:
+            limit = gallery_size() - 1
+            for user_id, name in (
+                SuspiciousLog.objects.filter(status="confirmed", matched_user_id__in=list(paths))
+                .exclude(image="").exclude(image__isnull=True)
+                .values_list("matched_user_id", "image").order_by("-timestamp")
+            ):
+                if len(paths[user_id]) <= limit:
+                    paths[user_id].append(default_storage.path(name))
+        return [(user_id, user_paths, profile) for user_id, user_paths in paths.items()], len(done)
+
+    def _encode_all(self, model, profile, options):
+        jobs, skipped = self._jobs(model, profile, options["include_confirmed"])
+        total = len(jobs)
+        self.stdout.write(
+            f"model {model} {profile}: {total} users to encode, {skipped} already done"
+        )
+        if not total:
+            return
+
+        # اتصال‌های پایگاه داده پیش از fork بسته می‌شوند تا بین فرایندها مشترک نشوند
+        connections.close_all()
+        pending = []
+        encoded = failed = 0
+        started = last_report = time.monotonic()
+        with multiprocessing.Pool(max(1, options["workers"])) as pool:
+            for user_id, encodings in pool.imap_unordered(_encode_user, jobs, chunksize=4):
+                templates = build_templates(encodings) if encodings else None
+                if templates is None:
+                    failed += 1
+                pending.append(
+                    FaceEmbedding(
+                        user_id=user_id,
+                        model=model,
+                        templates=pack_vectors(templates) if templates is not None else None,
+                    )
+                )
+                encoded += 1
+                if len(pending) >= options["batch_size"]:
+                    self._flush(pending)
+                now = time.monotonic()
+                if now - last_report >= 2 or encoded == total:
+                    rate = encoded / max(now - started, 1e-6)
+                    self.stdout.write(
+                        f"{encoded}/{total} users, {rate:.1f}/s, "
+                        f"{failed} without a face, eta {(total - encoded) / rate:.0f}s"
+                    )
+                    last_report = now
+        self._flush(pending)
+
+    # ذخیره دسته‌ای؛ پس از قطع شدن، اجرای دوباره از همین نقطه ادامه می‌دهد
+    def _flush(self, pending):
+        if pending:
+            FaceEmbedding.objects.bulk_create(pending, ignore_conflicts=True)
+            pending.clear()
+
+    # جابه‌جایی یکجا در یک تراکنش؛ بردارهای فعلی با برچسب خودشان برای بازگشت نگه داشته می‌شوند
+    def _cutover(self, model, options):
+        User = get_user_model()
+        if model != embedding_model() and not options["skip_model_check"]:
+            raise CommandError(
+                f"FACE_EMBEDDING_MODEL is {embedding_model()!r}; set it to {model!r} "
+                "before the cutover (its encode profile comes from FACE_EMBEDDING_MODELS)."
+            )
+        staged = dict(
+            FaceEmbedding.objects.filter(model=model, templates__isnull=False)
+            .values_list("user_id", "templates")
+        )
+        enrolled = set(User.objects.exclude(face_encoding__isnull=True).values_list("id", flat=True))
+        missing = enrolled - set(staged)
+        if missing and not options["allow_partial"]:
+            raise CommandError(
+                f"{len(missing)} enrolled users have no {model} embedding "
+                "(missing image or no face found); re-enroll them or pass --allow-partial."
+            )
+
+        with transaction.atomic():
+            snapshot = [
+                FaceEmbedding(user_id=user_id, model=old_model or "legacy", templates=raw or encoding)
+                for user_id, old_model, raw, encoding in User.objects.filter(id__in=staged)
+                .exclude(face_model=model)
+                .values_list("id", "face_model", "face_templates", "face_encoding")
+            ]
+            FaceEmbedding.objects.bulk_create(snapshot, ignore_conflicts=True)
+            users = []
+            for user_id, raw in staged.items():
+                user = User(id=user_id)
+                apply_templates(user, unpack_vectors(raw))
+                user.face_model = model
+                users.append(user)
+            User.objects.bulk_update(
+                users, ["face_encoding", "face_templates", "face_model"], batch_size=500
+            )
+        face_index.invalidate()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{len(users)} users switched to {model}; "
+                f"previous embeddings kept for rollback, {len(missing)} users unchanged. "
+                f"Running processes pick it up within FACE_INDEX_REFRESH_SECONDS "
+                f"({getattr(settings, 'FACE_INDEX_REFRESH_SECONDS', 60)}s)."
+            )
+        )
@@ -0,0 +1,126 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# ماژول‌هایی که نباید خارج از اندپوینت‌های چهره بارگذاری شوند
+FACE_STACK_MODULES = ("dlib", "face_recognition", "core.face_pipeline")
+
+# صفحه‌های بدون چهره که در فرایند جدا اجرا می‌شوند
+NON_FACE_PAGES = (
+    "home",
+    "management_login",
+    "user_inquiry",
+    "management_dashboard",
+    "attendance_status",
+    "api_attendance_status",
+    "management_users",
+    "management_reports",
+    "suspicious_logs",
+    "edit_requests",
+    "leave_requests",
+    "device_settings",
+)
+
+# اسکریپت فرایند فرزند: راه‌اندازی جنگو، check و درخواست صفحه‌ها با RequestFactory
+_CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+from django.core.management import call_command
+call_command("check", verbosity=0)
+check_time = time.perf_counter() - start
+after_check = [m for m in MODULES if m in sys.modules]
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+staff = get_user_model().objects.filter(is_staff=True).first()
+factory = RequestFactory()
+pages = {}
+start = time.perf_counter()
+for name in PAGES:
+    request = factory.get(reverse(name), HTTP_HOST="localhost")
+    request.session = SessionStore()
+    request.session["face_verified"] = True
+    request.user = staff or AnonymousUser()
+    match = resolve(request.path)
+    try:
+        response = match.func(request, *match.args, **match.kwargs)
+        pages[name] = response.status_code
+    except Exception as e:
+        pages[name] = repr(e)
+print(json.dumps({
+    "check_seconds": check_time,
+    "pages_seconds": time.perf_counter() - start,
+    "after_check": after_check,
+    "after_pages": [m for m in MODULES if m in sys.modules],
+    "numpy_loaded": "numpy" in sys.modules,
+    "pages": pages,
+    "staff_user": bool(staff),
+}))
+"""
+
+# زمان بارگذاری پشته چهره برای مقایسه
+_FACE_IMPORT = """
+import json, time
+import django
+django.setup()
+start = time.perf_counter()
+try:
+    import core.face_pipeline
+    print(json.dumps({"seconds": time.perf_counter() - start}))
+except ImportError as e:
+    print(json.dumps({"error": str(e)}))
+"""
+
+class Command(BaseCommand):
+    help = "سنجش زمان راه‌اندازی و اطمینان از بارگذاری نشدن dlib در check و صفحه‌های غیرچهره"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--json", action="store_true", help="خروجی JSON")
+
+    def _run(self, source):
+        result = subprocess.run(
+            [sys.executable, "-c", source],
+            cwd=str(settings.BASE_DIR),
+            env=dict(os.environ),
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(result.stderr.strip() or "benchmark process failed")
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        prelude = f"MODULES = {FACE_STACK_MODULES!r}\nPAGES = {NON_FACE_PAGES!r}\n"
+        report = self._run(prelude + _CHILD)
+        report["face_stack_import"] = self._run(_FACE_IMPORT)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.stdout.write(f"setup + check: {report['check_seconds']:.3f}s")
+            self.stdout.write(
+                f"{len(report['pages'])} non-face pages: {report['pages_seconds']:.3f}s"
+            )
+            for name, status in report["pages"].items():
+                self.stdout.write(f"  {name}: {status}")
+            face_import = report["face_stack_import"]
+            if "seconds" in face_import:
+                self.stdout.write(f"face stack import (avoided): {face_import['seconds']:.3f}s")
+            else:
+                self.stdout.write(f"face stack import unavailable: {face_import['error']}")
+
+        leaked = sorted(set(report["after_check"]) | set(report["after_pages"]))
+        if leaked:
+            raise CommandError(f"face stack loaded outside face endpoints: {', '.join(leaked)}")
+        if not options["json"]:
+            self.stdout.write(self.style.SUCCESS("face stack not loaded by check or non-face views"))
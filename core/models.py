@@ -1,13 +1,36 @@
+import hashlib
+import secrets
 from datetime import timedelta
 
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
+# دستگاه ثبت تردد (کیوسک)؛ هر ورودی دستگاه و توکن خودش را دارد
 class Device(models.Model):
 
-    name = models.CharField(max_length=100)
+    name = models.CharField("نام", max_length=100)
     is_active = models.BooleanField(default=True)
     last_seen = models.DateTimeField(null=True, blank=True)
+    # فقط هش توکن ذخیره می‌شود؛ خود توکن یک بار هنگام صدور نمایش داده می‌شود
+    token_hash = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    groups = models.ManyToManyField(
+        "attendance.Group",
+        blank=True,
+        related_name="devices",
+        verbose_name="گروه‌های مجاز",
+        help_text="خالی یعنی جستجو در همه کاربران",
+    )
+
+    @staticmethod
+    def hash_token(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    # صدور توکن تازه (بدون save)
+    def issue_token(self) -> str:
+        token = secrets.token_urlsafe(32)
+        self.token_hash = self.hash_token(token)
+        return token
 
     @property
     def online(self) -> bool:
@@ -17,3 +40,25 @@ class Device(models.Model):
 
     def __str__(self) -> str:
         return self.name
+
+# الگوهای چهره کاربر برای یک نسخه مدل؛ نسخه‌ها کنار هم می‌مانند تا جابه‌جایی یکجا
+class FaceEmbedding(models.Model):
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="face_embeddings",
+    )
+    model = models.CharField(max_length=64)
+    templates = models.BinaryField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "model"], name="unique_user_face_model"
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.user_id} – {self.model}"
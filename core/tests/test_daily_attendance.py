@@ -0,0 +1,83 @@
+from datetime import datetime, time, timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+
+from attendance.models import AttendanceLog, DailyAttendance, Shift
+from core import daily_attendance
+
+User = get_user_model()
+
+# خلاصه روزانه‌ای که هم‌زمان با یک تردد خوانده و ذخیره می‌شود نباید تردد را گم کند
+class DailyAttendanceRaceTests(TestCase):
+
+    def setUp(self):
+        shift = Shift.objects.create(name="صبح", start_time=time(9, 0), end_time=time(17, 0))
+        self.user = User.objects.create_user(
+            username="u1", password="x", personnel_code="p1", national_id="n1", shift=shift
+        )
+        self.today = timezone.now().replace(tzinfo=None).date()
+
+    def _punch(self, at):
+        log = AttendanceLog.objects.create(
+            user=self.user, timestamp=datetime.combine(self.today, at), log_type="in"
+        )
+        daily_attendance.logs_changed([(self.user.id, log.timestamp)])
+
+    def _today_row(self):
+        return daily_attendance.daily_rows([self.user.id], self.today, self.today).get()
+
+    # تردد بین محاسبه روز (از ترددهای قبلی) و ذخیره آن می‌رسد
+    def test_punch_between_read_and_store(self):
+        compute_days = daily_attendance.compute_days
+        punched = []
+
+        def compute_then_punch(*args):
+            rows = compute_days(*args)
+            if not punched:
+                punched.append(True)
+                self._punch(time(9, 5))
+            return rows
+
+        with mock.patch.object(daily_attendance, "compute_days", side_effect=compute_then_punch):
+            stale = daily_attendance.daily_rows([self.user.id], self.today, self.today)
+            self.assertFalse(stale.filter(punches=0).exists())
+        self.assertTrue(punched)
+
+        row = self._today_row()
+        self.assertEqual(row.punches, 1)
+        self.assertEqual(row.status, "present")
+        self.assertEqual(row.tardy_minutes, 5)
+
+    def test_punch_after_store_replaces_row(self):
+        self.assertEqual(self._today_row().punches, 0)
+        self._punch(time(8, 55))
+        self.assertFalse(DailyAttendance.objects.filter(user=self.user, date=self.today).exists())
+        row = self._today_row()
+        self.assertEqual(row.punches, 1)
+        self.assertEqual(row.tardy_minutes, 0)
+
+# درون‌ریزی یک دسته بزرگ تردد برای بیش از ۱۰۰۰ کاربر در یک فراخوانی
+class LogsChangedManyUsersTests(TestCase):
+
+    def test_more_than_thousand_users(self):
+        User.objects.bulk_create(
+            User(username=f"u{i}", personnel_code=f"p{i}", national_id=f"n{i}") for i in range(1200)
+        )
+        user_ids = list(User.objects.values_list("id", flat=True))
+        today = timezone.now().replace(tzinfo=None).date()
+        start = today - timedelta(days=5)
+        daily_attendance.ensure_days(user_ids, start, today)
+
+        changes = [
+            (user_id, datetime.combine(today - timedelta(days=i % 3), time(9, 0)))
+            for i, user_id in enumerate(user_ids)
+        ]
+        daily_attendance.logs_changed(changes, recompute=False)
+
+        kept = DailyAttendance.objects.filter(user_id__in=user_ids).count()
+        # هر کاربر روزهای پیش از «روز تردد منهای یک» را نگه می‌دارد: ۴، ۳ یا ۲ روز
+        self.assertEqual(kept, 400 * 4 + 400 * 3 + 400 * 2)
+        self.assertFalse(User.objects.filter(id__in=user_ids, daily_version=0).exists())
@@ -0,0 +1,89 @@
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from attendance.models import AttendanceLog, LeaveRequest, Shift
+
+User = get_user_model()
+
+# تعداد پرس‌وجوهای داشبورد مدیریت نباید با تعداد کارمندان بزرگ شود
+class DashboardQueryCountTests(TestCase):
+
+    def setUp(self):
+        self.shift = Shift.objects.create(name="صبح", start_time=time(9, 0), end_time=time(17, 0))
+        self.staff = User.objects.create_user(
+            username="boss", password="x", personnel_code="s0", national_id="s0", is_staff=True
+        )
+        self.client.force_login(self.staff)
+        session = self.client.session
+        session["face_verified"] = True
+        session.save()
+        self.seeded = 0
+
+    # کارمندان تازه با ورود و خروج سه روز اخیر (یک در میان با تأخیر) و یک مرخصی در انتظار
+    def _seed(self, count):
+
+        today = timezone.now().replace(tzinfo=None).date()
+        for i in range(self.seeded, self.seeded + count):
+            user = User.objects.create_user(
+                username=f"u{i}", password="x", personnel_code=f"p{i}", national_id=f"n{i}", shift=self.shift
+            )
+            for back in range(3):
+                day = today - timedelta(days=back)
+                arrive = time(9, 20) if i % 2 else time(8, 50)
+                AttendanceLog.objects.create(user=user, timestamp=datetime.combine(day, arrive), log_type="in")
+                AttendanceLog.objects.create(user=user, timestamp=datetime.combine(day, time(17, 0)), log_type="out")
+            LeaveRequest.objects.create(user=user, start_date=today, end_date=today, status="pending")
+        self.seeded += count
+
+    # خلاصه روزانه در اولین درخواست ساخته می‌شود؛ شمارش روی درخواست بعدی است
+    def _get_warm(self):
+        self.client.get(reverse("management_dashboard"))
+        return self.client.get(reverse("management_dashboard"))
+
+    def test_query_count_does_not_grow_with_users(self):
+        self._seed(5)
+        self._get_warm()
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get(reverse("management_dashboard"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["present_count"], 5)
+        queries = len(small)
+
+        self._seed(5)
+        self._get_warm()
+        with self.assertNumQueries(queries):
+            response = self.client.get(reverse("management_dashboard"))
+        self.assertEqual(response.context["present_count"], 10)
+        self.assertEqual(response.context["leave_count"], 10)
+        self.assertEqual(len(response.context["tardy_users"]), 5)
+
+# هر درخواست مرخصی روز (حتی در انتظار) کارمند را در فهرست مرخصی می‌گذارد، نه غایبان
+class LeaveStatusTests(TestCase):
+
+    def setUp(self):
+        self.staff = User.objects.create_user(
+            username="boss", password="x", personnel_code="s0", national_id="s0", is_staff=True
+        )
+        self.client.force_login(self.staff)
+        session = self.client.session
+        session["face_verified"] = True
+        session.save()
+        self.user = User.objects.create_user(username="u1", password="x", personnel_code="p1", national_id="n1")
+        today = timezone.now().replace(tzinfo=None).date()
+        LeaveRequest.objects.create(user=self.user, start_date=today, end_date=today, status="pending")
+
+    def test_pending_leave_on_dashboard(self):
+        response = self.client.get(reverse("management_dashboard"))
+        self.assertEqual(list(response.context["leave_users"]), [self.user])
+        self.assertNotIn(self.user, response.context["absent_users"])
+
+    def test_pending_leave_in_status_api(self):
+        data = self.client.get(reverse("api_attendance_status")).json()
+        self.assertEqual([entry["id"] for entry in data["leave"]], [self.user.id])
+        self.assertNotIn(self.user.id, [entry["id"] for entry in data["absent"]])
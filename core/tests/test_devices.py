@@ -0,0 +1,46 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from core.heartbeat import DEFAULT_DEVICE_ID, UNKNOWN_DEVICE, heartbeat
+from core.models import Device
+
+User = get_user_model()
+
+# دستگاه حذف‌شده با ضربان، نشست یا توکن قدیمی دوباره ساخته یا پذیرفته نمی‌شود
+class DeletedDeviceTests(TestCase):
+
+    def setUp(self):
+        heartbeat.invalidate()
+        self.device = Device.objects.create(pk=DEFAULT_DEVICE_ID + 1, name="Gate B", is_active=False)
+        self.token = self.device.issue_token()
+        self.device.save()
+        self.pk = self.device.pk
+        self.device.delete()
+        heartbeat.invalidate(self.pk)
+
+    def test_heartbeat_does_not_recreate_device(self):
+        heartbeat.beat(self.pk)
+        self.assertFalse(Device.objects.filter(pk=self.pk).exists())
+        self.assertEqual(heartbeat.state(self.pk), UNKNOWN_DEVICE)
+        self.assertFalse(heartbeat.is_active(self.pk))
+
+    def test_default_device_is_created(self):
+        heartbeat.beat(DEFAULT_DEVICE_ID)
+        self.assertTrue(Device.objects.filter(pk=DEFAULT_DEVICE_ID).exists())
+        self.assertEqual(heartbeat.state(DEFAULT_DEVICE_ID), (True, None))
+
+    def test_session_device_is_dropped(self):
+        user = User.objects.create_user(username="kiosk", password="x", personnel_code="k", national_id="k")
+        self.client.force_login(user)
+        session = self.client.session
+        session["device_id"] = self.pk
+        session.save()
+        response = self.client.post(reverse("api_device_heartbeat"))
+        self.assertEqual(response.status_code, 401)
+        self.assertNotIn("device_id", self.client.session)
+        self.assertFalse(Device.objects.filter(pk=self.pk).exists())
+
+    def test_token_is_rejected(self):
+        response = self.client.post(reverse("api_device_heartbeat"), HTTP_X_DEVICE_TOKEN=self.token)
+        self.assertEqual(response.status_code, 401)
@@ -0,0 +1,72 @@
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+
+from core.face_gallery import EMBEDDING_SIZE
+from core.face_index import FaceIndex
+from core.face_pipeline import MATCH_SAVE_DISTANCE
+
+ENGINES = {
+    "exact": {"FACE_INDEX_ENGINE": "exact"},
+    "ivf": {
+        "FACE_INDEX_ENGINE": "ivf",
+        "FACE_IVF_MIN_SIZE": 1,
+        "FACE_IVF_NLIST": 64,
+        "FACE_IVF_NPROBE": 2,
+        "FACE_IVF_GUARD": True,
+    },
+    "int8": {"FACE_INDEX_ENGINE": "int8"},
+}
+
+# موتورهای ivf و int8 باید همان کاربر و فاصله نزدیک‌ترین تطبیق جستجوی دقیق را بدهند
+class FaceIndexEngineTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        rng = np.random.default_rng(7)
+        users = 3000
+        # دو الگو برای هر کاربر در اطراف یک مرکز، در مقیاس بردارهای dlib (نرم نزدیک ۱)
+        centers = rng.normal(0, 0.09, (users, EMBEDDING_SIZE))
+        matrix = np.repeat(centers, 2, axis=0) + rng.normal(0, 0.02, (users * 2, EMBEDDING_SIZE))
+        user_ids = np.repeat(np.arange(1, users + 1, dtype=np.int64), 2)
+        # بردارهای نزدیک یک کاربر (تطبیق) و بردارهای تصادفی (ناشناس)
+        known = centers[rng.choice(users, 40, replace=False)] + rng.normal(0, 0.03, (40, EMBEDDING_SIZE))
+        unknown = rng.normal(0, 0.09, (20, EMBEDDING_SIZE))
+        cls.probes = np.vstack([known, unknown]).astype(np.float32)
+        cls.indexes = {}
+        for name, engine in ENGINES.items():
+            with override_settings(**engine):
+                index = FaceIndex(refresh_seconds=3600)
+                index.load(user_ids, matrix)
+            cls.indexes[name] = index
+
+    def _results(self, name, radius=None):
+        index = self.indexes[name]
+        with override_settings(**ENGINES[name]):
+            single = [index.match(probe, radius=radius) for probe in self.probes]
+            many = index.match_many(self.probes, radius=radius)
+        return single, many
+
+    def _assert_same_top1(self, expected, actual):
+        self.assertEqual(len(expected), len(actual))
+        for want, got in zip(expected, actual):
+            self.assertEqual(got[0][0], want[0][0])
+            self.assertAlmostEqual(got[0][1], want[0][1], places=5)
+
+    def test_engines_agree_with_exact(self):
+        exact_single, exact_many = self._results("exact")
+        self._assert_same_top1(exact_single, exact_many)
+        for name in ("ivf", "int8"):
+            with self.subTest(engine=name):
+                single, many = self._results(name)
+                self._assert_same_top1(exact_single, single)
+                self._assert_same_top1(exact_single, many)
+
+    # با شعاع تطبیق، IVF فقط برای تطبیق‌های درون شعاع تضمین دارد
+    def test_ivf_agrees_within_match_radius(self):
+        exact_single, _ = self._results("exact")
+        single, many = self._results("ivf", radius=MATCH_SAVE_DISTANCE)
+        matched = [i for i, result in enumerate(exact_single) if result[0][1] < MATCH_SAVE_DISTANCE]
+        self.assertGreater(len(matched), 30)
+        self._assert_same_top1([exact_single[i] for i in matched], [single[i] for i in matched])
+        self._assert_same_top1([exact_single[i] for i in matched], [many[i] for i in matched])
@@ -0,0 +1,59 @@
+import io
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from attendance.models import AttendanceLog
+from core.log_import import LogImporter, iter_rows
+
+User = get_user_model()
+
+# درون‌ریزی دسته‌ای تردد: تکراری‌ها (با پایگاه داده، درون و بین دسته‌ها)، کد ناشناس و ردیف نامعتبر
+class LogImporterTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="u1", password="x", personnel_code="p1", national_id="n1")
+        AttendanceLog.objects.create(user=self.user, timestamp=datetime(2024, 1, 1, 8, 0), log_type="in")
+
+    def _rows(self):
+        return [
+            {"personnel_code": "p1", "timestamp": "2024-01-01T08:00:00", "log_type": "in"},  # در پایگاه داده
+            {"code": "p1", "time": "2024/01/01 17:00", "type": "خروج"},
+            {"code": "p1", "time": "2024/01/01 17:00", "type": "out"},  # تکراری درون دسته
+            {"code": "p1", "time": "1402/10/12 08:10", "type": "ورود"},  # تاریخ شمسی
+            {"code": "p1", "time": "2024-01-01T17:00:00", "type": "out"},  # تکراری دسته قبل
+            {"code": "zz", "time": "2024-01-03T08:00:00", "type": "in"},
+            {"code": "p1", "time": "not a date", "type": "in"},
+            {"code": "p1", "time": "2024-01-04T08:00:00", "type": "lunch"},
+            {"time": "2024-01-04T08:00:00", "type": "in"},
+            None,
+        ]
+
+    def test_import_counts_and_rows(self):
+        stats = LogImporter(chunk_size=3).run(self._rows())
+        self.assertEqual(stats["rows"], 10)
+        self.assertEqual(stats["inserted"], 2)
+        self.assertEqual(stats["duplicates"], 3)
+        self.assertEqual(stats["unknown_code"], 1)
+        self.assertEqual(stats["invalid"], 4)
+        self.assertEqual(
+            list(
+                AttendanceLog.objects.filter(source="import")
+                .order_by("timestamp")
+                .values_list("timestamp", "log_type")
+            ),
+            [(datetime(2024, 1, 1, 17, 0), "out"), (datetime(2024, 1, 2, 8, 10), "in")],
+        )
+
+    def test_dry_run_matches_real_run_without_writing(self):
+        importer = LogImporter(chunk_size=3, dry_run=True)
+        stats = importer.run(self._rows())
+        self.assertEqual((stats["inserted"], stats["duplicates"]), (2, 3))
+        self.assertEqual(importer.unknown_codes, {"zz"})
+        self.assertFalse(AttendanceLog.objects.filter(source="import").exists())
+
+    def test_ndjson_invalid_lines(self):
+        stream = io.StringIO('{"code": "p1", "time": "2024-01-05T08:00:00", "type": "in"}\n\nnot json\n')
+        stats = LogImporter().run(iter_rows(stream, "ndjson"))
+        self.assertEqual((stats["rows"], stats["inserted"], stats["invalid"]), (2, 1, 1))
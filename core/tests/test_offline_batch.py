@@ -0,0 +1,100 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from attendance.models import AttendanceLog
+from core import face_pipeline
+from core.heartbeat import heartbeat
+
+User = get_user_model()
+
+# ارسال دوباره صف آفلاین کیوسک نباید تردد تکراری بسازد یا ترتیب ورود/خروج را به هم بزند
+class OfflineBatchReplayTests(TestCase):
+
+    def setUp(self):
+        heartbeat.invalidate()
+        self.kiosk = User.objects.create_user(username="kiosk", password="x", personnel_code="k", national_id="k")
+        self.user = User.objects.create_user(username="u1", password="x", personnel_code="p1", national_id="n1")
+        self.client.force_login(self.kiosk)
+        self.now = timezone.now().replace(tzinfo=None, microsecond=0)
+        # ترددی که پیش از وصل شدن کیوسک از مسیر دیگری ثبت شده است
+        AttendanceLog.objects.create(user=self.user, timestamp=self.now - timedelta(hours=8), log_type="in")
+
+    # هر تصویر به نام کاربر (u1) یا ناشناس تطبیق داده می‌شود
+    def _verify(self, pairs, timer=None, groups=None):
+        return [
+            (None, [(self.user.id, 0.3)] if img1 == "u1" else [], None)
+            for img1, _, _ in pairs
+        ]
+
+    def _capture(self, capture_id, before, image="u1"):
+        ts = (self.now - before - timedelta(hours=3, minutes=30)).timestamp() * 1000
+        return {"id": capture_id, "ts": ts, "image1": image, "image2": image}
+
+    def _post(self, captures):
+        with mock.patch.object(face_pipeline, "verify_frame_batch", side_effect=self._verify):
+            response = self.client.post(
+                reverse("api_verify_batch"), json.dumps({"captures": captures}), content_type="application/json"
+            )
+        return {r["id"]: r for r in response.json()["results"]}
+
+    def _batch(self):
+        return [
+            # پیش از ترددی که سرور دارد (زمان کیوسک عقب‌تر از ترتیب رسیدن)
+            self._capture("c1", timedelta(hours=5)),
+            self._capture("c2", timedelta(hours=0)),
+            # ضربه دوباره در بازه تردد تکراری
+            self._capture("c3", timedelta(hours=0, minutes=-1)),
+            self._capture("c4", timedelta(hours=-3)),
+            self._capture("c5", timedelta(hours=-3), image="x"),
+        ]
+
+    def test_replayed_batch_records_each_capture_once(self):
+        first = self._post(self._batch())
+        self.assertEqual(
+            {k: (r["status"], r.get("log_type")) for k, r in first.items()},
+            {
+                "c1": ("recorded", "in"),
+                "c2": ("recorded", "out"),
+                "c3": ("duplicate", None),
+                "c4": ("recorded", "in"),
+                "c5": ("unknown", None),
+            },
+        )
+
+        second = self._post(self._batch())
+        self.assertEqual(
+            {k: r["status"] for k, r in second.items()},
+            {"c1": "recorded", "c2": "recorded", "c3": "duplicate", "c4": "recorded", "c5": "unknown"},
+        )
+        logs = dict(
+            AttendanceLog.objects.filter(capture_id__isnull=False).values_list("capture_id", "log_type")
+        )
+        self.assertEqual(logs, {"c1": "in", "c2": "out", "c4": "in"})
+        self.assertEqual(AttendanceLog.objects.filter(user=self.user).count(), 4)
+
+    # همان ضبط هم‌زمان از درخواست دیگری ثبت شده است (بعد از بررسی capture_id و پیش از درج)
+    def test_concurrent_replay_is_ignored(self):
+        capture = self._capture("c1", timedelta(hours=0))
+
+        def verify_while_other_request_records(pairs, timer=None, groups=None):
+            # دور از بازه تردد تکراری تا فقط یکتایی capture_id (ignore_conflicts) جلوی درج را بگیرد
+            AttendanceLog.objects.create(
+                user=self.user, timestamp=self.now - timedelta(hours=1), log_type="out", capture_id="c1"
+            )
+            return self._verify(pairs)
+
+        with mock.patch.object(face_pipeline, "verify_frame_batch", side_effect=verify_while_other_request_records):
+            response = self.client.post(
+                reverse("api_verify_batch"), json.dumps({"captures": [capture]}), content_type="application/json"
+            )
+        self.assertEqual(response.json()["ok"], True)
+        self.assertEqual(
+            list(AttendanceLog.objects.filter(capture_id="c1").values_list("timestamp", flat=True)),
+            [self.now - timedelta(hours=1)],
+        )
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopFutureHandlers
+
+# نام فیلدهای فریم چهره در درخواست‌های multipart (frames: فریم‌های اضافه ثبت‌نام، frame: فریم جریانی)
+FACE_FRAME_FIELDS = ("image1", "image2", "frames", "frame")
+
+# دریافت فریم‌های چهره در حافظه با کنترل حجم حین دریافت
+class FaceFrameUploadHandler(FileUploadHandler):
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.active = field_name in FACE_FRAME_FIELDS
+        if self.active:
+            self.chunks = []
+            self.size = 0
+            raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        self.size += len(raw_data)
+        limit = getattr(settings, "FACE_UPLOAD_MAX_BYTES", 2 * 1024 * 1024)
+        if self.size > limit:
+            print("Face frame upload too large:", self.field_name)
+            self.active = False
+            self.chunks = []
+            raise SkipFile()
+        self.chunks.append(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return SimpleUploadedFile(
+            self.file_name or self.field_name, data, self.content_type
+        )
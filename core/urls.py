@@ -1,6 +1,10 @@
 from django.urls import path
+from django.conf import settings
 from django.contrib.auth.views import LogoutView
-from . import views
+from . import async_views, views
+
+# نسخه async اندپوینت‌های کیوسک و وضعیت برای اجرا روی ASGI
+kiosk_views = async_views if getattr(settings, "FACE_ASYNC_VIEWS", False) else views
 
 urlpatterns = [
 
@@ -16,17 +20,22 @@ urlpatterns = [
     path('management/suspicions/<int:pk>/action/', views.suspicious_log_action, name='suspicious_log_action'),
     path('management/edit-requests/', views.edit_requests, name='edit_requests'),
     path('management/edit-requests/add-log/', views.add_log, name='add_log'),
+    path('management/edit-requests/import-logs/', views.import_logs, name='import_logs'),
     path('management/leave-requests/', views.leave_requests, name='leave_requests'),
     path('management/leave-requests/add/', views.add_leave, name='add_leave'),
     path('management/attendance-status/', views.attendance_status, name='attendance_status'),
-    path('management/attendance-status/api/', views.api_attendance_status, name='api_attendance_status'),
+    path('management/attendance-status/api/', kiosk_views.api_attendance_status, name='api_attendance_status'),
 
     path("device/face-check/",      views.device_face_check,              name="device_face_check"),
-    path("device/face-check/api/",  views.api_device_verify_face,         name="api_device_verify_face"),
+    path("device/face-check/api/",  kiosk_views.api_device_verify_face,   name="api_device_verify_face"),
 
     path("device/",                 views.device_page,                    name="device_page"),
+    path("device/sw.js",            views.device_service_worker,          name="device_service_worker"),
 
-    path("api/verify-face/",        views.api_verify_face,                name="api_verify_face"),
+    path("api/verify-face/",        kiosk_views.api_verify_face,          name="api_verify_face"),
+    path("api/verify-stream/",      kiosk_views.api_verify_stream,        name="api_verify_stream"),
+    path("api/verify-batch/",       views.api_verify_batch,               name="api_verify_batch"),
+    path("api/device-heartbeat/",   views.api_device_heartbeat,           name="api_device_heartbeat"),
     path("api/register-face/",      views.api_register_face,              name="api_register_face"),
 
     path("user/inquiry/",           views.user_inquiry,                   name="user_inquiry"),
@@ -50,6 +59,10 @@ urlpatterns = [
          views.register_face_api,            name="register_face_api"),
     path("management/weekly-holidays/", views.weekly_holidays, name="weekly_holidays"),
     path("management/device/", views.device_settings, name="device_settings"),
+    path("management/device/add/", views.device_edit, name="device_add"),
+    path("management/device/<int:pk>/edit/", views.device_edit, name="device_edit"),
+    path("management/device/<int:pk>/delete/", views.device_delete, name="device_delete"),
+    path("management/device/timings/", views.api_face_timings, name="api_face_timings"),
     path("management/shifts/", views.shift_list, name="shift_list"),
     path("management/shifts/add/", views.shift_edit, name="shift_add"),
     path("management/shifts/<int:pk>/edit/", views.shift_edit, name="shift_edit"),
@@ -1,18 +1,14 @@
-import base64
-import io
-import json
+import csv
 import secrets
-import os
-import math
-from datetime import timedelta, datetime, time
+from datetime import timedelta, datetime, time, timezone as dt_timezone
+from functools import wraps
+from importlib import import_module
 
-import face_recognition
-import numpy as np
-from PIL import Image
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import get_user_model, login
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.contrib.auth.views import LoginView
+from django.contrib.auth.views import LoginView, redirect_to_login
 from django.core.files.base import ContentFile
 from django.http import JsonResponse
 import jdatetime
@@ -20,10 +16,11 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.templatetags.static import static
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
-from django.db.models import Count, Q
+from django.db.models import Count, OuterRef, Q, Subquery
 
 from attendance.models import (
     AttendanceLog,
@@ -41,6 +38,7 @@ from core.forms import (
     EditRequestForm,
     LeaveRequestForm,
     ManualLogForm,
+    LogImportForm,
     ManualLeaveForm,
     AttendanceStatusForm,
     UserLogsRangeForm,
@@ -50,15 +48,48 @@ from core.forms import (
     LeaveTypeForm,
     ReportFilterForm,
     MonthlyPerformanceForm,
+    DeviceForm,
 )
+from .background import background
+from .face_timing import face_timed, latency_histogram, timed
+from .heartbeat import DEFAULT_DEVICE_ID, heartbeat
+from .log_import import LogImporter, iter_rows, text_stream
+from . import daily_attendance
+from .daily_attendance import get_user_shift as _get_user_shift, weekday_index as _weekday_index
 from .models import Device
 
-FACE_DISTANCE_THRESHOLD = 0.5
-LIVENESS_MOVEMENT_THRESHOLD = 0.08
-MATCH_SAVE_DISTANCE = 0.6
+# پشته چهره (dlib، numpy، PIL) فقط در اولین استفاده از اندپوینت‌های چهره بارگذاری می‌شود
+face = SimpleLazyObject(lambda: import_module("core.face_pipeline"))
+# ایندکس و سرویس چهره بدون dlib؛ برای حذف کاربر و مانند آن
+face_registry = SimpleLazyObject(lambda: import_module("core.face_registry"))
+# جریان‌های زنده‌سنجی (همراه پشته چهره بارگذاری می‌شود)
+face_stream = SimpleLazyObject(lambda: import_module("core.face_stream"))
 
 User = get_user_model()
 
+STREAM_DISABLED = "زنده‌سنجی جریانی فعال نیست."
+
+# حافظه‌های نهانی که بین فرایندها مشترک نیستند
+PROCESS_LOCAL_CACHES = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+# زنده‌سنجی جریانی فقط وقتی فعال است که حافظه نهان جریان‌ها بین فرایندها مشترک باشد
+# (یا اجرای تک‌فرایندی صریحاً اعلام شده باشد)؛ وگرنه فریم‌های یک کیوسک به فرایندهای مختلف می‌رسند
+def _stream_enabled():
+
+    if not getattr(settings, "FACE_STREAM_ENABLED", False):
+        return False
+    if getattr(settings, "FACE_STREAM_SINGLE_PROCESS", False):
+        return True
+    alias = getattr(settings, "FACE_STREAM_CACHE", "default")
+    backend = settings.CACHES.get(alias, {}).get("BACKEND")
+    return backend not in PROCESS_LOCAL_CACHES
+
+# کمترین فاصله دو تردد پیاپی یک کاربر؛ نزدیک‌تر از آن تردد تکراری است
+DUPLICATE_TAP_WINDOW = timedelta(minutes=5)
+
 # زمان فعلی بدون منطقه
 def _now():
     return timezone.now().replace(tzinfo=None)
@@ -67,171 +98,40 @@ def _now():
 def _to_naive(dt):
     return dt.replace(tzinfo=None) if dt and dt.tzinfo is not None else dt
 
-# تعیین شیفت کاربر در صورت وجود
-def _get_user_shift(user):
-
-    if getattr(user, "shift", None):
-        return user.shift
-    if getattr(user, "group", None) and user.group and user.group.shift:
-        return user.group.shift
-    return None
-def _weekday_index(date):
-
-    # تبدیل اندیس هفته به فرمت مورد نیاز
-    return (date.weekday() + 2) % 7
-
-# محاسبه عملکرد ماهانه کاربر
+# محاسبه عملکرد ماهانه کاربر: جمع خلاصه‌های روزانه ماه
 def _calculate_monthly_performance(user, year, month):
 
     start_j = jdatetime.date(year, month, 1)
-    days_in_month = jdatetime.j_days_in_month[month - 1]
     today_j = jdatetime.date.today()
     if year == today_j.year and month == today_j.month:
-        days_in_month = today_j.day
         end_j = today_j
     else:
-        end_j = jdatetime.date(year, month, days_in_month)
+        end_j = jdatetime.date(year, month, jdatetime.j_days_in_month[month - 1])
     start_g = start_j.togregorian()
     end_g = end_j.togregorian()
 
-    shift = _get_user_shift(user)
-    shift_start = shift.start_time if shift else time(9, 0)
-    shift_end = shift.end_time if shift else time(17, 0)
-
-    EARLY_TOL = timedelta(minutes=30)
-    LATE_TOL = timedelta(minutes=30)
-
-    global_start = datetime.combine(start_g, shift_start) - EARLY_TOL
-    global_end = datetime.combine(end_g, shift_end) + LATE_TOL
-    if shift_end <= shift_start:
-        global_end += timedelta(days=1)
-
-    logs = list(
-        AttendanceLog.objects.filter(
-            user=user, timestamp__gte=global_start, timestamp__lt=global_end
-        ).order_by("timestamp")
-    )
-
-    weekly_holidays = set(WeeklyHoliday.objects.values_list("weekday", flat=True))
-
-    leaves_qs = LeaveRequest.objects.filter(
-        user=user,
-        status="approved",
-        start_date__lte=end_g,
-        end_date__gte=start_g,
-    )
-    leave_days = set()
-    for leave in leaves_qs:
-        cur = max(leave.start_date, start_g)
-        while cur <= min(leave.end_date, end_g):
-            leave_days.add(cur)
-            cur += timedelta(days=1)
-
-    if shift_end <= shift_start:
-        shift_minutes = (
-            datetime.combine(start_g, shift_end)
-            + timedelta(days=1)
-            - datetime.combine(start_g, shift_start)
-        ).seconds // 60
-    else:
-        shift_minutes = (
-            datetime.combine(start_g, shift_end)
-            - datetime.combine(start_g, shift_start)
-        ).seconds // 60
-
     present_minutes = 0
     mandatory_minutes = 0
     tardy_minutes = 0
     overtime_minutes = 0
     absence_days = 0
     incomplete_days = []
-
-    i = 0
-    for d in range(days_in_month):
-        day = start_g + timedelta(days=d)
-        if _weekday_index(day) in weekly_holidays or day in leave_days:
-            continue
-        mandatory_minutes += shift_minutes
-
-        start_dt = datetime.combine(day, shift_start)
-        end_dt = datetime.combine(day, shift_end)
-        if shift_end <= shift_start:
-            end_dt += timedelta(days=1)
-
-        window_start = start_dt - EARLY_TOL
-        window_end = end_dt + LATE_TOL
-
-        day_logs = []
-        prev_log = logs[i - 1] if i > 0 else None
-        while i < len(logs) and logs[i].timestamp < window_start:
-            prev_log = logs[i]
-            i += 1
-        j = i
-        while j < len(logs) and logs[j].timestamp < window_end:
-            day_logs.append(logs[j])
-            j += 1
-        i = j
-
-        session_pairs = []
-        incomplete = False
-        current_in = None
-        if prev_log and prev_log.log_type == "in":
-            current_in = prev_log.timestamp
-        for log in day_logs:
-            if log.log_type == "in":
-                if current_in is not None:
-                    session_pairs.append((current_in, log.timestamp))
-                    incomplete = True
-                current_in = log.timestamp
-            else:
-                if current_in is not None:
-                    session_pairs.append((current_in, log.timestamp))
-                    current_in = None
-                else:
-                    incomplete = True
-        if current_in is not None:
-            session_pairs.append((current_in, window_end))
-            incomplete = True
-
-        if not session_pairs and not day_logs and not (
-            prev_log and prev_log.log_type == "in"
-        ):
+    for row in daily_attendance.daily_rows([user.id], start_g, end_g).order_by("date"):
+        present_minutes += row.present_minutes
+        mandatory_minutes += row.mandatory_minutes
+        tardy_minutes += row.tardy_minutes
+        overtime_minutes += row.overtime_minutes
+        if row.status == "absent":
             absence_days += 1
-            continue
-
-        if incomplete:
-            incomplete_days.append(day)
-
-        if prev_log and prev_log.log_type == "in":
-            first_in_ts = start_dt
-        else:
-            first_in_ts = None
-            for log_entry in day_logs:
-                if log_entry.log_type == "in":
-                    first_in_ts = log_entry.timestamp
-                    break
-
-        if first_in_ts and first_in_ts > start_dt:
-            tardy_minutes += int(
-                math.ceil((first_in_ts - start_dt).total_seconds() / 60)
-            )
-
-        for in_ts, out_ts in session_pairs:
-            overlap_start = max(in_ts, start_dt)
-            overlap_end = min(out_ts, end_dt)
-            if overlap_start < overlap_end:
-                present_minutes += int(
-                    (overlap_end - overlap_start).total_seconds() // 60
-                )
-            if in_ts < start_dt:
-                overtime_minutes += int(
-                    (min(out_ts, start_dt) - in_ts).total_seconds() // 60
-                )
-            if out_ts > end_dt:
-                overtime_minutes += int(
-                    (out_ts - max(in_ts, end_dt)).total_seconds() // 60
-                )
+        if row.incomplete:
+            incomplete_days.append(row.date)
 
+    leaves_qs = LeaveRequest.objects.filter(
+        user=user,
+        status="approved",
+        start_date__lte=end_g,
+        end_date__gte=start_g,
+    )
     report = {
         "present_minutes": present_minutes,
         "mandatory_minutes": mandatory_minutes,
@@ -240,26 +140,96 @@ def _calculate_monthly_performance(user, year, month):
         "present_hours": round(present_minutes / 60, 2),
         "required_hours": round(mandatory_minutes / 60, 2),
         "overtime_minutes": overtime_minutes,
-        "incomplete_days": [d for d in incomplete_days],
+        "incomplete_days": incomplete_days,
     }
     return report, list(leaves_qs)
 
-# استخراج بردار چهره از رشته base64
-def _get_face_encoding_from_base64(data_url: str):
+# کاربرانی که درخواست مرخصی (با هر وضعیتی) روز را پوشش می‌دهد؛ فهرست‌های حضور همین قاعده را دارند
+def _leave_ids(users_qs, day):
+    return list(
+        LeaveRequest.objects.filter(user__in=users_qs, start_date__lte=day, end_date__gte=day)
+        .values_list("user_id", flat=True)
+        .distinct()
+    )
+
+# شناسه حاضران (دارای تردد در روز، از خلاصه روزانه) و مرخصی‌های یک روز
+def _day_status_ids(users_qs, day):
+
+    rows = daily_attendance.daily_rows(users_qs.values_list("id", flat=True), day, day)
+    present_ids = list(rows.filter(punches__gt=0).values_list("user_id", flat=True))
+    return present_ids, _leave_ids(users_qs, day)
+
+# ثبت لاگ مشکوک در همین درخواست تا با توقف فرایند از دست نرود؛ فقط تصویر در پس‌زمینه نوشته می‌شود
+def _save_suspicious_log(user_id, distance, timestamp, frame):
+
+    log = SuspiciousLog.objects.create(
+        matched_user_id=user_id,
+        similarity=distance,
+        timestamp=timestamp,
+    )
+    background.submit(_save_suspicious_image, log.pk, timestamp, frame)
+
+# نوشتن تصویر لاگ مشکوک در پس‌زمینه؛ خود لاگ پیش از آن در درخواست ثبت شده است
+def _save_suspicious_image(log_id, timestamp, frame):
 
     try:
-        if not data_url or ',' not in data_url:
-            return None
-        _, b64data = data_url.split(",", 1)
-        img_bytes = base64.b64decode(b64data)
-        img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-        encs = face_recognition.face_encodings(
-            np.array(img), num_jitters=5, model="large"
-        )
-        return encs[0] if encs else None
+        log = SuspiciousLog.objects.get(pk=log_id)
+        img_data, fmt = frame
+        filename = f"suspect_{int(timestamp.timestamp())}.{fmt}"
+        log.image.save(filename, ContentFile(img_data), save=False)
+        log.save(update_fields=["image"])
     except Exception as e:
-        print("Face encode error:", e)
-        return None
+        print("Suspicious log save error:", e)
+
+# آموزش دوباره در رشته پس‌زمینه تا بارگذاری dlib صفحه بررسی را معطل نکند
+def _train_from_suspicious_log(log_id):
+    face.train_from_suspicious_log(log_id)
+
+# پیام خطاهای زنده‌سنجی در دستگاه
+DEVICE_FACE_ERRORS = {
+    "no_face": "چهره یافت نشد.",
+    "no_movement": "حرکت تشخیص داده نشد.",
+}
+
+INVALID_DEVICE_TOKEN = "توکن دستگاه نامعتبر است."
+UNKNOWN_DEVICE = "دستگاه یافت نشد."
+# کوکی توکن کیوسک برای باز کردن صفحه ثبت تردد بدون ورود (ناوبری صفحه هدر توکن ندارد)
+KIOSK_TOKEN_COOKIE = "kiosk_token"
+KIOSK_TOKEN_MAX_AGE = 365 * 24 * 3600
+
+# احراز هویت کیوسک: توکن دستگاه در هدر X-Device-Token یا نشست ورود دستگاه؛
+# دستگاه حذف‌شده ناشناس است و از نشست هم کنار می‌رود
+def device_required(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = request.headers.get("X-Device-Token")
+        if token:
+            request.device_id = heartbeat.device_for_token(token)
+            if request.device_id is None:
+                return JsonResponse({"ok": False, "msg": INVALID_DEVICE_TOKEN}, status=401)
+        elif request.user.is_authenticated:
+            request.device_id = request.session.get("device_id", DEFAULT_DEVICE_ID)
+        else:
+            return redirect_to_login(request.get_full_path())
+        if not heartbeat.known(request.device_id):
+            request.session.pop("device_id", None)
+            return JsonResponse({"ok": False, "msg": UNKNOWN_DEVICE}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+# پاسخ ثبت موفق تردد در کیوسک
+def _verified_payload(u, now, log_type, tier):
+
+    img_url = u.face_image.url if hasattr(u, 'face_image') and u.face_image else static('core/avatar.png')
+    return {
+        "ok": True,
+        "name": f"{u.first_name} {u.last_name}",
+        "code": u.personnel_code,
+        "timestamp": now.isoformat(),
+        "log_type": log_type,
+        "image_url": img_url,
+        "tier": tier,
+    }
 
 # صفحه اصلی
 def home(request):
@@ -295,29 +265,25 @@ def device_face_check(request):
 @require_POST
 @login_required
 @user_passes_test(lambda u: u.is_staff)
+@face_timed("device_verify")
 def api_device_verify_face(request):
 
+    timer = request.face_timer
     try:
-        data = json.loads(request.body)
-        img1 = data.get("image1")
-        img2 = data.get("image2")
+        with timed(timer, "upload"):
+            img1, img2, boxes = face.read_frame_sources(request)
         if not img1 or not img2:
             return JsonResponse({"success": False, "error": "ارسال ناقص تصاویر."})
-        enc1 = _get_face_encoding_from_base64(img1)
-        enc2 = _get_face_encoding_from_base64(img2)
-        if enc1 is None or enc2 is None:
-            return JsonResponse({"success": False, "error": "چهره یافت نشد."})
-        movement = np.linalg.norm(enc1 - enc2)
-        if movement < LIVENESS_MOVEMENT_THRESHOLD:
-            return JsonResponse({"success": False, "error": "حرکت تشخیص داده نشد."})
-        enc = (enc1 + enc2) / 2
+        enc, error = face.pair_encoding(img1, img2, boxes, timer)
+        if error:
+            return JsonResponse({"success": False, "error": DEVICE_FACE_ERRORS[error]})
 
         if request.user.face_encoding is None:
             return JsonResponse({"success": False, "error": "چهره مدیر ثبت نشده."})
 
-        known = np.frombuffer(request.user.face_encoding, dtype=np.float64)
-        distance = np.linalg.norm(known - enc)
-        if distance < FACE_DISTANCE_THRESHOLD:
+        with timed(timer, "match"):
+            distance = face.user_distance(request.user, enc)
+        if distance < face.FACE_DISTANCE_THRESHOLD:
             return JsonResponse({"success": True, "redirect": reverse("device_page")})
         else:
             return JsonResponse({"success": False, "error": "تشخیص ناموفق."})
@@ -326,90 +292,308 @@ def api_device_verify_face(request):
         print("Device verify error:", e)
         return JsonResponse({"success": False, "error": "خطا در پردازش تصویر."})
 
-# صفحه ثبت تردد
-@login_required
+# صفحه ثبت تردد؛ فقط برای نشست ورود یا کیوسک با توکن معتبر دستگاه. پیوند راه‌اندازی
+# (?token=) توکن را در کوکی کیوسک می‌گذارد و با #token= به خود صفحه برمی‌گردد تا API هم آن را بفرستد؛
+# مدیر با ?device= دستگاه نشست خود را انتخاب می‌کند
 def device_page(request):
 
-    return render(request, "core/device.html")
+    token = request.GET.get("token")
+    if token:
+        if heartbeat.device_for_token(token) is None:
+            messages.error(request, INVALID_DEVICE_TOKEN)
+            return redirect_to_login(reverse("device_page"))
+        response = redirect(reverse("device_page") + f"#token={token}")
+        response.set_cookie(
+            KIOSK_TOKEN_COOKIE, token, max_age=KIOSK_TOKEN_MAX_AGE, httponly=True, samesite="Lax"
+        )
+        return response
+
+    device_id = None
+    cookie_token = request.COOKIES.get(KIOSK_TOKEN_COOKIE)
+    if cookie_token:
+        device_id = heartbeat.device_for_token(cookie_token)
+        if device_id is not None and not heartbeat.known(device_id):
+            device_id = None
+    if device_id is None:
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        try:
+            selected = int(request.GET.get("device", ""))
+        except ValueError:
+            selected = None
+        if selected is not None and request.user.is_staff and Device.objects.filter(pk=selected).exists():
+            request.session["device_id"] = selected
+        device_id = request.session.get("device_id", DEFAULT_DEVICE_ID)
+        if not heartbeat.known(device_id):
+            request.session.pop("device_id", None)
+            device_id = DEFAULT_DEVICE_ID
+    device = Device.objects.filter(pk=device_id).first()
+    return render(
+        request,
+        "core/device.html",
+        {
+            "device": device,
+            "stream_enabled": _stream_enabled(),
+            "trust_client_box": getattr(settings, "FACE_TRUST_CLIENT_BOX", False),
+        },
+    )
+
+# ضربان سبک کیوسک در زمان بیکاری تا دستگاه آنلاین بماند؛ وضعیت فعال بودن را برمی‌گرداند
+@csrf_exempt
+@require_POST
+@device_required
+def api_device_heartbeat(request):
+    heartbeat.beat(request.device_id)
+    return JsonResponse({"ok": True, "active": heartbeat.is_active(request.device_id)})
+
+# تصمیم نهایی پس از زنده‌سنجی: ثبت تردد، تشخیص مدیر، لاگ مشکوک یا ناشناس
+def _record_verification(request, now, tier, frame1, candidates):
+    timer = request.face_timer
+    best_user = None
+    best_dist = float("inf")
+
+    if candidates:
+        best_id, best_dist = candidates[0]
+        with timed(timer, "db"):
+            best_user = User.objects.filter(pk=best_id).first()
+        if best_user is None:
+            face_registry.update_face_index(best_id, None)
+    if best_user and best_dist < face.FACE_DISTANCE_THRESHOLD:
+        u = best_user
+        if u.is_staff:
+            return JsonResponse({"ok": False, "tier": tier, "manager_detected": True})
+        with timed(timer, "db"):
+            last_log = AttendanceLog.objects.filter(user=u).order_by('-timestamp').first()
+            last_ts = _to_naive(last_log.timestamp) if last_log else None
+            if last_log and now - last_ts < DUPLICATE_TAP_WINDOW:
+                return JsonResponse({"ok": False, "tier": tier, "msg": "تردد تکراری"})
+            log_type = 'out' if last_log and last_log.log_type == 'in' else 'in'
+            AttendanceLog.objects.create(
+                user=u, timestamp=now, log_type=log_type, source='self', device_id=request.device_id
+            )
+            daily_attendance.logs_changed([(u.id, now)])
+        return JsonResponse(_verified_payload(u, now, log_type, tier))
+
+    if best_user and best_dist < face.MATCH_SAVE_DISTANCE:
+        _save_suspicious_log(best_user.pk, best_dist, now, frame1)
+        return JsonResponse({"ok": False, "tier": tier, "suspicious": True})
+
+    return JsonResponse({"ok": False, "tier": tier, "msg": "چهره شما در سیستم ثبت نشده است."})
 
 # API ثبت تردد با تشخیص چهره
 @csrf_exempt
 @require_POST
-@login_required
+@device_required
+@face_timed("verify")
 def api_verify_face(request):
-    device, _ = Device.objects.get_or_create(id=1, defaults={"name": "Main device"})
+    timer = request.face_timer
     now = _now()
-    device.last_seen = now
-    device.save(update_fields=["last_seen"])
-    if not device.is_active:
+    with timed(timer, "db"):
+        heartbeat.beat(request.device_id)
+        active, groups = heartbeat.state(request.device_id)
+    if not active:
         return JsonResponse({"ok": False, "msg": "دستگاه غیرفعال است."})
     try:
-        data = json.loads(request.body)
-        img1 = data.get("image1")
-        img2 = data.get("image2")
+        with timed(timer, "upload"):
+            img1, img2, boxes = face.read_frame_sources(request)
         if not img1 or not img2:
             return JsonResponse({"ok": False, "msg": "ارسال ناقص تصاویر."})
-        enc1 = _get_face_encoding_from_base64(img1)
-        enc2 = _get_face_encoding_from_base64(img2)
-        if enc1 is None or enc2 is None:
-            return JsonResponse({"ok": False, "msg": "چهره به‌وضوح دیده نشد. لطفاً روبه‌رو و در نور کافی قرار بگیرید."})
-        movement = np.linalg.norm(enc1 - enc2)
-        if movement < LIVENESS_MOVEMENT_THRESHOLD:
-            return JsonResponse({"ok": False, "msg": "حرکت تشخیص داده نشد. لطفاً دستور روی صفحه را اجرا کنید."})
-        enc = (enc1 + enc2) / 2
-        best_user = None
-        best_dist = float("inf")
-
-        for u in User.objects.exclude(face_encoding__isnull=True):
-            known = np.frombuffer(u.face_encoding, dtype=np.float64)
-            dist = np.linalg.norm(known - enc)
-            if dist < best_dist:
-                best_dist = dist
-                best_user = u
-            if dist < FACE_DISTANCE_THRESHOLD:
-                if u.is_staff:
-                    return JsonResponse({"ok": False, "manager_detected": True})
-                last_log = AttendanceLog.objects.filter(user=u).order_by('-timestamp').first()
-                last_ts = _to_naive(last_log.timestamp) if last_log else None
-                if last_log and now - last_ts < timedelta(minutes=5):
-                    return JsonResponse({"ok": False, "msg": "تردد تکراری"})
-                log_type = 'out' if last_log and last_log.log_type == 'in' else 'in'
-                AttendanceLog.objects.create(user=u, timestamp=now, log_type=log_type, source='self')
-                img_url = u.face_image.url if hasattr(u, 'face_image') and u.face_image else static('core/avatar.png')
-                return JsonResponse({
-                    "ok": True,
-                    "name": f"{u.first_name} {u.last_name}",
-                    "code": u.personnel_code,
-                    "timestamp": now.isoformat(),
-                    "log_type": log_type,
-                    "image_url": img_url
-                })
-
-        if best_user and best_dist < MATCH_SAVE_DISTANCE:
-            try:
-                raw_img = img1
-                if "," in raw_img:
-                    header, b64data = raw_img.split(",", 1)
-                    fmt = header.split(";")[0].split("/")[1]
-                else:
-                    b64data = raw_img
-                    fmt = "png"
-                img_data = base64.b64decode(b64data)
-                filename = f"suspect_{int(now.timestamp())}.{fmt}"
-                log = SuspiciousLog.objects.create(
-                    matched_user=best_user,
-                    similarity=best_dist,
-                    timestamp=now,
+        tier, frame1, candidates, error = face.verify_frames(img1, img2, boxes, timer, groups)
+        if error:
+            return JsonResponse({"ok": False, "tier": tier, "msg": error})
+        return _record_verification(request, now, tier, frame1, candidates)
+    except Exception as e:
+        print("Verify face error:", e)
+        return JsonResponse({"ok": False, "msg": "خطا در پردازش تصویر. لطفاً دوباره تلاش کنید."})
+
+# زمان ضبط آفلاین از میلی‌ثانیه‌های کلاینت؛ زمان آینده (ساعت جلوی کیوسک) به اکنون محدود می‌شود
+# و ضبط قدیمی‌تر از FACE_OFFLINE_MAX_AGE_HOURS پذیرفته نمی‌شود
+def _capture_time(ts, now):
+
+    try:
+        captured = datetime.fromtimestamp(
+            float(ts) / 1000, tz=dt_timezone.utc if settings.USE_TZ else None
+        )
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+    captured = _to_naive(captured)
+    if now - captured > timedelta(hours=getattr(settings, "FACE_OFFLINE_MAX_AGE_HOURS", 72)):
+        return None
+    return min(captured, now)
+
+# ثبت دسته‌ای ضبط‌های صف آفلاین با زمان کلاینت؛ هر شناسه ضبط فقط یک بار ثبت می‌شود
+# و بازه تردد تکراری نسبت به ترددهای موجود و ضبط‌های همین دسته (قبل و بعد) سنجیده می‌شود
+def _record_capture_batch(device_id, now, captures, groups, timer):
+
+    results = {}
+    with timed(timer, "db"):
+        done = set(
+            AttendanceLog.objects.filter(capture_id__in=[c[0] for c in captures if c[0]])
+            .values_list("capture_id", flat=True)
+        )
+    pending = []
+    for capture in captures:
+        capture_id, ts = capture[0], capture[1]
+        if not capture_id or capture_id in results:
+            continue
+        captured = _capture_time(ts, now)
+        if capture_id in done:
+            results[capture_id] = {"status": "recorded"}
+        elif captured is None:
+            results[capture_id] = {"status": "expired"}
+        else:
+            results[capture_id] = None
+            pending.append((captured, capture))
+
+    verdicts = face.verify_frame_batch([c[2:] for _, c in pending], timer, groups)
+    matched = []
+    for (captured, capture), (frame1, candidates, error) in zip(pending, verdicts):
+        if error:
+            results[capture[0]] = {"status": error}
+        elif not candidates:
+            results[capture[0]] = {"status": "unknown"}
+        else:
+            matched.append((captured, capture[0], frame1, *candidates[0]))
+
+    with timed(timer, "db"):
+        users = User.objects.only("id", "is_staff").in_bulk({m[3] for m in matched})
+    punches = []
+    for captured, capture_id, frame1, user_id, dist in matched:
+        user = users.get(user_id)
+        if user is None:
+            face_registry.update_face_index(user_id, None)
+            results[capture_id] = {"status": "unknown"}
+        elif dist < face.FACE_DISTANCE_THRESHOLD:
+            if user.is_staff:
+                results[capture_id] = {"status": "manager"}
+            else:
+                punches.append((captured, capture_id, user_id))
+        elif dist < face.MATCH_SAVE_DISTANCE:
+            _save_suspicious_log(user_id, dist, captured, frame1)
+            results[capture_id] = {"status": "suspicious"}
+        else:
+            results[capture_id] = {"status": "unknown"}
+
+    if punches:
+        logs = _punch_logs(device_id, sorted(punches), timer)
+        for capture_id, log_type in logs:
+            results[capture_id] = (
+                {"status": "recorded", "log_type": log_type} if log_type else {"status": "duplicate"}
+            )
+    return [{"id": capture_id, **result} for capture_id, result in results.items()]
+
+# نوع ورود/خروج و تردد تکراری ضبط‌های مرتب‌شده بر اساس زمان با دو پرس‌وجو برای همه کاربران
+# (ترددهای اطراف بازه ضبط‌ها و آخرین تردد پیش از آن) و یک bulk_create
+def _punch_logs(device_id, punches, timer):
+
+    user_ids = {user_id for _, _, user_id in punches}
+    start = punches[0][0] - DUPLICATE_TAP_WINDOW
+    end = punches[-1][0] + DUPLICATE_TAP_WINDOW
+    with timed(timer, "db"):
+        before = dict(
+            User.objects.filter(id__in=user_ids)
+            .annotate(
+                last_type=Subquery(
+                    AttendanceLog.objects.filter(user=OuterRef("pk"), timestamp__lt=start)
+                    .order_by("-timestamp")
+                    .values("log_type")[:1]
                 )
-                log.image.save(filename, ContentFile(img_data), save=True)
-            except Exception as e:
-                print("Suspicious log save error:", e)
-                SuspiciousLog.objects.create(matched_user=best_user, similarity=best_dist, timestamp=now)
-            return JsonResponse({"ok": False, "suspicious": True})
+            )
+            .values_list("id", "last_type")
+        )
+        events = {user_id: [] for user_id in user_ids}
+        for user_id, ts, log_type in (
+            AttendanceLog.objects.filter(user_id__in=user_ids, timestamp__range=(start, end))
+            .values_list("user_id", "timestamp", "log_type")
+        ):
+            events[user_id].append((_to_naive(ts), log_type))
+
+    logs, outcome = [], []
+    for captured, capture_id, user_id in punches:
+        nearby = events[user_id]
+        if any(abs(ts - captured) < DUPLICATE_TAP_WINDOW for ts, _ in nearby):
+            outcome.append((capture_id, None))
+            continue
+        earlier = [event for event in nearby if event[0] < captured]
+        last_type = max(earlier)[1] if earlier else before.get(user_id)
+        log_type = 'out' if last_type == 'in' else 'in'
+        nearby.append((captured, log_type))
+        logs.append(
+            AttendanceLog(
+                user_id=user_id, timestamp=captured, log_type=log_type,
+                source='self', device_id=device_id, capture_id=capture_id,
+            )
+        )
+        outcome.append((capture_id, log_type))
+    with timed(timer, "db"):
+        AttendanceLog.objects.bulk_create(logs, ignore_conflicts=True)
+        daily_attendance.logs_changed([(log.user_id, log.timestamp) for log in logs])
+    return outcome
+
+# API صف آفلاین کیوسک: ضبط‌هایی که هنگام قطع ارتباط ذخیره شده‌اند یک‌جا و با زمان خودشان ثبت می‌شوند؛
+# برای هر شناسه ضبط وضعیت نهایی برمی‌گردد تا کیوسک آن را از صف حذف کند؛ خطای گذرا (retry)
+# صف را نگه می‌دارد و رد دسته ناقص یعنی ارسال دوباره‌اش فایده‌ای ندارد
+@csrf_exempt
+@require_POST
+@device_required
+@face_timed("verify_batch")
+def api_verify_batch(request):
+    timer = request.face_timer
+    now = _now()
+    with timed(timer, "db"):
+        heartbeat.beat(request.device_id)
+        active, groups = heartbeat.state(request.device_id)
+    if not active:
+        return JsonResponse({"ok": False, "retry": True, "msg": "دستگاه غیرفعال است."})
+    try:
+        with timed(timer, "upload"):
+            captures = face.read_capture_batch(request)
+        if captures is None:
+            return JsonResponse({"ok": False, "msg": "ارسال ناقص تصاویر."})
+        results = _record_capture_batch(request.device_id, now, captures, groups, timer)
+        return JsonResponse({"ok": True, "results": results})
+    except Exception as e:
+        print("Verify batch error:", e)
+        return JsonResponse({"ok": False, "retry": True, "msg": "خطا در پردازش تصویر. لطفاً دوباره تلاش کنید."})
+
+# اسکریپت service worker کیوسک؛ از زیر /device/ سرو می‌شود تا دامنه‌اش صفحه ثبت تردد را بپوشاند
+def device_service_worker(request):
+
+    response = render(request, "core/device_sw.js", content_type="application/javascript")
+    response["Cache-Control"] = "no-cache"
+    return response
 
-        return JsonResponse({"ok": False, "msg": "چهره شما در سیستم ثبت نشده است."})
+# API زنده‌سنجی جریانی: کیوسک فریم‌های کم‌حجم را پشت سر هم می‌فرستد و پاسخ نهایی
+# به محض ثبت حرکت کافی و تطبیق داده می‌شود؛ تا آن زمان pending برمی‌گردد
+@csrf_exempt
+@require_POST
+@device_required
+@face_timed("verify_stream")
+def api_verify_stream(request):
+    if not _stream_enabled():
+        return JsonResponse({"ok": False, "msg": STREAM_DISABLED}, status=404)
+    timer = request.face_timer
+    now = _now()
+    with timed(timer, "db"):
+        heartbeat.beat(request.device_id)
+        active, groups = heartbeat.state(request.device_id)
+    if not active:
+        return JsonResponse({"ok": False, "msg": "دستگاه غیرفعال است."})
+    try:
+        with timed(timer, "upload"):
+            stream_id, img, box = face.read_stream_frame(request)
+        if not stream_id or not img:
+            return JsonResponse({"ok": False, "msg": "ارسال ناقص تصاویر."})
+        status, tier, frame1, candidates, msg = face_stream.stream_sessions.push(
+            stream_id, request.device_id, img, box, groups, timer
+        )
+        if status == "pending":
+            return JsonResponse({"ok": False, "pending": True, "hint": msg})
+        if status == "failed":
+            return JsonResponse({"ok": False, "tier": tier, "msg": msg})
+        return _record_verification(request, now, tier, frame1, candidates)
     except Exception as e:
-        print("Verify face error:", e)
+        print("Verify stream error:", e)
         return JsonResponse({"ok": False, "msg": "خطا در پردازش تصویر. لطفاً دوباره تلاش کنید."})
 
 @require_POST
@@ -417,39 +601,21 @@ def api_verify_face(request):
 # API ثبت چهره کاربر
 def api_register_face(request):
 
-    img1 = request.POST.get("image1")
-    img2 = request.POST.get("image2")
-    if not img1 or not img2:
-        return JsonResponse({"ok": False, "msg": "ارسال ناقص تصاویر."})
-
-    enc1 = _get_face_encoding_from_base64(img1)
-    enc2 = _get_face_encoding_from_base64(img2)
-    if enc1 is None or enc2 is None:
-        return JsonResponse({"ok": False, "msg": "چهره واضح نیست."})
-
-    movement = np.linalg.norm(enc1 - enc2)
-    if movement < LIVENESS_MOVEMENT_THRESHOLD:
-        return JsonResponse({"ok": False, "msg": "حرکت تشخیص داده نشد."})
-
-    enc = (enc1 + enc2) / 2
-    data_url = img1
+    frame1, templates, error = face.enroll_templates(request)
+    if error:
+        return JsonResponse({"ok": False, "msg": error})
 
-    request.user.face_encoding = enc.tobytes()
+    face.apply_templates(request.user, templates)
 
     try:
-        if "," in data_url:
-            header, b64data = data_url.split(",", 1)
-            fmt = header.split(";")[0].split("/")[1]
-        else:
-            b64data = data_url
-            fmt = "png"
-        img_data = base64.b64decode(b64data)
+        img_data, fmt = frame1
         filename = f"{request.user.username}_face.{fmt}"
         request.user.face_image.save(filename, ContentFile(img_data), save=False)
     except Exception as e:
         print("Save face image error:", e)
 
     request.user.save()
+    face_registry.update_face_index(request.user.pk, templates)
     return JsonResponse({"ok": True, "redirect": reverse("management_dashboard")})
 
 # فرم استعلام کاربر
@@ -472,6 +638,17 @@ def user_inquiry(request):
         form = InquiryForm()
     return render(request, "core/user_inquiry.html", {"form": form})
 
+# ورود و خروج هر روز ماه از خلاصه روزانه: {روز ماه: {"in", "out"}}
+def _month_daily_logs(user, start_j, end_j):
+
+    daily_logs = {d: {"in": None, "out": None} for d in range(1, end_j.day + 1)}
+    rows = daily_attendance.daily_rows([user.id], start_j.togregorian(), end_j.togregorian())
+    for day, first_in, last_out in rows.values_list("date", "first_in", "last_out"):
+        info = daily_logs[jdatetime.date.fromgregorian(date=day).day]
+        info["in"] = first_in.time() if first_in else None
+        info["out"] = last_out.time() if last_out else None
+    return daily_logs
+
 # نمایش پروفایل کاربر
 def user_profile(request):
     uid = request.session.get("inquiry_user_id")
@@ -480,22 +657,18 @@ def user_profile(request):
     u = get_object_or_404(User, id=uid)
     today = _now().date()
 
-    status = "holiday"
+    # ردیف امروز ممکن است همزمان با ثبت تردد تازه حذف شده باشد
+    today_row = (
+        daily_attendance.daily_rows([u.id], today, today).first()
+        or daily_attendance.compute_days([u.id], today, today)[0]
+    )
+    status = today_row.status
     first_in = None
-    if not WeeklyHoliday.objects.filter(weekday=_weekday_index(today)).exists():
-        logs = AttendanceLog.objects.filter(user=u, timestamp__date=today).order_by("timestamp")
-        if logs.exists():
-            status = "present"
-            first_in = logs.first().timestamp.time()
-        elif LeaveRequest.objects.filter(
-            user=u,
-            status="approved",
-            start_date__lte=today,
-            end_date__gte=today,
-        ).exists():
-            status = "leave"
-        else:
-            status = "absent"
+    if status != "holiday" and today_row.punches:
+        status = "present"
+        first_in = (today_row.first_in or today_row.last_out).time()
+    elif status == "present":
+        status = "absent"
     today_status = {"status": status, "first_in": first_in}
 
     t = jdatetime.date.today()
@@ -515,21 +688,7 @@ def user_profile(request):
     if ly == today_j.year and lm == today_j.month:
         days = today_j.day
         end_j = today_j
-    start_g = start_j.togregorian()
-    end_g = end_j.togregorian()
-    start_dt = datetime.combine(start_g, time.min)
-    end_dt = datetime.combine(end_g + timedelta(days=1), time.min)
-    qs = AttendanceLog.objects.filter(
-        user=u, timestamp__gte=start_dt, timestamp__lt=end_dt
-    ).order_by("timestamp")
-    daily_logs = {d: {"in": None, "out": None} for d in range(1, days + 1)}
-    for log in qs:
-        jd = jdatetime.date.fromgregorian(date=log.timestamp.date())
-        info = daily_logs.get(jd.day)
-        if log.log_type == "in" and info["in"] is None:
-            info["in"] = log.timestamp.time()
-        if log.log_type == "out":
-            info["out"] = log.timestamp.time()
+    daily_logs = _month_daily_logs(u, start_j, end_j)
     prev_m = (start_j - jdatetime.timedelta(days=1))
     next_m = (end_j + jdatetime.timedelta(days=1))
 
@@ -643,36 +802,33 @@ def management_face_check(request):
 @login_required
 @staff_required
 # API تأیید چهره مدیر
+@face_timed("management_verify")
 def api_management_verify_face(request):
     if request.method != "POST":
         return JsonResponse({"success": False, "error": "درخواست نامعتبر."})
+    timer = request.face_timer
     try:
-        data = json.loads(request.body)
+        with timed(timer, "upload"):
+            img1, img2, boxes = face.read_frame_sources(request)
     except Exception as e:
         print("Management verify decode error:", e)
         return JsonResponse({"success": False, "error": "خطا در پردازش تصویر."})
 
-    img1 = data.get("image1")
-    img2 = data.get("image2")
     if not img1 or not img2:
         return JsonResponse({"success": False, "error": "ارسال ناقص تصاویر."})
 
-    enc1 = _get_face_encoding_from_base64(img1)
-    enc2 = _get_face_encoding_from_base64(img2)
-    if enc1 is None or enc2 is None:
+    enc, error = face.pair_encoding(img1, img2, boxes, timer)
+    if error == "no_face":
         return JsonResponse({"success": False, "error": "چهره‌ای شناسایی نشد."})
-
-    movement = np.linalg.norm(enc1 - enc2)
-    if movement < LIVENESS_MOVEMENT_THRESHOLD:
+    if error == "no_movement":
         return JsonResponse({"success": False, "error": "حرکت تشخیص داده نشد."})
 
-    enc = (enc1 + enc2) / 2
     if request.user.face_encoding is None:
         return JsonResponse({"success": False, "error": "چهره مدیر ثبت نشده."})
 
-    known = np.frombuffer(request.user.face_encoding, dtype=np.float64)
-    distance = np.linalg.norm(known - enc)
-    if distance < FACE_DISTANCE_THRESHOLD:
+    with timed(timer, "match"):
+        distance = face.user_distance(request.user, enc)
+    if distance < face.FACE_DISTANCE_THRESHOLD:
         request.session["face_verified"] = True
         return JsonResponse({"success": True})
     return JsonResponse({"success": False, "error": "چهره مطابقت نداشت."})
@@ -703,45 +859,24 @@ def management_dashboard(request):
         user__in=users_qs, timestamp__date=today, log_type="out"
     ).count()
 
+    # خلاصه روزانه ۳۱ روز اخیر با یک پرس‌وجو؛ روزهای ساخته‌نشده همین‌جا محاسبه می‌شوند
+    month_start = today - timedelta(days=30)
+    users = list(users_qs.select_related("shift", "group__shift"))
+    days = {
+        (row.user_id, row.date): row
+        for row in daily_attendance.daily_rows([u.id for u in users], month_start, today)
+    }
+
     if is_holiday:
         present_users = leave_users = absent_users = users_qs.none()
-        present_ids = []
     else:
-        present_ids = (
-            AttendanceLog.objects.filter(user__in=users_qs, timestamp__date=today)
-            .values_list("user_id", flat=True)
-            .distinct()
-        )
-        leave_ids = (
-            LeaveRequest.objects.filter(
-                user__in=users_qs,
-                start_date__lte=today,
-                end_date__gte=today,
-            )
-            .values_list("user_id", flat=True)
-            .distinct()
-        )
+        today_rows = [days[(u.id, today)] for u in users if (u.id, today) in days]
+        present_ids = [row.user_id for row in today_rows if row.punches]
+        leave_ids = _leave_ids(users_qs, today)
         present_users = users_qs.filter(id__in=present_ids)
         leave_users = users_qs.filter(id__in=leave_ids)
         absent_users = users_qs.exclude(id__in=present_ids).exclude(id__in=leave_ids)
 
-    tardy_users = User.objects.none()
-    if not is_holiday:
-        tardy_ids = []
-        present_users_details = users_qs.filter(id__in=present_ids).select_related("shift", "group__shift")
-        for user in present_users_details:
-            shift = _get_user_shift(user)
-            if not shift:
-                continue
-            shift_start = shift.start_time
-            first_log = AttendanceLog.objects.filter(user=user, timestamp__date=today).order_by("timestamp").first()
-            if first_log:
-                start_dt = datetime.combine(today, shift_start)
-                first_dt = _to_naive(first_log.timestamp)
-                if first_dt > start_dt:
-                    tardy_ids.append(user.id)
-        tardy_users = users_qs.filter(id__in=tardy_ids)
-
     pending_edit_objs = EditRequest.objects.select_related("user").filter(user__in=users_qs, status="pending")
     pending_leave_objs = LeaveRequest.objects.select_related("user").filter(user__in=users_qs, status="pending")
     pending_edits = pending_edit_objs.count()
@@ -768,48 +903,34 @@ def management_dashboard(request):
             "action_url": reverse("leave_requests"),
         })
 
-    month_start = today - timedelta(days=30)
+    # تأخیر و روزهای پیاپی به‌موقع از اولین تردد (ورود یا خروج) هر روز در خلاصه روزانه
+    tardy_ids = []
     tardy_stats = []
     streak_stats = []
-    for u in users_qs:
+    for u in users:
         shift = _get_user_shift(u)
         if not shift:
             continue
         shift_start = shift.start_time
-        tardies = 0
+        firsts = []
         for i in range(31):
-            day = month_start + timedelta(days=i)
-            first_log = (
-                AttendanceLog.objects.filter(user=u, timestamp__date=day)
-                .order_by("timestamp")
-                .first()
-            )
-            if first_log:
-                log_time = first_log.timestamp
-                log_time = _to_naive(log_time)
-                if log_time.time() > shift_start:
-                    tardies += 1
+            row = days.get((u.id, month_start + timedelta(days=i)))
+            firsts.append(row.first_punch if row else None)
+        tardies = sum(1 for first in firsts if first and first.time() > shift_start)
         streak = 0
-        for i in range(30):
-            day = today - timedelta(days=i)
-            first_log = (
-                AttendanceLog.objects.filter(user=u, timestamp__date=day)
-                .order_by("timestamp")
-                .first()
-            )
-            if not first_log:
-                break
-            log_time = _to_naive(first_log.timestamp)
-            if log_time.time() > shift_start:
+        for first in reversed(firsts[1:]):
+            if not first or first.time() > shift_start:
                 break
             streak += 1
+        if not is_holiday and firsts[-1] and firsts[-1].time() > shift_start:
+            tardy_ids.append(u.id)
         tardy_stats.append((u, tardies))
         streak_stats.append((u, streak))
+    tardy_users = users_qs.filter(id__in=tardy_ids) if tardy_ids else User.objects.none()
     worst_performers = sorted(tardy_stats, key=lambda x: x[1], reverse=True)[:5]
     best_performers = sorted(streak_stats, key=lambda x: x[1], reverse=True)[:5]
 
-    device = Device.objects.first()
-    device_online = device.online if device else False
+    device_online = any(d.online for d in Device.objects.only("last_seen"))
 
     context = {
         'active_tab': 'dashboard',
@@ -855,8 +976,7 @@ def attendance_status(request):
     if holiday:
         present_users = leave_users = absent_users = User.objects.none()
     else:
-        present_ids = AttendanceLog.objects.filter(timestamp__date=target_date).values_list('user_id', flat=True).distinct()
-        leave_ids = LeaveRequest.objects.filter(start_date__lte=target_date, end_date__gte=target_date).values_list('user_id', flat=True).distinct()
+        present_ids, leave_ids = _day_status_ids(User.objects.all(), target_date)
         present_users = User.objects.filter(id__in=present_ids)
         leave_users = User.objects.filter(id__in=leave_ids)
         absent_users = User.objects.filter(is_active=True).exclude(id__in=present_ids).exclude(id__in=leave_ids)
@@ -880,29 +1000,35 @@ def attendance_status(request):
 # API وضعیت حضور و غیاب
 def api_attendance_status(request):
 
-    form = AttendanceStatusForm(request.GET or None)
-    if form.is_valid() and form.cleaned_data.get("date"):
-        target_date = form.cleaned_data["date"].togregorian()
-    else:
-        target_date = _now().date()
+    target_date = _status_target_date(request)
 
     holiday = WeeklyHoliday.objects.filter(weekday=_weekday_index(target_date)).exists()
     if holiday:
         present_users = leave_users = absent_users = []
     else:
-        present_ids = AttendanceLog.objects.filter(timestamp__date=target_date).values_list('user_id', flat=True).distinct()
-        leave_ids = LeaveRequest.objects.filter(start_date__lte=target_date, end_date__gte=target_date).values_list('user_id', flat=True).distinct()
+        present_ids, leave_ids = _day_status_ids(User.objects.all(), target_date)
         present_users = User.objects.filter(id__in=present_ids)
         leave_users = User.objects.filter(id__in=leave_ids)
         absent_users = User.objects.filter(is_active=True).exclude(id__in=present_ids).exclude(id__in=leave_ids)
 
     data = {
-        'present': [{'id': u.id, 'name': u.get_full_name(), 'code': u.personnel_code} for u in present_users],
-        'absent': [{'id': u.id, 'name': u.get_full_name(), 'code': u.personnel_code} for u in absent_users],
-        'leave': [{'id': u.id, 'name': u.get_full_name(), 'code': u.personnel_code} for u in leave_users],
+        'present': [_status_entry(u) for u in present_users],
+        'absent': [_status_entry(u) for u in absent_users],
+        'leave': [_status_entry(u) for u in leave_users],
     }
     return JsonResponse(data)
 
+# تاریخ هدف API وضعیت حضور از پارامتر date
+def _status_target_date(request):
+
+    form = AttendanceStatusForm(request.GET or None)
+    if form.is_valid() and form.cleaned_data.get("date"):
+        return form.cleaned_data["date"].togregorian()
+    return _now().date()
+
+def _status_entry(u):
+    return {'id': u.id, 'name': u.get_full_name(), 'code': u.personnel_code}
+
 @login_required
 @staff_required
 # مدیریت کارکنان
@@ -923,14 +1049,20 @@ def management_users(request):
                 group_id = request.POST.get("group")
                 if group_id:
                     qs.update(group_id=group_id)
+                    daily_attendance.invalidate(selected_ids)
+                    face_registry.refresh_face_index(selected_ids)
                     messages.success(request, "گروه کارکنان به‌روزرسانی شد.")
             elif action == "assign_shift":
                 shift_id = request.POST.get("shift")
                 if shift_id:
                     qs.update(shift_id=shift_id)
+                    daily_attendance.invalidate(selected_ids)
                     messages.success(request, "شیفت کارکنان به‌روزرسانی شد.")
             elif action == "delete":
+                deleted_ids = list(qs.values_list("id", flat=True))
                 qs.delete()
+                for uid in deleted_ids:
+                    face_registry.update_face_index(uid, None)
                 messages.success(request, "کارکنان انتخاب‌شده حذف شدند.")
         return redirect("management_users")
 
@@ -1007,6 +1139,7 @@ def user_delete(request, pk):
         messages.error(request, "نمی‌توانید خودتان را حذف کنید.")
     else:
         obj.delete()
+        face_registry.update_face_index(pk, None)
         messages.success(request, "حذف موفق.")
     return redirect("management_users")
 
@@ -1023,6 +1156,10 @@ def admin_user_profile(request, pk):
         form = CustomUserSimpleForm(request.POST, request.FILES, instance=user_obj)
         if form.is_valid():
             form.save()
+            if {"group", "shift"} & set(form.changed_data):
+                daily_attendance.invalidate([user_obj.id])
+            if "group" in form.changed_data:
+                face_registry.refresh_face_index([user_obj.id])
             messages.success(request, "اطلاعات کارمند به‌روز شد.")
             return redirect("admin_user_profile", pk=pk)
     else:
@@ -1035,19 +1172,7 @@ def admin_user_profile(request, pk):
         t = jdatetime.date.today()
         ly, lm = t.year, t.month
     days = jdatetime.j_days_in_month[lm - 1]
-    start_g = jdatetime.date(ly, lm, 1).togregorian()
-    end_g = jdatetime.date(ly, lm, days).togregorian()
-    qs = AttendanceLog.objects.filter(
-        user=user_obj, timestamp__date__range=(start_g, end_g)
-    ).order_by("timestamp")
-    daily_logs = {d: {"in": None, "out": None} for d in range(1, days + 1)}
-    for log in qs:
-        jd = jdatetime.date.fromgregorian(date=log.timestamp.date())
-        info = daily_logs.get(jd.day)
-        if log.log_type == "in" and info["in"] is None:
-            info["in"] = log.timestamp.time()
-        if log.log_type == "out":
-            info["out"] = log.timestamp.time()
+    daily_logs = _month_daily_logs(user_obj, jdatetime.date(ly, lm, 1), jdatetime.date(ly, lm, days))
     prev_m = (jdatetime.date(ly, lm, 1) - jdatetime.timedelta(days=1))
     next_m = (jdatetime.date(ly, lm, days) + jdatetime.timedelta(days=1))
 
@@ -1089,10 +1214,13 @@ def admin_user_profile(request, pk):
 def user_face_delete(request, pk):
     user_obj = get_object_or_404(User, pk=pk)
     user_obj.face_encoding = None
+    user_obj.face_templates = None
+    user_obj.face_model = ""
     if user_obj.face_image:
         user_obj.face_image.delete(save=False)
     user_obj.face_image = None
     user_obj.save()
+    face_registry.update_face_index(user_obj.pk, None)
     messages.success(request, "چهره کارمند حذف شد.")
     return redirect("admin_user_profile", pk=pk)
 
@@ -1109,34 +1237,20 @@ def register_face_page_for_user(request, user_id):
 # API ثبت چهره کارمند توسط مدیر
 def register_face_api(request, user_id):
     target = get_object_or_404(User, id=user_id)
-    img1 = request.POST.get("image1")
-    img2 = request.POST.get("image2")
-    if not img1 or not img2:
-        return JsonResponse({"ok": False, "msg": "ارسال ناقص تصاویر."})
-    enc1 = _get_face_encoding_from_base64(img1)
-    enc2 = _get_face_encoding_from_base64(img2)
-    if enc1 is None or enc2 is None:
-        return JsonResponse({"ok": False, "msg": "چهره واضح نیست."})
-    if np.linalg.norm(enc1 - enc2) < LIVENESS_MOVEMENT_THRESHOLD:
-        return JsonResponse({"ok": False, "msg": "حرکت تشخیص داده نشد."})
-    enc = (enc1 + enc2) / 2
-    data_url = img1
-
-    target.face_encoding = enc.tobytes()
+    frame1, templates, error = face.enroll_templates(request)
+    if error:
+        return JsonResponse({"ok": False, "msg": error})
+
+    face.apply_templates(target, templates)
     try:
-        if "," in data_url:
-            header, b64data = data_url.split(",", 1)
-            fmt = header.split(";")[0].split("/")[1]
-        else:
-            b64data = data_url
-            fmt = "png"
-        img_data = base64.b64decode(b64data)
+        img_data, fmt = frame1
         filename = f"{target.username}_face.{fmt}"
         target.face_image.save(filename, ContentFile(img_data), save=False)
     except Exception as e:
         print("Save target face image error:", e)
 
     target.save()
+    face_registry.update_face_index(target.pk, templates)
     if request.session.get("pending_user_id") == target.pk:
         request.session.pop("pending_user_id", None)
     return JsonResponse({"ok": True, "redirect": reverse("admin_user_profile", args=[user_id])})
@@ -1160,6 +1274,7 @@ def edit_requests(request):
                     log_type=req.log_type,
                     source="manager",
                 )
+                daily_attendance.logs_changed([(req.user_id, req.timestamp)])
                 req.status = "approved"
                 req.decision_at = _now()
                 req.manager_note = note
@@ -1226,6 +1341,7 @@ def leave_requests(request):
             req.decision_at = _now()
             req.manager_note = note
             req.save()
+            daily_attendance.invalidate([req.user_id], req.start_date, req.end_date)
             messages.info(request, msg)
         elif action == "update" and req.start_date > _now().date():
             status = request.POST.get("status")
@@ -1234,6 +1350,7 @@ def leave_requests(request):
                 req.decision_at = _now() if status != "pending" else None
                 req.manager_note = note
                 req.save()
+                daily_attendance.invalidate([req.user_id], req.start_date, req.end_date)
                 messages.success(request, "وضعیت مرخصی به‌روزرسانی شد.")
         next_url = request.POST.get("next")
         if next_url:
@@ -1296,22 +1413,9 @@ def suspicious_log_action(request, pk):
             log_type = 'out' if last_log and last_log.log_type == 'in' else 'in'
             now = _now()
             AttendanceLog.objects.create(user=u, timestamp=now, log_type=log_type, source='manager')
+            daily_attendance.logs_changed([(u.id, now)])
             if request.POST.get('train') and log.image:
-                try:
-                    img = face_recognition.load_image_file(log.image.path)
-                    encs = face_recognition.face_encodings(img)
-                    if encs:
-                        new_enc = encs[0]
-                        if u.face_encoding:
-                            old = np.frombuffer(u.face_encoding, dtype=np.float64)
-                            new_enc = (old + new_enc) / 2
-                        u.face_encoding = new_enc.tobytes()
-                        if not u.face_image:
-                            with log.image.open('rb') as f:
-                                u.face_image.save(os.path.basename(log.image.name), ContentFile(f.read()), save=False)
-                        u.save()
-                except Exception as e:
-                    print("Suspicious training error:", e)
+                background.submit(_train_from_suspicious_log, log.pk)
         log.status = 'confirmed'
         log.save(update_fields=['status'])
         messages.success(request, "تردد ثبت شد.")
@@ -1327,17 +1431,89 @@ def suspicious_log_action(request, pk):
 
 @login_required
 @staff_required
-# تنظیمات دستگاه
+# فهرست دستگاه‌ها با وضعیت، گروه‌ها و آمار تردد
 def device_settings(request):
     if not request.session.get("face_verified"):
         return redirect("management_face_check")
-    device, _ = Device.objects.get_or_create(id=1, defaults={"name": "Main device"})
-    if request.method == "POST" and device.online:
+    if request.method == "POST":
+        device = get_object_or_404(Device, pk=request.POST.get("device"))
         action = request.POST.get('action')
-        device.is_active = action != 'deactivate'
-        device.save(update_fields=['is_active'])
+        if action == 'token':
+            token = device.issue_token()
+            device.save(update_fields=['token_hash'])
+            request.session["new_device_token"] = {"name": device.name, "token": token}
+        elif action in ('activate', 'deactivate') and device.online:
+            device.is_active = action != 'deactivate'
+            device.save(update_fields=['is_active'])
+        heartbeat.invalidate(device.pk)
         return redirect('device_settings')
-    return render(request, 'core/device_settings.html', {'device': device, 'active_tab': 'settings'})
+
+    now = _now()
+    day_start = datetime.combine(now.date(), time.min)
+    devices = (
+        Device.objects.prefetch_related("groups")
+        .annotate(
+            logs_today=Count("logs", filter=Q(logs__timestamp__gte=day_start)),
+            logs_last_hour=Count("logs", filter=Q(logs__timestamp__gte=now - timedelta(hours=1))),
+        )
+        .order_by("pk")
+    )
+    # توکن تازه فقط یک بار همراه پیوند راه‌اندازی کیوسک نمایش داده می‌شود
+    new_token = request.session.pop("new_device_token", None)
+    if new_token:
+        new_token["setup_url"] = (
+            request.build_absolute_uri(reverse("device_page")) + f"?token={new_token['token']}"
+        )
+    return render(
+        request,
+        'core/device_settings.html',
+        {'devices': devices, 'new_token': new_token, 'active_tab': 'settings'},
+    )
+
+@login_required
+@staff_required
+# افزودن یا ویرایش دستگاه
+def device_edit(request, pk=None):
+    if not request.session.get("face_verified"):
+        return redirect("management_face_check")
+    instance = Device.objects.filter(pk=pk).first()
+    if request.method == "POST":
+        form = DeviceForm(request.POST, instance=instance)
+        if form.is_valid():
+            device = form.save(commit=False)
+            token = device.issue_token() if instance is None else None
+            device.save()
+            form.save_m2m()
+            heartbeat.invalidate(device.pk)
+            if token:
+                request.session["new_device_token"] = {"name": device.name, "token": token}
+            messages.success(request, "دستگاه ذخیره شد.")
+            return redirect("device_settings")
+    else:
+        form = DeviceForm(instance=instance)
+    return render(request, "core/device_form.html", {"form": form, "active_tab": "settings"})
+
+@require_POST
+@login_required
+@staff_required
+# حذف دستگاه؛ ترددهای ثبت‌شده آن باقی می‌مانند
+def device_delete(request, pk):
+    if not request.session.get("face_verified"):
+        return redirect("management_face_check")
+    device = get_object_or_404(Device, pk=pk)
+    device.delete()
+    heartbeat.invalidate(pk)
+    messages.success(request, "حذف شد.")
+    return redirect("device_settings")
+
+@login_required
+@staff_required
+# صدک‌های زمان مراحل اندپوینت‌های چهره در پنجره اخیر همین فرایند
+def api_face_timings(request):
+    if request.method == "POST" and request.POST.get("action") == "reset":
+        latency_histogram.clear()
+    return JsonResponse(latency_histogram.snapshot())
+
 @login_required
 @staff_required
 # تنظیم تعطیلات هفتگی
@@ -1352,6 +1528,7 @@ def weekly_holidays(request):
             WeeklyHoliday.objects.all().delete()
             for d in days:
                 WeeklyHoliday.objects.create(weekday=d)
+            daily_attendance.invalidate()
             messages.success(request, "روزهای تعطیل ذخیره شد.")
             existing = set(days)
     else:
@@ -1386,6 +1563,8 @@ def shift_edit(request, pk=None):
         form = ShiftForm(request.POST, instance=instance)
         if form.is_valid():
             form.save()
+            if instance and form.changed_data:
+                daily_attendance.invalidate(daily_attendance.shift_users(instance))
             messages.success(request, "شیفت ذخیره شد.")
             return redirect("shift_list")
     else:
@@ -1400,6 +1579,7 @@ def shift_delete(request, pk):
     if not request.session.get("face_verified"):
         return redirect("management_face_check")
     shift = get_object_or_404(Shift, pk=pk)
+    daily_attendance.invalidate(daily_attendance.shift_users(shift))
     shift.delete()
     messages.success(request, "حذف شد.")
     return redirect("shift_list")
@@ -1432,6 +1612,8 @@ def group_edit(request, pk=None):
         form = GroupForm(request.POST, instance=instance)
         if form.is_valid():
             form.save()
+            if instance and "shift" in form.changed_data:
+                daily_attendance.invalidate(User.objects.filter(group=instance).values_list("id", flat=True))
             messages.success(request, "گروه ذخیره شد.")
             return redirect("group_list")
     else:
@@ -1446,7 +1628,11 @@ def group_delete(request, pk):
     if not request.session.get("face_verified"):
         return redirect("management_face_check")
     grp = get_object_or_404(Group, pk=pk)
+    member_ids = list(User.objects.filter(group=grp).values_list("id", flat=True))
+    if grp.shift_id:
+        daily_attendance.invalidate(member_ids)
     grp.delete()
+    face_registry.refresh_face_index(member_ids)
     messages.success(request, "حذف شد.")
     return redirect("group_list")
 
@@ -1498,7 +1684,8 @@ def add_log(request):
     if request.method == "POST":
         form = ManualLogForm(request.POST)
         if form.is_valid():
-            form.save()
+            log = form.save()
+            daily_attendance.logs_changed([(log.user_id, log.timestamp)])
             messages.success(request, "تردد ثبت شد.")
             return redirect("edit_requests")
     else:
@@ -1508,6 +1695,44 @@ def add_log(request):
         "form": form,
     })
 
+@login_required
+@staff_required
+# درون‌ریزی ترددهای سامانه قبلی از فایل؛ برای فایل‌های چند میلیون ردیفی فرمان import_logs مناسب‌تر است
+def import_logs(request):
+
+    if not request.session.get("face_verified"):
+        return redirect("management_face_check")
+    if request.method == "POST":
+        form = LogImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            importer = LogImporter(dry_run=form.cleaned_data["dry_run"])
+            try:
+                stats = importer.run(
+                    iter_rows(text_stream(form.cleaned_data["file"]), form.cleaned_data["format"])
+                )
+            except (UnicodeDecodeError, csv.Error) as e:
+                print("Log import error:", e)
+                messages.error(request, "فایل قابل خواندن نیست. قالب و کدگذاری UTF-8 را بررسی کنید.")
+            else:
+                verb = "قابل ثبت" if form.cleaned_data["dry_run"] else "ثبت شد"
+                messages.success(
+                    request,
+                    f"{stats['rows']} ردیف در {stats['seconds']} ثانیه: {stats['inserted']} {verb}، "
+                    f"{stats['duplicates']} تکراری، {stats['unknown_code']} کد پرسنلی ناشناس، "
+                    f"{stats['invalid']} نامعتبر.",
+                )
+                if importer.unknown_codes:
+                    messages.warning(
+                        request, "کدهای ناشناس: " + "، ".join(sorted(importer.unknown_codes)[:20])
+                    )
+                return redirect("import_logs")
+    else:
+        form = LogImportForm()
+    return render(request, "core/log_import.html", {
+        "active_tab": "edit_requests",
+        "form": form,
+    })
+
 @login_required
 @staff_required
 # افزودن مرخصی دستی
@@ -12,6 +12,21 @@ document.addEventListener('DOMContentLoaded', () => { // شروع پس از لو
   const managerControls = document.getElementById('manager-controls');
   const overlay = document.getElementById('device-overlay');
 
+  // توکن دستگاه: یک بار با پیوند راه‌اندازی (#token=...) دریافت و در مرورگر کیوسک نگه داشته می‌شود
+  const tokenMatch = window.location.hash.match(/token=([^&]+)/);
+  if (tokenMatch) {
+    window.localStorage.setItem('deviceToken', decodeURIComponent(tokenMatch[1]));
+    history.replaceState(null, '', window.location.pathname + window.location.search);
+  }
+  const DEVICE_TOKEN = window.localStorage.getItem('deviceToken');
+
+  // هدرهای درخواست کیوسک؛ با توکن، دستگاه بدون نشست ورود شناسایی می‌شود
+  function deviceHeaders() {
+    const headers = { 'X-CSRFToken': getCsrfToken() };
+    if (DEVICE_TOKEN) headers['X-Device-Token'] = DEVICE_TOKEN;
+    return headers;
+  }
+
   const faceDetector = window.FaceDetector ? new FaceDetector({ fastMode: true }) : null;
   let framingOk = false;
   let verifying = false;
@@ -39,15 +54,72 @@ document.addEventListener('DOMContentLoaded', () => { // شروع پس از لو
     showMessage('دوربین توسط مرورگر پشتیبانی نمی‌شود.');
   }
 
-  // گرفتن تصویر از ویدیو و برگرداندن base64
-  function capture() {
+  // اندازه برش نرمال چهره و حاشیه اطراف کادر
+  const CROP_SIZE = 320;
+  const CROP_PADDING = 0.4;
+  const cropCanvas = document.createElement('canvas');
+  const cropCtx = cropCanvas.getContext('2d');
+
+  // تبدیل بوم به Blob با فرمت JPEG
+  function toJpeg(target) {
+    return new Promise((resolve) => target.toBlob(resolve, 'image/jpeg', 0.9));
+  }
+
+  // بوم کوچک‌شده برای فریم‌های جریانی بدون کادر چهره
+  const STREAM_MAX_SIDE = 320;
+  const smallCanvas = document.createElement('canvas');
+  const smallCtx = smallCanvas.getContext('2d');
+
+  function downscale(source, maxSide) {
+    const scale = Math.min(1, maxSide / Math.max(source.width, source.height));
+    smallCanvas.width = Math.round(source.width * scale);
+    smallCanvas.height = Math.round(source.height * scale);
+    smallCtx.drawImage(source, 0, 0, smallCanvas.width, smallCanvas.height);
+    return smallCanvas;
+  }
+
+  // گرفتن تصویر از ویدیو؛ اگر سرور کادر کلاینت را می‌پذیرد و چهره یافت شد، برش اطراف آن همراه کادر
+  // برگردانده می‌شود، وگرنه قاب کامل تا سرور خودش چهره را با وضوح کامل بیابد
+  // (maxSide: کوچک کردن قاب کامل)
+  async function capture(maxSide = 0) {
     canvas.width = video.videoWidth;
     canvas.height = video.videoHeight;
     ctx.save();
     ctx.scale(-1, 1);
     ctx.drawImage(video, -canvas.width, 0, canvas.width, canvas.height);
     ctx.restore();
-    return canvas.toDataURL('image/jpeg');
+
+    let face = null;
+    if (faceDetector && TRUST_CLIENT_BOX) {
+      try {
+        const faces = await faceDetector.detect(canvas);
+        if (faces.length) face = faces[0].boundingBox;
+      } catch (e) {
+        face = null;
+      }
+    }
+    if (!face) {
+      return { blob: await toJpeg(maxSide ? downscale(canvas, maxSide) : canvas), box: null };
+    }
+
+    const side = Math.max(face.width, face.height) * (1 + 2 * CROP_PADDING);
+    const sx = Math.max(0, face.x + face.width / 2 - side / 2);
+    const sy = Math.max(0, face.y + face.height / 2 - side / 2);
+    const sw = Math.min(canvas.width - sx, side);
+    const sh = Math.min(canvas.height - sy, side);
+    const scale = CROP_SIZE / Math.max(sw, sh);
+    cropCanvas.width = Math.round(sw * scale);
+    cropCanvas.height = Math.round(sh * scale);
+    cropCtx.drawImage(canvas, sx, sy, sw, sh, 0, 0, cropCanvas.width, cropCanvas.height);
+
+    // ترتیب کادر مطابق سرور: بالا، راست، پایین، چپ
+    const box = [
+      (face.y - sy) * scale,
+      (face.x + face.width - sx) * scale,
+      (face.y + face.height - sy) * scale,
+      (face.x - sx) * scale,
+    ].map(Math.round);
+    return { blob: await toJpeg(cropCanvas), box };
   }
 
   // نمایش اطلاعات کاربر شناسایی‌شده
@@ -140,6 +212,220 @@ document.addEventListener('DOMContentLoaded', () => { // شروع پس از لو
     return new Promise((resolve) => setTimeout(resolve, ms));
   }
 
+  // ثبت اختیاری زمان مراحل سرور در کنسول (با ?timing=1 یا localStorage.faceTiming = '1')
+  const LOG_TIMING =
+    new URLSearchParams(window.location.search).get('timing') === '1' ||
+    window.localStorage.getItem('faceTiming') === '1';
+
+  function logServerTiming(response, uploadStart) {
+    if (!LOG_TIMING) return;
+    const header = response.headers.get('Server-Timing');
+    const stages = {};
+    (header || '').split(',').forEach((entry) => {
+      const [name, ...params] = entry.trim().split(';');
+      const dur = params.find((p) => p.trim().startsWith('dur='));
+      if (name && dur) stages[name] = parseFloat(dur.split('=')[1]);
+    });
+    stages.round_trip = Math.round(performance.now() - uploadStart);
+    console.table(stages);
+  }
+
+  // نمایش نتیجه بررسی چهره
+  function handleResult(data) {
+    if (data.ok) {
+      const actionText = data.log_type === 'in' ? 'ورود' : 'خروج';
+      showMessage(`تردد ${actionText} ثبت شد!`, 4000);
+      showUserInfo(data);
+      managerControls.style.display = 'none';
+    } else if (data.manager_detected) {
+      showMessage('مدیر شناسایی شد.', 4000);
+      managerControls.style.display = '';
+      hideUserInfo();
+    } else if (data.queued) {
+      showMessage('ارتباط با سرور برقرار نیست؛ تردد شما ذخیره شد و پس از اتصال ثبت می‌شود.', 4000);
+      hideUserInfo();
+      managerControls.style.display = 'none';
+    } else if (data.suspicious) {
+      showMessage('تشخیص مشکوک! لطفاً با مدیریت تماس بگیرید.', 4000);
+      hideUserInfo();
+      managerControls.style.display = 'none';
+    } else {
+      showMessage(
+        data.msg || 'چهره‌ای شناسایی نشد. لطفاً صورت خود را مقابل دوربین تنظیم کنید.',
+        4000
+      );
+      hideUserInfo();
+      managerControls.style.display = 'none';
+    }
+  }
+
+  // شناسه یکتای جریان یا ضبط
+  function newId() {
+    return window.crypto && crypto.randomUUID
+      ? crypto.randomUUID()
+      : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+  }
+
+  // رد احراز هویت دستگاه (توکن نامعتبر یا هدایت به صفحه ورود)؛ برخلاف قطع شبکه با تلاش دوباره درست نمی‌شود
+  class AuthError extends Error {}
+  const DEVICE_AUTH_MSG = 'دستگاه شناسایی نشد. لطفاً پیوند راه‌اندازی دستگاه را دوباره باز کنید.';
+
+  // ارسال یک درخواست بررسی و خواندن پاسخ JSON؛ قطع شبکه، خطای سرور (5xx) یا پاسخ غیر JSON
+  // استثنا می‌دهد و رد احراز هویت AuthError
+  async function postVerify(url, form) {
+    const uploadStart = performance.now();
+    const r = await fetch(url, {
+      method: 'POST',
+      headers: deviceHeaders(),
+      body: form,
+    });
+    logServerTiming(r, uploadStart);
+    if (r.status === 401 || r.status === 403 || r.redirected) throw new AuthError(`auth ${r.status}`);
+    const type = r.headers.get('Content-Type') || '';
+    if (r.status >= 500 || !type.includes('application/json')) throw new Error(`server ${r.status}`);
+    return r.json();
+  }
+
+  // صف تردد آفلاین در IndexedDB: هر ضبط با شناسه یکتا و زمان گرفتن فریم اول
+  const QUEUE_DB = 'kiosk-offline';
+  const QUEUE_STORE = 'captures';
+  const QUEUE_LIMIT = 500;
+  const QUEUE_BATCH = 10;
+  let queueDb = null;
+
+  function openQueue() {
+    return new Promise((resolve, reject) => {
+      const req = indexedDB.open(QUEUE_DB, 1);
+      req.onupgradeneeded = () => req.result.createObjectStore(QUEUE_STORE, { keyPath: 'id' });
+      req.onsuccess = () => resolve(req.result);
+      req.onerror = () => reject(req.error);
+    });
+  }
+
+  // اجرای یک کار روی مخزن صف در یک تراکنش
+  async function queueRequest(mode, fn) {
+    if (!queueDb) queueDb = await openQueue();
+    return new Promise((resolve, reject) => {
+      const tx = queueDb.transaction(QUEUE_STORE, mode);
+      const req = fn(tx.objectStore(QUEUE_STORE));
+      tx.oncomplete = () => resolve(req ? req.result : undefined);
+      tx.onerror = () => reject(tx.error);
+    });
+  }
+
+  // ذخیره ضبط در صف؛ false اگر مرورگر پشتیبانی نکند یا صف پر باشد
+  async function enqueueCapture(capture) {
+    if (!window.indexedDB) return false;
+    try {
+      const size = await queueRequest('readonly', (store) => store.count());
+      if (size >= QUEUE_LIMIT) return false;
+      await queueRequest('readwrite', (store) => store.put(capture));
+      return true;
+    } catch (e) {
+      return false;
+    }
+  }
+
+  // ارسال صف به سرور به صورت دسته‌ای؛ هر ضبطی که نتیجه نهایی گرفت از صف حذف می‌شود.
+  // دسته‌ای که سرور بدون retry رد کند دوباره هم رد می‌شود و کنار می‌رود تا صف را نبندد
+  let draining = false;
+  async function drainQueue() {
+    if (draining || !window.indexedDB) return;
+    draining = true;
+    try {
+      for (;;) {
+        const batch = await queueRequest('readonly', (store) => store.getAll(null, QUEUE_BATCH));
+        if (!batch || !batch.length) break;
+        const form = new FormData();
+        form.append(
+          'captures',
+          JSON.stringify(batch.map((c) => ({ id: c.id, ts: c.ts, box1: c.box1, box2: c.box2 })))
+        );
+        batch.forEach((c) => {
+          form.append('image1', c.image1, `${c.id}-1.jpg`);
+          form.append('image2', c.image2, `${c.id}-2.jpg`);
+        });
+        const data = await postVerify(VERIFY_BATCH_URL, form);
+        if (!data.ok && data.retry) break;
+        let done = batch.map((c) => c.id);
+        if (data.ok) {
+          if (!data.results.length) break;
+          done = data.results.map((result) => result.id);
+        } else {
+          console.warn('offline captures rejected:', data.msg, done);
+        }
+        await queueRequest('readwrite', (store) => {
+          done.forEach((id) => store.delete(id));
+        });
+      }
+    } catch (e) {
+      // سرور هنوز در دسترس نیست یا دستگاه احراز نشده؛ صف می‌ماند و در نوبت بعد دوباره تلاش می‌شود
+      if (e instanceof AuthError) showMessage(DEVICE_AUTH_MSG, 4000);
+    } finally {
+      draining = false;
+    }
+  }
+
+  // حالت دو فریم ثابت با مکث بین آن‌ها؛ بدون اتصال، ضبط در صف آفلاین می‌ماند
+  async function verifyStills() {
+    showMessage('لطفاً مستقیم به دوربین نگاه کنید.');
+    await wait(1000);
+    const capturedAt = Date.now();
+    const img1 = await capture();
+    showMessage('حالا سرتان را کمی حرکت دهید.');
+    await wait(3000);
+    const img2 = await capture();
+    showMessage('در حال بررسی...');
+
+    const form = new FormData();
+    form.append('image1', img1.blob, 'frame1.jpg');
+    form.append('image2', img2.blob, 'frame2.jpg');
+    if (img1.box && img2.box) {
+      form.append('box1', img1.box.join(','));
+      form.append('box2', img2.box.join(','));
+    }
+    try {
+      return await postVerify(VERIFY_FACE_URL, form);
+    } catch (e) {
+      if (e instanceof AuthError) throw e;
+      const queued = await enqueueCapture({
+        id: newId(),
+        ts: capturedAt,
+        image1: img1.blob,
+        image2: img2.blob,
+        box1: img1.box && img2.box ? img1.box.join(',') : null,
+        box2: img1.box && img2.box ? img2.box.join(',') : null,
+      });
+      if (!queued) throw e;
+      return { ok: false, queued: true };
+    }
+  }
+
+  // حالت جریانی: فریم‌های کم‌حجم پشت سر هم تا وقتی سرور زنده‌بودن و تطبیق را تأیید کند
+  const STREAM_INTERVAL = 150;
+  const STREAM_TIMEOUT = 8000;
+  async function verifyStream() {
+    const stream = newId();
+    const deadline = Date.now() + STREAM_TIMEOUT;
+    showMessage('لطفاً به دوربین نگاه کنید و سرتان را کمی حرکت دهید.');
+    while (Date.now() < deadline) {
+      const shot = await capture(STREAM_MAX_SIDE);
+      const form = new FormData();
+      form.append('stream', stream);
+      form.append('frame', shot.blob, 'frame.jpg');
+      if (shot.box) form.append('box', shot.box.join(','));
+      const data = await postVerify(VERIFY_STREAM_URL, form);
+      if (!data.pending) return data;
+      if (data.hint === 'no_face') {
+        showMessage('لطفاً صورت خود را در کادر قرار دهید.');
+      } else {
+        showMessage('سرتان را کمی حرکت دهید.');
+      }
+      await wait(STREAM_INTERVAL);
+    }
+    return { ok: false, msg: 'زمان بررسی به پایان رسید. لطفاً دوباره تلاش کنید.' };
+  }
+
   // حلقه اصلی تأیید چهره
   async function verifyLoop() {
     if (verifying || !framingOk) {
@@ -147,56 +433,53 @@ document.addEventListener('DOMContentLoaded', () => { // شروع پس از لو
       return;
     }
     verifying = true;
-    showMessage('لطفاً مستقیم به دوربین نگاه کنید.');
-    await wait(1000);
-    const img1 = capture();
-    showMessage('حالا سرتان را کمی حرکت دهید.');
-    await wait(3000);
-    const img2 = capture();
-    showMessage('در حال بررسی...');
+    try {
+      // زنده‌سنجی جریانی به سرور نیاز دارد؛ بدون اتصال حالت دو فریم (قابل صف) به کار می‌رود
+      const streaming = VERIFY_STREAM_URL && navigator.onLine;
+      const data = streaming ? await verifyStream() : await verifyStills();
+      handleResult(data);
+      if (!data.queued) drainQueue();
+    } catch (e) {
+      if (e instanceof AuthError) {
+        showMessage(DEVICE_AUTH_MSG, 4000);
+      } else {
+        showMessage('اتصال به سرور برقرار نشد. لطفاً اتصال اینترنت را بررسی کنید.', 4000);
+      }
+    } finally {
+      verifying = false;
+      setTimeout(verifyLoop, 4000);
+    }
+  }
 
-    fetch(VERIFY_FACE_URL, {
+  verifyLoop();
+
+  // ضربان دوره‌ای در زمان بیکاری تا دستگاه در پنل مدیریت آنلاین بماند
+  const HEARTBEAT_INTERVAL = 30000;
+  function sendHeartbeat() {
+    if (verifying) return;
+    fetch(DEVICE_HEARTBEAT_URL, {
       method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-        'X-CSRFToken': getCsrfToken(),
-      },
-      body: JSON.stringify({ image1: img1, image2: img2 }),
+      headers: deviceHeaders(),
     })
       .then((r) => r.json())
       .then((data) => {
-        if (data.ok) {
-          const actionText = data.log_type === 'in' ? 'ورود' : 'خروج';
-          showMessage(`تردد ${actionText} ثبت شد!`, 4000);
-          showUserInfo(data);
-          managerControls.style.display = 'none';
-        } else if (data.manager_detected) {
-          showMessage('مدیر شناسایی شد.', 4000);
-          managerControls.style.display = '';
-          hideUserInfo();
-        } else if (data.suspicious) {
-          showMessage('تشخیص مشکوک! لطفاً با مدیریت تماس بگیرید.', 4000);
-          hideUserInfo();
-          managerControls.style.display = 'none';
-        } else {
-          showMessage(
-            data.msg || 'چهره‌ای شناسایی نشد. لطفاً صورت خود را مقابل دوربین تنظیم کنید.',
-            4000
-          );
-          hideUserInfo();
-          managerControls.style.display = 'none';
+        if (!data.active && Date.now() >= messageHoldUntil) {
+          showMessage('دستگاه غیرفعال است.');
+        } else if (data.active) {
+          drainQueue();
         }
       })
-      .catch(() => {
-        showMessage('اتصال به سرور برقرار نشد. لطفاً اتصال اینترنت را بررسی کنید.', 4000);
-      })
-      .finally(() => {
-        verifying = false;
-        setTimeout(verifyLoop, 4000);
-      });
+      .catch(() => {});
   }
 
-  verifyLoop();
+  setInterval(sendHeartbeat, HEARTBEAT_INTERVAL);
+  window.addEventListener('online', drainQueue);
+  drainQueue();
+
+  // پوسته آفلاین صفحه
+  if ('serviceWorker' in navigator) {
+    navigator.serviceWorker.register(DEVICE_SW_URL).catch(() => {});
+  }
 
   if (overlay) {
     setTimeout(() => {
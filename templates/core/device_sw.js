@@ -0,0 +1,69 @@
+{% load static %}// پوسته آفلاین کیوسک: صفحه ثبت تردد و فایل‌های ثابت آن در حافظه مرورگر نگه داشته می‌شوند
+// تا با قطع سرور هم صفحه باز شود؛ درخواست‌های API (POST) از این لایه عبور نمی‌کنند
+const CACHE = 'kiosk-shell-v1';
+const DEVICE_URL = "{% url 'device_page' %}";
+const SHELL = [
+  DEVICE_URL,
+  "{% static 'core/device.js' %}",
+  "{% static 'core/global.js' %}",
+  "{% static 'core/global.css' %}",
+  "{% static 'core/device_full.css' %}",
+  "{% static 'core/avatar.png' %}",
+];
+
+self.addEventListener('install', (event) => {
+  event.waitUntil(
+    caches.open(CACHE)
+      .then((cache) => cache.addAll(SHELL))
+      .then(() => self.skipWaiting())
+  );
+});
+
+// حذف نسخه‌های قدیمی پوسته
+self.addEventListener('activate', (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((keys) => Promise.all(keys.filter((key) => key !== CACHE).map((key) => caches.delete(key))))
+      .then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener('fetch', (event) => {
+  const request = event.request;
+  if (request.method !== 'GET') return;
+  const url = new URL(request.url);
+  if (url.origin !== self.location.origin) return;
+
+  // صفحه: اول شبکه، در نبود اتصال نسخه ذخیره‌شده
+  if (request.mode === 'navigate') {
+    event.respondWith(
+      fetch(request)
+        .then((response) => {
+          if (response.ok && url.pathname === DEVICE_URL) {
+            const copy = response.clone();
+            caches.open(CACHE).then((cache) => cache.put(DEVICE_URL, copy));
+          }
+          return response;
+        })
+        .catch(() => caches.match(DEVICE_URL))
+    );
+    return;
+  }
+
+  // فایل‌های ثابت: پاسخ فوری از حافظه و به‌روزرسانی در پس‌زمینه
+  if (SHELL.includes(url.pathname)) {
+    event.respondWith(
+      caches.open(CACHE).then((cache) =>
+        cache.match(url.pathname).then((cached) => {
+          const update = fetch(request)
+            .then((response) => {
+              if (response.ok) cache.put(url.pathname, response.clone());
+              return response;
+            })
+            .catch(() => cached);
+          return cached || update;
+        })
+      )
+    );
+  }
+});
@@ -5,7 +5,11 @@ class CustomUser(AbstractUser):
     personnel_code = models.CharField("کد پرسنلی", max_length=20, unique=True)
     national_id    = models.CharField("کد ملی", max_length=10, unique=True)
     face_encoding  = models.BinaryField(null=True, blank=True)
+    face_templates = models.BinaryField(null=True, blank=True)
+    face_model     = models.CharField("نسخه مدل چهره", max_length=64, blank=True, default="")
     face_image = models.ImageField("تصویر چهره", upload_to="faces/", null=True, blank=True)
+    # نسخه خلاصه حضور روزانه؛ با هر تغییر تردد، مرخصی یا شیفت کاربر بالا می‌رود
+    daily_version  = models.PositiveIntegerField(default=0, editable=False)
 
     group = models.ForeignKey(
         "attendance.Group",